@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*
+# Plugin d'action du module docker_daemon_config : la configuration est calculée sur le manageur Ansible
+# et le module n'est exécuté sur la cible que si le fichier de configuration doit être modifié
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.plugins.loader import action_loader
+
+# Chargement des modules necessaires
+import os
+import shlex
+
+# Classe de base commune des plugins d'action du dépôt (action_plugins/gns3vm_controleur.py)
+ActionGns3vm = action_loader.get('gns3vm_controleur', class_only = True)
+
+class ActionModule(ActionGns3vm):
+
+  MODULE = 'docker_daemon_config'
+
+  def run(self, tmp = None, task_vars = None):
+    result = super(ActionModule, self).run(tmp, task_vars)
+    del tmp
+
+    self.chargement('gns3vm_config')
+    docker = self.chargement('gns3vm_docker')
+    parametres = self.lecture_parametres(docker.ARGUMENTS)
+    if parametres is None:
+      return self.execution_module(result, task_vars)
+
+    # Lecture du fichier de configuration
+    fichier = parametres['config-file']
+    commande = 'if [ -e ' + shlex.quote(fichier) + ' ]; then echo 1; cat ' + shlex.quote(fichier) + '; else echo 0; fi'
+    lecture = self._low_level_execute_command(commande, sudoable = True)
+    present, sep, texte_actuel = lecture.get('stdout', '').partition('\n')
+    if lecture.get('rc') != 0 or present not in ('0', '1'):
+      return self.execution_module(result, task_vars)
+
+    result['execution'] = 'controleur'
+    result['changed'] = False
+    if parametres['debug']:
+      result['parametres'] = dict(parametres)
+
+    # Fichier présent sans l'option force : aucun paramètre ne sera enregistré
+    if present == '1' and not (parametres['force'] or parametres['fingerprint']):
+      return result
+    if present == '0':
+      texte_actuel = ''
+
+    # Calcul et validation de la configuration sur le manageur Ansible
+    try:
+      config_actuelle = docker.lecture_json(texte_actuel)
+      config_daemon = docker.maj_config(config_actuelle, parametres)
+    except (docker.ErreurConfig, ValueError):
+      return self.execution_module(result, task_vars)
+    if parametres['debug']:
+      result['config_actuelle'] = config_actuelle
+      result['config_daemon'] = config_daemon
+
+    # Empreintes de la configuration effective calculées sur le manageur Ansible
+    if parametres['fingerprint']:
+      result['empreintes'] = { fichier: docker.empreintes_config(config_actuelle, present == '1') }
+      result['empreintes'][fichier]['conforme'] = config_daemon == config_actuelle
+      return result
+
+    if config_daemon == config_actuelle:
+      return result
+
+    # Un changement d'emplacement avec migration nécessite l'état des répertoires de la cible
+    ancien = config_actuelle.get('data-root', '/var/lib/docker')
+    if parametres['migrate'] and os.path.normpath(ancien) != os.path.normpath(config_daemon['data-root']):
+      return self.execution_module(result, task_vars)
+
+    # Configuration modifiée : aucune écriture en mode de vérification, sinon exécution du module
+    if self.mode_verification():
+      result['changed'] = True
+      if self.mode_difference():
+        result['diff'] = [docker.diff_fichier(fichier, texte_actuel, docker.texte_json(config_daemon))]
+      return result
+    return self.execution_module(result, task_vars)
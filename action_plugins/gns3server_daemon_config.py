@@ -0,0 +1,102 @@
+# -*- coding: UTF-8 -*
+# Plugin d'action du module gns3server_daemon_config : la configuration est calculée sur le manageur Ansible
+# et le module n'est exécuté sur la cible que si le fichier de configuration doit être modifié
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.plugins.loader import action_loader
+
+# Chargement des modules necessaires
+import re
+import shlex
+
+# Séparateur des sorties de la commande de lecture
+SEPARATEUR = '--gns3vm--'
+RE_ADRESSE = re.compile(r'\binet\s+([0-9.]+)/')
+
+# Classe de base commune des plugins d'action du dépôt (action_plugins/gns3vm_controleur.py)
+ActionGns3vm = action_loader.get('gns3vm_controleur', class_only = True)
+
+class ActionModule(ActionGns3vm):
+
+  MODULE = 'gns3server_daemon_config'
+
+  def run(self, tmp = None, task_vars = None):
+    result = super(ActionModule, self).run(tmp, task_vars)
+    del tmp
+
+    self.chargement('gns3vm_config')
+    self.chargement('gns3vm_systeme')
+    gns3server = self.chargement('gns3vm_gns3server')
+    parametres = self.lecture_parametres(gns3server.ARGUMENTS)
+
+    # La sélection automatique d'interface (classement lu dans /sys/class/net), le profil de capacité, les instances multiples
+    # et la vérification du placement des données nécessitent la topologie de la cible : le module est exécuté
+    # Le placement n'est jamais vérifié en mode empreinte
+    if parametres is None or parametres['interface'] == 'auto' or parametres['capacity_profile'] or str(parametres['instances']) != '1' \
+       or (parametres['placement'] != 'ignore' and not parametres['fingerprint']):
+      return self.execution_module(result, task_vars)
+
+    # Lecture de l'adresse de l'interface et du fichier de configuration en une seule commande
+    fichier = parametres['config-file']
+    commande = 'ip -4 -o addr show dev ' + shlex.quote(parametres['interface']) + ' 2>/dev/null; echo ' + SEPARATEUR + \
+               '; if [ -e ' + shlex.quote(fichier) + ' ]; then echo 1; cat ' + shlex.quote(fichier) + '; else echo 0; fi'
+    lecture = self._low_level_execute_command(commande, sudoable = True)
+    sortie = lecture.get('stdout', '')
+    if lecture.get('rc') != 0 or SEPARATEUR not in sortie:
+      return self.execution_module(result, task_vars)
+    adresses, contenu = sortie.split(SEPARATEUR + '\n', 1) if SEPARATEUR + '\n' in sortie else (sortie, '')
+    adresse = RE_ADRESSE.search(adresses)
+    present, sep, texte_actuel = contenu.partition('\n')
+    if adresse is None or present not in ('0', '1'):
+      return self.execution_module(result, task_vars)
+
+    instances = gns3server.calcul_instances(parametres, list())
+    result['instances'] = instances
+    result['execution'] = 'controleur'
+    result['changed'] = False
+    if parametres['debug']:
+      result['parametres'] = dict(parametres)
+      if parametres['password'] is not None:
+        result['parametres']['password'] = gns3server.MASQUE
+
+    # Fichier présent sans l'option force : aucun paramètre ne sera enregistré
+    if present == '1' and not (parametres['force'] or parametres['fingerprint']):
+      return result
+    if present == '0':
+      texte_actuel = ''
+
+    # Calcul de la configuration sur le manageur Ansible
+    try:
+      config_actuelle = gns3server.lecture_ini(texte_actuel)
+    except gns3server.ErreurConfig:
+      return self.execution_module(result, task_vars)
+    parametres['interface'] = None
+    parametres['host'] = adresse.group(1)
+    config_daemon = gns3server.maj_config(config_actuelle, parametres)
+    if parametres['debug']:
+      result['config_actuelle'] = gns3server.masquage_config(config_actuelle)
+      result['config_daemon'] = gns3server.masquage_config(config_daemon)
+
+    # Empreintes de la configuration effective calculées sur le manageur Ansible
+    if parametres['fingerprint']:
+      result['empreintes'] = { fichier: gns3server.empreintes_config(gns3server.ini_normalisee(config_actuelle), present == '1', gns3server.OPTIONS_CIBLE) }
+      result['empreintes'][fichier]['conforme'] = gns3server.ini_normalisee(config_daemon) == gns3server.ini_normalisee(config_actuelle)
+      return result
+
+    if gns3server.ini_normalisee(config_daemon) == gns3server.ini_normalisee(config_actuelle):
+      return result
+
+    # Configuration modifiée : aucune écriture en mode de vérification, sinon exécution du module
+    if self.mode_verification():
+      result['changed'] = True
+      if self.mode_difference():
+        result['diff'] = [gns3server.diff_fichier(fichier, gns3server.masquage_ini(texte_actuel),
+                                                  gns3server.masquage_ini(gns3server.modification_ini(texte_actuel, config_daemon)))]
+      return result
+    return self.execution_module(result, task_vars)
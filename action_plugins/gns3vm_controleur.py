@@ -0,0 +1,93 @@
+# -*- coding: UTF-8 -*
+# Classe de base des plugins d'action du dépôt : chargement des module_utils sur le manageur Ansible,
+# lecture des options selon la définition du module et exécution du module sur la cible
+# Les plugins d'action l'obtiennent par le chargeur de plugins d'Ansible :
+#   ActionGns3vm = action_loader.get('gns3vm_controleur', class_only = True)
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.plugins.action import ActionBase
+from ansible.module_utils.parsing.convert_bool import boolean
+
+# Chargement des modules necessaires
+import os
+import sys
+import importlib.util
+
+# Répertoire module_utils du dépôt
+MODULE_UTILS = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'module_utils')
+
+# Chargement d'un module_utils du dépôt sous son nom d'import Ansible,
+# nécessaire aux imports entre module_utils (ansible.module_utils.gns3vm_config)
+def chargement(nom):
+  complet = 'ansible.module_utils.' + nom
+  if complet not in sys.modules:
+    spec = importlib.util.spec_from_file_location(complet, os.path.join(MODULE_UTILS, nom + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[complet] = module
+    try:
+      spec.loader.exec_module(module)
+    except Exception:
+      del sys.modules[complet]
+      raise
+  return sys.modules[complet]
+
+# Valeurs des options complétées et converties selon la définition des options du module
+# Retourne None si une option est inconnue ou invalide, le module signalera l'erreur
+def lecture_parametres(arguments, definition):
+  if any(option not in definition for option in arguments):
+    return None
+  parametres = dict()
+  for option, spec in definition.items():
+    valeur = arguments.get(option, spec.get('default'))
+    try:
+      if valeur is not None and spec['type'] is bool:
+        valeur = boolean(valeur, strict = True)
+      elif valeur is not None and callable(spec['type']):
+        valeur = spec['type'](valeur)
+    except (TypeError, ValueError):
+      return None
+    if valeur is None and spec.get('required'):
+      return None
+    parametres[option] = valeur
+  return parametres
+
+class ActionModule(ActionBase):
+
+  TRANSFERS_FILES = False
+
+  # Nom du module exécuté sur la cible, défini par chaque plugin d'action
+  MODULE = None
+
+  # Chargement d'un module_utils du dépôt
+  def chargement(self, nom):
+    return chargement(nom)
+
+  # Lecture des options de la tâche selon la définition du module
+  def lecture_parametres(self, definition):
+    return lecture_parametres(self._task.args, definition)
+
+  # Exécution du module sur la cible
+  def execution_module(self, result, task_vars):
+    result.update(self._execute_module(module_name = self.MODULE, module_args = self._task.args, task_vars = task_vars))
+    result['execution'] = 'module'
+    return result
+
+  # Modes de vérification et de différence de la tâche (options check_mode et diff de la tâche comprises)
+  def mode_verification(self):
+    return bool(self._task.check_mode)
+
+  def mode_difference(self):
+    return bool(self._task.diff)
+
+  # La classe de base n'est pas un plugin d'action utilisable dans une tâche
+  def run(self, tmp = None, task_vars = None):
+    result = super(ActionModule, self).run(tmp, task_vars)
+    if self.MODULE is None:
+      result.update(failed = True, msg = "gns3vm_controleur est la classe de base des plugins d'action du dépôt")
+    return result
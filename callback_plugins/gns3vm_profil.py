@@ -0,0 +1,221 @@
+# -*- coding: UTF-8 -*
+# Plugin de rappel de profilage des durées d'exécution par tâche, rôle, hôte et gestionnaire
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+name: gns3vm_profil
+callback_type: aggregate
+requirements:
+  - Activation dans la configuration d'Ansible (C(callbacks_enabled) ou C(callback_whitelist)).
+short_description: Profilage des durées d'exécution du playbook GNS3 VM.
+version_added: "1.0"
+description:
+  - Mesure la durée de chaque tâche et gestionnaire sur chaque hôte et l'agrège par rôle, hôte et tâche.
+  - Ecrit un rapport JSON et un fichier de piles agrégées (format C(collapsed) de FlameGraph) en fin de playbook.
+  - Affiche les tâches, rôles et hôtes les plus longs à la fin du playbook.
+options:
+  repertoire:
+    description:
+      - Répertoire des rapports, relatif au répertoire du playbook s'il n'est pas absolu.
+    type: str
+    default: ".cache/profil"
+    env:
+      - name: GNS3VM_PROFIL_REPERTOIRE
+    ini:
+      - section: callback_gns3vm_profil
+        key: repertoire
+  top:
+    description:
+      - Nombre d'éléments affichés dans chaque classement, 0 pour désactiver l'affichage.
+    type: int
+    default: 15
+    env:
+      - name: GNS3VM_PROFIL_TOP
+    ini:
+      - section: callback_gns3vm_profil
+        key: top
+'''
+
+from ansible.plugins.callback import CallbackBase
+
+# Chargement des modules necessaires
+import os
+import json
+import time
+
+# Nom de la pseudo-pile des tâches hors rôle
+HORS_ROLE = '(playbook)'
+
+class CallbackModule(CallbackBase):
+
+  CALLBACK_VERSION = 2.0
+  CALLBACK_TYPE = 'aggregate'
+  CALLBACK_NAME = 'gns3vm_profil'
+  CALLBACK_NEEDS_ENABLED = True
+
+  def __init__(self):
+    super(CallbackModule, self).__init__()
+    self.debut = time.time()
+    self.repertoire_playbook = os.getcwd()
+    self.nom_playbook = 'playbook'
+    self.play = None
+    self.gestionnaires = set()
+    # Mesures en cours par (hôte, tâche) et mesures terminées
+    self.en_cours = dict()
+    self.mesures = list()
+
+  # Rôles d'une tâche du plus externe au plus interne,
+  # une tâche d'un rôle inclus (include_role) est attribuée au rôle du play qui l'inclut
+  def roles(self, task):
+    roles = list()
+    parent = task
+    while parent is not None:
+      for role in (getattr(parent, '_role', None), getattr(parent, '_parent_role', None)):
+        if role is not None and (not roles or roles[-1] != role.get_name()):
+          roles.append(role.get_name())
+      parent = getattr(parent, '_parent', None)
+    return list(reversed(roles)) or [HORS_ROLE]
+
+  # Description d'une tâche : nom, rôles et type
+  def description(self, task):
+    roles = self.roles(task)
+    return {
+      'play': self.play,
+      'role': roles[0],
+      'roles': roles,
+      'tache': task.get_name().strip(),
+      'gestionnaire': task._uuid in self.gestionnaires
+    }
+
+  # Fin de la mesure d'une tâche sur un hôte
+  def fin(self, result, statut):
+    hote = result._host.get_name()
+    task = result._task
+    debut = self.en_cours.pop((hote, task._uuid), None)
+    if debut is None:
+      return
+    mesure = self.description(task)
+    mesure.update({
+      'hote': hote,
+      'uuid': task._uuid,
+      'statut': statut,
+      'debut': round(debut[0] - self.debut, 3),
+      'duree': round(time.monotonic() - debut[1], 3)
+    })
+    self.mesures.append(mesure)
+
+  def v2_playbook_on_start(self, playbook):
+    self.repertoire_playbook = playbook._basedir
+    self.nom_playbook = os.path.splitext(os.path.basename(playbook._file_name))[0]
+
+  def v2_playbook_on_play_start(self, play):
+    self.play = play.get_name().strip()
+
+  def v2_playbook_on_handler_task_start(self, task):
+    self.gestionnaires.add(task._uuid)
+
+  def v2_runner_on_start(self, host, task):
+    self.en_cours[(host.get_name(), task._uuid)] = (time.time(), time.monotonic())
+
+  def v2_runner_on_ok(self, result):
+    self.fin(result, 'changed' if result._result.get('changed') else 'ok')
+
+  def v2_runner_on_failed(self, result, ignore_errors = False):
+    self.fin(result, 'ignored' if ignore_errors else 'failed')
+
+  def v2_runner_on_skipped(self, result):
+    self.fin(result, 'skipped')
+
+  def v2_runner_on_unreachable(self, result):
+    self.fin(result, 'unreachable')
+
+  # Agrégation des mesures
+  # Par hôte et par rôle, la durée est la somme des durées des tâches de l'hôte.
+  # La durée murale d'une tâche est l'intervalle entre le premier début et la dernière fin sur l'ensemble des hôtes.
+  def agregation(self):
+    taches = dict()
+    roles = dict()
+    hotes = dict()
+    gestionnaires = dict()
+    for mesure in self.mesures:
+      tache = taches.setdefault(mesure['uuid'], {
+        'play': mesure['play'], 'role': mesure['role'], 'tache': mesure['tache'], 'gestionnaire': mesure['gestionnaire'],
+        'debut': mesure['debut'], 'fin': mesure['debut'] + mesure['duree'], 'cumul': 0.0, 'hotes': dict()
+      })
+      tache['debut'] = min(tache['debut'], mesure['debut'])
+      tache['fin'] = max(tache['fin'], mesure['debut'] + mesure['duree'])
+      tache['cumul'] += mesure['duree']
+      tache['hotes'][mesure['hote']] = mesure['duree']
+      role = roles.setdefault(mesure['role'], { 'mur': 0.0, 'cumul': 0.0, 'hotes': dict() })
+      role['cumul'] += mesure['duree']
+      role['hotes'][mesure['hote']] = role['hotes'].get(mesure['hote'], 0.0) + mesure['duree']
+      hote = hotes.setdefault(mesure['hote'], { 'cumul': 0.0, 'roles': dict() })
+      hote['cumul'] += mesure['duree']
+      hote['roles'][mesure['role']] = hote['roles'].get(mesure['role'], 0.0) + mesure['duree']
+      if mesure['gestionnaire']:
+        gestionnaire = gestionnaires.setdefault(mesure['role'] + ' : ' + mesure['tache'], { 'executions': 0, 'cumul': 0.0 })
+        gestionnaire['executions'] += 1
+        gestionnaire['cumul'] += mesure['duree']
+    for tache in taches.values():
+      tache['mur'] = tache['fin'] - tache['debut']
+      roles[tache['role']]['mur'] += tache['mur']
+    arrondi = lambda valeurs: dict((cle, round(valeur, 3) if isinstance(valeur, float) else valeur) for cle, valeur in valeurs.items())
+    return {
+      'taches': [arrondi(tache) for tache in sorted(taches.values(), key = lambda tache: tache['debut'])],
+      'roles': dict((nom, dict(arrondi(role), hotes = arrondi(role['hotes']))) for nom, role in roles.items()),
+      'hotes': dict((nom, dict(arrondi(hote), roles = arrondi(hote['roles']))) for nom, hote in hotes.items()),
+      'gestionnaires': dict((nom, arrondi(gestionnaire)) for nom, gestionnaire in gestionnaires.items())
+    }
+
+  # Piles agrégées au format FlameGraph : hôte;play;rôle[;rôle inclus];tâche durée_en_ms
+  def piles(self):
+    cumul = dict()
+    for mesure in self.mesures:
+      cadres = [mesure['hote'], mesure['play'] or self.nom_playbook] + mesure['roles'] + \
+               [('[gestionnaire] ' if mesure['gestionnaire'] else '') + mesure['tache']]
+      pile = ';'.join(cadre.replace(';', ',') for cadre in cadres)
+      cumul[pile] = cumul.get(pile, 0) + int(mesure['duree'] * 1000)
+    return ''.join(pile + ' ' + str(duree) + '\n' for pile, duree in sorted(cumul.items()) if duree > 0)
+
+  # Affichage d'un classement
+  def classement(self, titre, elements, top):
+    self._display.banner(titre)
+    for nom, duree in sorted(elements, key = lambda element: -element[1])[:top]:
+      self._display.display('%-90s %10.2fs' % (nom[:90], duree))
+
+  def v2_playbook_on_stats(self, stats):
+    duree = time.time() - self.debut
+    rapport = self.agregation()
+    rapport.update({ 'playbook': self.nom_playbook, 'debut': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.debut)), 'duree': round(duree, 3), 'mesures': self.mesures })
+
+    # Ecriture des rapports
+    repertoire = os.path.join(self.repertoire_playbook, os.path.expanduser(self.get_option('repertoire')))
+    base = os.path.join(repertoire, self.nom_playbook + '-' + time.strftime('%Y%m%d-%H%M%S', time.localtime(self.debut)))
+    try:
+      if not os.path.isdir(repertoire):
+        os.makedirs(repertoire, 0o755)
+      with open(base + '.json', 'w') as f:
+        json.dump(rapport, f, indent = 2, ensure_ascii = False)
+      with open(base + '.folded', 'w') as f:
+        f.write(self.piles())
+    except (IOError, OSError) as erreur:
+      self._display.warning("Ecriture du profil d'exécution impossible : " + str(erreur))
+      base = None
+
+    # Affichage des classements
+    top = self.get_option('top')
+    if top > 0:
+      self.classement('PROFIL : TACHES (durée murale)', [(tache['role'] + ' : ' + tache['tache'], tache['mur']) for tache in rapport['taches']], top)
+      self.classement('PROFIL : ROLES (durée murale)', [(nom, role['mur']) for nom, role in rapport['roles'].items()], top)
+      self.classement('PROFIL : HOTES (somme des tâches)', [(nom, hote['cumul']) for nom, hote in rapport['hotes'].items()], top)
+      if rapport['gestionnaires']:
+        self.classement('PROFIL : GESTIONNAIRES (somme des exécutions)', [(nom, gestionnaire['cumul']) for nom, gestionnaire in rapport['gestionnaires'].items()], top)
+    if base is not None:
+      self._display.display('Profil : ' + base + '.json, piles : ' + base + '.folded (durée totale %.2fs)' % duree)
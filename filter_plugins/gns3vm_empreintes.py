@@ -0,0 +1,75 @@
+# -*- coding: UTF-8 -*
+# Filtre de regroupement des cibles par empreinte de configuration (audit de dérive du parc)
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.errors import AnsibleFilterError
+
+# Empreintes d'un résultat de module : résultat direct (gns3server_daemon_config, docker_daemon_config)
+# ou sections du module gns3vm_node_config
+def lecture_empreintes(resultat):
+  if not isinstance(resultat, dict):
+    return dict()
+  empreintes = dict(resultat.get('empreintes') or dict())
+  for section in (resultat.get('sections') or dict()).values():
+    if isinstance(section, dict):
+      empreintes.update(section.get('empreintes') or dict())
+  return empreintes
+
+# Regroupement des cibles par valeur d'empreinte, le groupe le plus nombreux est la référence
+def regroupement(empreintes):
+  groupes = dict()
+  for hote, valeur in empreintes.items():
+    groupes.setdefault(valeur, list()).append(hote)
+  groupes = sorted(({ 'empreinte': valeur, 'hotes': sorted(hotes) } for valeur, hotes in groupes.items()),
+                   key = lambda groupe: (-len(groupe['hotes']), groupe['empreinte'] or ''))
+  return {
+    'groupes': groupes,
+    'reference': groupes[0]['empreinte'] if groupes else None,
+    'ecarts': sorted(hote for groupe in groupes[1:] for hote in groupe['hotes'])
+  }
+
+# Définition du filtre de regroupement
+# resultats : dictionnaire des résultats par cible, ou hostvars avec le nom de la variable enregistrée
+def groupes_empreintes(resultats, variable = None, hotes = None):
+  if hotes is None:
+    hotes = list(resultats.keys())
+  fichiers = dict()
+  for hote in hotes:
+    try:
+      resultat = resultats[hote]
+      if variable is not None:
+        resultat = resultat.get(variable)
+    except (KeyError, AttributeError) as erreur:
+      raise AnsibleFilterError("groupes_empreintes : résultat de " + str(hote) + " illisible : " + str(erreur))
+    for fichier, empreinte in lecture_empreintes(resultat).items():
+      donnees = fichiers.setdefault(fichier, { 'fichier': dict(), 'sections': dict(), 'non_conformes': list() })
+      donnees['fichier'][hote] = empreinte['empreinte']
+      for section, valeur in empreinte.get('sections', dict()).items():
+        donnees['sections'].setdefault(section, dict())[hote] = valeur
+      if not empreinte.get('conforme', True):
+        donnees['non_conformes'].append(hote)
+
+  # Regroupement par fichier puis par section, une section absente d'une cible est un écart
+  rapport = dict()
+  for fichier, donnees in fichiers.items():
+    rapport[fichier] = regroupement(donnees['fichier'])
+    rapport[fichier]['non_conformes'] = sorted(donnees['non_conformes'])
+    rapport[fichier]['sections'] = dict()
+    for section, valeurs in donnees['sections'].items():
+      for hote in donnees['fichier']:
+        valeurs.setdefault(hote, None)
+      rapport[fichier]['sections'][section] = regroupement(valeurs)
+  return rapport
+
+class FilterModule(object):
+
+  def filters(self):
+    return {
+      'groupes_empreintes': groupes_empreintes
+    }
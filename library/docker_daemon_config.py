@@ -26,14 +26,76 @@ options:
 
   dns:
     description:
-      - Liste de serveurs DNS à utiliser séparés par des virgules.
-    type: str
+      - Liste de serveurs DNS à utiliser, liste ou chaîne séparée par des virgules.
+    type: raw
     required: False
 
   dns-search:
     description:
-      - Liste de domaines de recherche DNS à utiliser séparés par des virgules.
+      - Liste de domaines de recherche DNS à utiliser, liste ou chaîne séparée par des virgules.
+    type: raw
+    required: False
+
+  storage-driver:
+    description:
+      - Pilote de stockage des images et des conteneurs.
     type: str
+    choices: [ overlay2, fuse-overlayfs, btrfs, zfs, devicemapper, vfs ]
+    required: False
+
+  storage-opts:
+    description:
+      - Options du pilote de stockage, liste ou chaîne séparée par des virgules.
+    type: raw
+    required: False
+
+  max-concurrent-downloads:
+    description:
+      - Nombre maximum de téléchargements simultanés de couches d'images.
+    type: int
+    required: False
+
+  max-concurrent-uploads:
+    description:
+      - Nombre maximum d'envois simultanés de couches d'images.
+    type: int
+    required: False
+
+  registry-mirrors:
+    description:
+      - Liste d'URL de miroirs de registre, liste ou chaîne séparée par des virgules.
+    type: raw
+    required: False
+
+  live-restore:
+    description:
+      - Conservation des conteneurs en fonctionnement lors du redémarrage du démon docker.
+    type: bool
+    required: False
+
+  log-driver:
+    description:
+      - Pilote de journalisation des conteneurs.
+    type: str
+    required: False
+
+  log-opts:
+    description:
+      - Options du pilote de journalisation, dictionnaire ou chaîne C(cle=valeur) séparée par des virgules.
+    type: dict
+    required: False
+
+  default-ulimits:
+    description:
+      - Limites de ressources par défaut des conteneurs, indexées par nom de limite.
+      - Chaque limite est un entier, une chaîne C(souple:stricte) ou un dictionnaire C(Soft)/C(Hard).
+    type: dict
+    required: False
+
+  default-address-pools:
+    description:
+      - Pools d'adresses des réseaux docker, dictionnaires C(base)/C(size) ou chaînes C(base:size).
+    type: list
     required: False
 
   config-file:
@@ -50,6 +112,34 @@ options:
     default: False
     required: False
 
+  migrate:
+    description:
+      - Migration des données docker lorsque l'emplacement de stockage (C(data-root)) change.
+      - Le démon docker est arrêté, les données sont copiées ou déplacées vers le nouvel emplacement,
+        puis le démon est redémarré et son emplacement de stockage vérifié.
+      - La copie utilise le clonage par référence (reflink), les liens physiques en mode move sur le même
+        système de fichiers, sinon une copie par morceaux qui reprend là où elle s'est arrêtée en cas d'interruption.
+    type: bool
+    default: False
+    required: False
+
+  migrate_mode:
+    description:
+      - (migrate) Copie des données (l'ancien emplacement est conservé) ou déplacement.
+    type: str
+    choices: [ copy, move ]
+    default: copy
+    required: False
+
+  fingerprint:
+    description:
+      - Mode empreinte, le fichier de configuration est lu et n'est jamais modifié.
+      - Retourne l'empreinte SHA-256 de la configuration effective normalisée, globale et par clé de premier niveau,
+        et sa conformité à la configuration demandée, sans retourner les valeurs.
+    type: bool
+    default: False
+    required: False
+
   debug:
     description:
       - Activation du mode debug du module.
@@ -61,7 +151,8 @@ options:
 author:
   - Pascal MIRALLES (@pamioc)
 notes:
-  - Support du mode de vérification C(check_mode).
+  - Support du mode de vérification C(check_mode), la migration est alors uniquement planifiée.
+  - Toutes les valeurs sont validées selon leur type avant l'écriture du fichier de configuration.
 seealso:
 
 '''
@@ -85,9 +176,66 @@ EXAMPLES = r'''
     dns: "8.8.8.8,8.8.8.4"
     dns-search: "domain.local,reseau.lan"
 
+- name: "Configuration des performances : téléchargements parallèles, journaux bornés et conservation des conteneurs"
+  docker_daemon_config:
+    data-root: "/srv/docker"
+    force: true
+    live-restore: true
+    max-concurrent-downloads: 6
+    registry-mirrors: "https://mirror.local:5000"
+    log-driver: json-file
+    log-opts:
+      max-size: "10m"
+      max-file: "3"
+    default-ulimits:
+      nofile: "65536:65536"
+    default-address-pools:
+      - base: "172.80.0.0/16"
+        size: 24
+
+- name: "Déplacement de l'emplacement de stockage avec migration des images et conteneurs existants"
+  docker_daemon_config:
+    data-root: "/srv/docker"
+    force: true
+    migrate: true
+    migrate_mode: move
+
 '''
 
 RETURN = r'''
+migration:
+  description: Le plan puis le résultat de la migration des données docker.
+  returned: option migrate, si l'emplacement de stockage change
+  type: dict
+  sample: {
+    "source": "/var/lib/docker",
+    "destination": "/srv/docker",
+    "mode": "copy",
+    "fichiers": 184230,
+    "octets": 21474836480,
+    "espace_libre": 1920383410176,
+    "meme_systeme_fichiers": false,
+    "reprise": false,
+    "octets_copies": 21474836480,
+    "fichiers_copies": 184230,
+    "methodes": { "copie": 150120, "lien": 34110 },
+    "duree": 96.4,
+    "debit_mbs": 212.4
+  }
+
+empreintes:
+  description: Empreintes de la configuration effective par fichier, sa présence et sa conformité à la configuration demandée.
+  returned: option fingerprint
+  type: dict
+  sample: {
+    "/etc/docker/daemon.json": {
+      "present": true,
+      "empreinte": "136e0dc178e5062aceaf1c43f2327b2c2cf18cfd5e83c931538891b49373002b",
+      "sections": { "data-root": "730d6ecd2c80de139d46c65036b2e88ca5811639d4d523856cf9172ce753333f", "live-restore": "b5bea41b6c623f7c09f1bf24dcae58ebab3c0cdd90ad966bc43a45b44867e12b" },
+      "conforme": true
+    }
+  }
+
 parametres:
   description: Les paramètres transmis au module.
   returned: mode debug
@@ -120,128 +268,25 @@ config_daemon:
 '''
 
 from ansible.module_utils.basic import AnsibleModule
-
-# Chargement des modules necessaires
-import os
-import json
-
-# Définition de la fonction de lecture du fichier actuel
-def lecture_config(fichier):
-  valeurs = dict()
-  with open(fichier, "r") as f:
-    parametres = json.load(f)
-    valeurs.update(parametres)
-  return valeurs
-
-# Définition de la fonction d'enregistrement du fichier de configuration
-def ecriture_config(fichier, parametres):
-  try:
-    with open(fichier, 'w') as f:
-      json.dump(parametres, f, indent = 2)
-    return True
-  except IOError:
-    return False
-
-# Définition de la fonction de mise à jour de la configuration
-def maj_config(config, parametres):
-  import copy
-  # Création de la variable de configuration finale
-  configuration = copy.deepcopy(config)
-  # Si aucune section Server alors la configuration actuelle est vide
-  # donc on crée une configuration par défaut
-  if len(configuration) == 0:
-    configuration = {
-      'data-root': '/var/lib/docker'
-    }
-
-  # Définition du modèle de la configuration globale
-  modele_config = {
-    'str': (
-      'data-root'
-    ),
-    'list': (
-      'dns', 'dns-search'
-    ),
-    'bool': (
-    )
-  }
-
-  # On adapte les paramètres
-  for option in parametres:
-    if parametres[option] == None:
-      continue
-    for type in modele_config:
-      if modele_config[type].count(option) > 0:
-        if type == 'str':
-          configuration[option] = str(parametres[option])
-        elif type == 'list':
-          configuration[option] = parametres[option].split(',')
-        elif type == 'bool':
-          configuration[option] = eval(parametres[option].capitalize())
-
-  return configuration
+from ansible.module_utils.gns3vm_config import ErreurConfig
+from ansible.module_utils.gns3vm_docker import ARGUMENTS, application
 
 # Définition de la fonction d'exécution du module
 def run_module():
-  # Définition des options
-  module_args = {
-    'data-root': { 'type': str, 'required': False },
-    'dns': { 'type': str, 'required': False },
-    'dns-search': { 'type': str, 'required': False },
-    'config-file': { 'type': str, 'default': '/etc/docker/daemon.json', 'required': False },
-    'force': { 'type': bool, 'default': False, 'required': False },
-    'debug': { 'type': bool, 'default': False, 'required': False }
-  }
-
   # Initialisation du dictionnaire de sortie
   result = dict(changed = False)
 
   # Création de l'objet module
   module = AnsibleModule(
-    argument_spec = module_args,
+    argument_spec = ARGUMENTS,
     supports_check_mode = True
   )
 
-  # Ajout des paramètres dans la variable de retour en mode debug
-  if module.params['debug']:
-    result['parametres'] = module.params
-
-  # Sortie si le mode de vérification est activé
-  if module.check_mode:
-    module.exit_json(**result)
-
-  # Initialisation des variables de configuration
-  config_daemon = dict()
-  config_actuelle = dict()
-
-  # Test si le fichier de configuration est présent
-  if os.path.exists(module.params['config-file']):
-    # Si l'option force est activé alors on lit le fichier de configuration
-    if module.params['force']:
-      config_actuelle = lecture_config(module.params['config-file'])
-    # Sinon on sort car aucun paramètre ne sera enregistré
-    else:
-      module.exit_json(**result)
-
-  # Ajout des paramètres dans la variable de retour en mode debug
-  if module.params['debug']:
-    result['config_actuelle'] = config_actuelle
-
-  # Mise à jour des valeurs dans la variable configuration
-  config_daemon = maj_config(config_actuelle, module.params)
-
-  # Ajout des paramètres dans la variable de retour en mode debug
-  if module.params['debug']:
-    result['config_daemon'] = config_daemon
-
-  # Test si la nouvelle configuration est différente
-  if not config_daemon == config_actuelle:
-    # Ecriture du fichier de configuration
-    if not ecriture_config(module.params['config-file'], config_daemon):
-      module.fail_json(msg = "Ecriture du fichier de configuration du service docker impossible", **result)
-    else:
-      # La modification de configuration a été effectuée
-      result['changed'] = True
+  # Application de la configuration
+  try:
+    application(module, module.params, result)
+  except ErreurConfig as erreur:
+    module.fail_json(msg = str(erreur), **result)
 
   # Fin d'exécution normale
   module.exit_json(**result)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*
+# Module d'optimisation des paramètres réseau du noyau d'un hôte GNS3 VM SERVER
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: gns3_host_tuning
+version_added: "1.0"
+short_description: Optimisation des paramètres réseau du noyau pour les laboratoires denses.
+description:
+  - Calcule les paramètres sysctl réseau (tampons des sockets, file de réception, connexions en attente,
+    suivi de connexions et filtrage des ponts) à partir du nombre de noeuds prévus et du débit des interfaces physiques.
+  - Les paramètres sont écrits dans un fichier C(sysctl.d) dédié puis appliqués immédiatement,
+    les valeurs actives avant et après application sont retournées.
+  - Les valeurs calculées ne font qu'augmenter les valeurs actives, une valeur active plus élevée est conservée.
+  - Les modules noyau des paramètres du suivi de connexions et du filtrage des ponts (C(nf_conntrack), C(br_netfilter))
+    sont chargés au démarrage par un fichier C(modules-load.d), avant l'application des fichiers C(sysctl.d).
+options:
+  nodes:
+    description:
+      - Nombre de noeuds prévus sur l'hôte, 0 pour une estimation à partir de la mémoire et de C(node_memory).
+    type: int
+    default: 0
+    required: False
+  node_memory:
+    description:
+      - Mémoire en Mo d'un noeud, utilisée pour l'estimation du nombre de noeuds.
+    type: int
+    default: 512
+    required: False
+  interfaces:
+    description:
+      - Liste d'interfaces séparées par des virgules dont le débit est pris en compte.
+      - Par défaut toutes les interfaces physiques. Un débit inconnu (lien inactif) compte pour 1 Gb/s.
+    type: str
+    required: False
+  bridge_netfilter:
+    description:
+      - Conservation du filtrage iptables du trafic des ponts (C(net.bridge.bridge-nf-call-*)).
+    type: bool
+    default: False
+    required: False
+  overrides:
+    description:
+      - Paramètres sysctl remplaçant ou complétant les valeurs calculées.
+    type: dict
+    required: False
+  config-file:
+    description:
+      - Fichier de configuration persistante dédié, il contient exactement les paramètres calculés.
+    type: str
+    default: "/etc/sysctl.d/91-gns3vm-reseau.conf"
+    required: False
+  modules-file:
+    description:
+      - Fichier C(modules-load.d) dédié des modules noyau chargés au démarrage.
+    type: str
+    default: "/etc/modules-load.d/gns3vm-reseau.conf"
+    required: False
+  apply:
+    description:
+      - Application immédiate des valeurs différentes des valeurs actives, les modules noyau absents sont chargés.
+    type: bool
+    default: True
+    required: False
+author:
+  - Pascal MIRALLES (@pamioc)
+notes:
+  - Support des modes C(check_mode) et C(diff).
+  - Les paramètres des modules noyau non chargés (br_netfilter, nf_conntrack) ne sont pas signalés en mode de vérification.
+seealso:
+  - module: gns3vm_node_config
+
+'''
+
+EXAMPLES = r'''
+- name: "Optimisation réseau pour 200 noeuds"
+  gns3_host_tuning:
+    nodes: 200
+  register: optimisation
+
+- name: "Optimisation réseau selon le débit de l'interface du pont br0"
+  gns3_host_tuning:
+    interfaces: "eno1"
+    overrides:
+      net.core.somaxconn: 8192
+
+'''
+
+RETURN = r'''
+calcul:
+  description: Données utilisées pour le calcul, débit des interfaces en Mb/s (null si inconnu).
+  returned: toujours
+  type: dict
+  sample: { "noeuds": 200, "estimation": false, "interfaces": { "eno1": 10000, "eno2": null }, "vitesse_max": 10000 }
+sysctl:
+  description: Paramètres calculés.
+  returned: toujours
+  type: dict
+  sample: {
+    "net.core.rmem_max": "16777216", "net.core.wmem_max": "16777216",
+    "net.core.rmem_default": "1048576", "net.core.wmem_default": "1048576",
+    "net.core.netdev_max_backlog": "4100", "net.core.somaxconn": "4096",
+    "net.netfilter.nf_conntrack_max": "262144",
+    "net.bridge.bridge-nf-call-iptables": "0", "net.bridge.bridge-nf-call-ip6tables": "0", "net.bridge.bridge-nf-call-arptables": "0"
+  }
+conservees:
+  description: Paramètres dont la valeur active, plus élevée que la valeur calculée, est conservée.
+  returned: toujours
+  type: dict
+  sample: { "net.core.somaxconn": "65535" }
+modules:
+  description: Modules noyau chargés au démarrage.
+  returned: toujours
+  type: list
+  sample: [ "nf_conntrack", "br_netfilter" ]
+valeurs:
+  description: Valeurs actives avant et après application (null si le paramètre est indisponible).
+  returned: option apply
+  type: dict
+  sample: { "net.core.rmem_max": { "avant": "212992", "apres": "16777216" } }
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.gns3vm_config import ErreurConfig
+from ansible.module_utils import gns3vm_noyau
+
+# Chargement des modules necessaires
+import os
+
+# Répertoire des interfaces réseau
+SYSFS_NET = '/sys/class/net'
+
+# Débit retenu en Mb/s pour une interface dont le débit est inconnu
+VITESSE_DEFAUT = 1000
+
+# Latence en secondes retenue pour le produit débit-délai des tampons
+LATENCE = 0.01
+
+# Paramètres des modules noyau chargés à la demande
+FACULTATIFS = (
+  'net.netfilter.nf_conntrack_max',
+  'net.bridge.bridge-nf-call-iptables', 'net.bridge.bridge-nf-call-ip6tables', 'net.bridge.bridge-nf-call-arptables'
+)
+
+# Module noyau de chaque préfixe de paramètre, chargé au démarrage avant systemd-sysctl
+MODULES = (
+  ('net.netfilter.nf_conntrack_', 'nf_conntrack'),
+  ('net.bridge.bridge-nf-', 'br_netfilter')
+)
+
+# Paramètres de filtrage fixés indépendamment des valeurs actives
+FILTRAGE = 'net.bridge.'
+
+# Puissance de 2 supérieure ou égale
+def puissance2(valeur):
+  return 1 << (max(int(valeur), 1) - 1).bit_length()
+
+# Débit en Mb/s des interfaces, toutes les interfaces physiques par défaut
+def vitesses_interfaces(noms):
+  if noms is None:
+    noms = sorted(nom for nom in os.listdir(SYSFS_NET) if os.path.exists(os.path.join(SYSFS_NET, nom, 'device')))
+  vitesses = dict()
+  for nom in noms:
+    try:
+      with open(os.path.join(SYSFS_NET, nom, 'speed'), 'r') as f:
+        vitesse = int(f.read().strip())
+    except (IOError, OSError, ValueError):
+      vitesse = -1
+    vitesses[nom] = vitesse if vitesse > 0 else None
+  return vitesses
+
+# Estimation du nombre de noeuds à partir de la mémoire de l'hôte
+def estimation_noeuds(memoire_noeud):
+  with open('/proc/meminfo', 'r') as f:
+    for ligne in f:
+      if ligne.startswith('MemTotal:'):
+        return max(1, int(ligne.split()[1]) // 1024 // max(memoire_noeud, 1))
+  return 1
+
+# Calcul des paramètres
+# Tampons maximum : produit débit-délai arrondi à la puissance de 2 supérieure, entre 4 et 64 Mo.
+# Tampons par défaut (sockets UDP de ubridge et Qemu qui ne les dimensionnent pas) : 1/16 du maximum, entre 208 Ko et 1 Mo.
+def calcul_sysctl(noeuds, vitesse_max, bridge_netfilter):
+  tampon_max = min(max(puissance2(vitesse_max * 125000 * LATENCE), 4 * 1048576), 64 * 1048576)
+  tampon_defaut = min(max(tampon_max // 16, 212992), 1048576)
+  valeurs = {
+    'net.core.rmem_max': tampon_max,
+    'net.core.wmem_max': tampon_max,
+    'net.core.rmem_default': tampon_defaut,
+    'net.core.wmem_default': tampon_defaut,
+    'net.core.netdev_max_backlog': min(max(1000, vitesse_max // 4 + noeuds * 8), 65536),
+    'net.core.somaxconn': min(max(4096, noeuds * 16), 65535),
+    'net.netfilter.nf_conntrack_max': min(max(262144, noeuds * 256), 2097152)
+  }
+  if not bridge_netfilter:
+    for table in ('iptables', 'ip6tables', 'arptables'):
+      valeurs['net.bridge.bridge-nf-call-' + table] = 0
+  return dict((cle, str(valeur)) for cle, valeur in valeurs.items())
+
+# Définition de la fonction d'exécution du module
+def run_module():
+  # Définition des options
+  module_args = {
+    'nodes': { 'type': int, 'default': 0, 'required': False },
+    'node_memory': { 'type': int, 'default': 512, 'required': False },
+    'interfaces': { 'type': str, 'required': False },
+    'bridge_netfilter': { 'type': bool, 'default': False, 'required': False },
+    'overrides': { 'type': dict, 'required': False },
+    'config-file': { 'type': str, 'default': '/etc/sysctl.d/91-gns3vm-reseau.conf', 'required': False },
+    'modules-file': { 'type': str, 'default': '/etc/modules-load.d/gns3vm-reseau.conf', 'required': False },
+    'apply': { 'type': bool, 'default': True, 'required': False }
+  }
+
+  # Initialisation du dictionnaire de sortie
+  result = dict(changed = False)
+
+  # Création de l'objet module
+  module = AnsibleModule(
+    argument_spec = module_args,
+    supports_check_mode = True
+  )
+  parametres = module.params
+
+  # Nombre de noeuds et débit des interfaces
+  noeuds = parametres['nodes']
+  estimation = noeuds < 1
+  try:
+    if estimation:
+      noeuds = estimation_noeuds(parametres['node_memory'])
+    noms = [nom.strip() for nom in parametres['interfaces'].split(',') if nom.strip()] if parametres['interfaces'] else None
+    vitesses = vitesses_interfaces(noms)
+    for nom in noms or list():
+      if not os.path.exists(os.path.join(SYSFS_NET, nom)):
+        module.warn("Interface " + nom + " introuvable")
+  except (IOError, OSError) as erreur:
+    module.fail_json(msg = "Lecture des caractéristiques de l'hôte impossible : " + str(erreur), **result)
+  vitesse_max = max([vitesse or VITESSE_DEFAUT for vitesse in vitesses.values()] or [VITESSE_DEFAUT])
+  result['calcul'] = { 'noeuds': noeuds, 'estimation': estimation, 'interfaces': vitesses, 'vitesse_max': vitesse_max }
+
+  # Calcul des paramètres, les valeurs imposées sont prioritaires
+  sysctl = calcul_sysctl(noeuds, vitesse_max, parametres['bridge_netfilter'])
+  overrides = dict((str(cle), str(valeur)) for cle, valeur in (parametres['overrides'] or dict()).items())
+  modules = [nom for prefixe, nom in MODULES if any(cle.startswith(prefixe) for cle in list(sysctl) + list(overrides))]
+  result['modules'] = modules
+
+  # Chargement des modules noyau au démarrage et immédiat, avant la lecture des valeurs actives
+  try:
+    gns3vm_noyau.modules_noyau(module, parametres['modules-file'], modules, parametres['apply'], result)
+
+    # Les valeurs actives plus élevées de l'hôte sont conservées, y compris celles d'une exécution précédente
+    result['conservees'] = dict()
+    for cle, valeur in sysctl.items():
+      active = gns3vm_noyau.lecture_valeur_active(cle)
+      if cle.startswith(FILTRAGE) or cle in overrides or active is None or not active.isdigit():
+        continue
+      if int(active) > int(valeur):
+        sysctl[cle] = active
+        result['conservees'][cle] = active
+    sysctl.update(overrides)
+    result['sysctl'] = sysctl
+
+    # Ecriture du fichier dédié et application immédiate
+    gns3vm_noyau.application(module, { 'sysctl': sysctl, 'config-file': parametres['config-file'], 'apply': parametres['apply'], 'debug': False },
+                             result, FACULTATIFS)
+  except ErreurConfig as erreur:
+    module.fail_json(msg = str(erreur), **result)
+  if not parametres['apply']:
+    result.pop('valeurs', None)
+
+  # Fin d'exécution normale
+  module.exit_json(**result)
+
+# Definition de la fonction principale
+def main():
+  run_module()
+
+# Execution du programme
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*
+# Module d'indexation des images de gns3-server et de précalcul des sommes MD5
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: gns3_images_index
+version_added: "1.0"
+short_description: Index des images de gns3-server et précalcul des sommes MD5.
+description:
+  - Parcourt le répertoire des images de gns3-server (C(images_path)) et écrit pour chaque image le fichier
+    C(<image>.md5sum) attendu par gns3-server, qui n'a alors plus à calculer la somme au premier démarrage d'un projet.
+  - Les sommes sont calculées en parallèle par lectures de grands blocs.
+  - Un index persistant associe à chaque image son inode, sa taille et sa date de modification :
+    seules les images nouvelles ou modifiées sont lues à nouveau.
+  - Un fichier C(.md5sum) plus récent que son image est repris sans calcul.
+options:
+  config-file:
+    description:
+      - Fichier de configuration de gns3-server dont l'option C(images_path) de la section C([Server]) est lue.
+    type: str
+    default: "/etc/gns3/gns3_server.conf"
+    required: False
+  path:
+    description:
+      - Répertoire des images, remplace l'option C(images_path) du fichier de configuration.
+    type: str
+    required: False
+  index:
+    description:
+      - Fichier de l'index persistant des images. Une chaîne vide désactive l'index.
+    type: str
+    default: "/var/cache/gns3vm/gns3_images_index.json"
+    required: False
+  workers:
+    description:
+      - Nombre de calculs simultanés, 0 pour le nombre de processeurs de la cible (4 au maximum).
+    type: int
+    default: 0
+    required: False
+  block_size:
+    description:
+      - Taille en Mo des blocs lus.
+    type: int
+    default: 8
+    required: False
+author:
+  - Pascal MIRALLES (@pamioc)
+notes:
+  - Support du mode de vérification C(check_mode), aucune somme n'est alors calculée et aucun fichier n'est écrit.
+  - Les fichiers cachés et les fichiers C(.md5sum) ne sont pas indexés.
+  - Les fichiers C(.md5sum) écrits appartiennent au propriétaire de l'image.
+seealso:
+  - module: gns3server_daemon_config
+
+'''
+
+EXAMPLES = r'''
+- name: "Précalcul des sommes MD5 des images de gns3server"
+  gns3_images_index:
+    config-file: /etc/gns3/gns3_server.conf
+  register: images
+
+- name: "Index d'un répertoire d'images avec 8 calculs simultanés"
+  gns3_images_index:
+    path: /opt/gns3/images
+    workers: 8
+
+'''
+
+RETURN = r'''
+images_path:
+  description: Répertoire des images indexé.
+  returned: toujours
+  type: str
+  sample: "/opt/gns3/images"
+images:
+  description: Manifeste des images, chemin relatif au répertoire des images, type, taille, somme MD5 et origine de la somme.
+  returned: toujours
+  type: list
+  sample: [
+    { "chemin": "QEMU/vEOS-lab-4.25.0F.qcow2", "type": "QEMU", "taille": 2147483648, "md5": "0b1e3c8a0d4f5c1a1c5b2a6e7e9f3d21", "origine": "calcul" },
+    { "chemin": "IOU/i86bi-linux-l3.bin", "type": "IOU", "taille": 152067804, "md5": "5c4e2f1b8b1f2a9d7e3a6c0d4b8e1f72", "origine": "index" }
+  ]
+statistiques:
+  description: Nombre d'images, origine des sommes, volume lu, durée et débit des calculs.
+  returned: toujours
+  type: dict
+  sample: {
+    "images": 2, "index": 1, "sidecar": 0, "calcul": 1, "sidecars_ecrits": 1,
+    "octets_calcules": 2147483648, "workers": 4, "duree": 5.1, "debit_mbs": 401.6
+  }
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.gns3vm_config import ErreurConfig, lecture_fichier, ecriture_fichier, lecture_ini
+
+# Chargement des modules necessaires
+import os
+import re
+import json
+import time
+import hashlib
+import concurrent.futures
+
+# Extension des fichiers de somme MD5 de gns3-server
+EXTENSION_MD5 = '.md5sum'
+
+# Format d'une somme MD5
+RE_MD5 = re.compile(r'^[0-9a-f]{32}$')
+
+# Lecture d'une somme MD5 existante, None si absente ou invalide
+def lecture_md5(fichier):
+  try:
+    with open(fichier, 'r') as f:
+      somme = f.read().strip().lower()
+  except (IOError, OSError, UnicodeDecodeError):
+    return None
+  return somme if RE_MD5.match(somme) else None
+
+# Clé de validité de l'index d'une image
+def cle_fichier(infos):
+  return [infos.st_ino, infos.st_size, infos.st_mtime_ns]
+
+# Somme MD5 d'une image par lectures de grands blocs dans un tampon réutilisé
+# Les pages lues sont libérées du cache du noyau pour ne pas évincer les données utiles
+def somme_md5(fichier, taille_bloc):
+  somme = hashlib.md5()
+  tampon = bytearray(taille_bloc)
+  vue = memoryview(tampon)
+  with open(fichier, 'rb', buffering = 0) as f:
+    if hasattr(os, 'posix_fadvise'):
+      os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    while True:
+      lus = f.readinto(tampon)
+      if not lus:
+        break
+      somme.update(vue[:lus])
+    if hasattr(os, 'posix_fadvise'):
+      os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+  return somme.hexdigest()
+
+# Parcours du répertoire des images, les fichiers cachés et les sommes MD5 sont ignorés
+def liste_images(repertoire):
+  images = list()
+  for dossier, sous_dossiers, fichiers in os.walk(repertoire):
+    sous_dossiers[:] = sorted(nom for nom in sous_dossiers if not nom.startswith('.'))
+    for nom in sorted(fichiers):
+      if nom.startswith('.') or nom.endswith(EXTENSION_MD5):
+        continue
+      chemin = os.path.join(dossier, nom)
+      try:
+        infos = os.stat(chemin)
+      except OSError:
+        continue
+      if os.path.isfile(chemin):
+        images.append((chemin, infos))
+  return images
+
+# Type d'une image d'après son premier répertoire (QEMU, IOU, IOS...)
+def type_image(relatif):
+  return relatif.split(os.sep)[0] if os.sep in relatif else None
+
+def run_module():
+  # Définition des options
+  module_args = {
+    'config-file': { 'type': str, 'default': '/etc/gns3/gns3_server.conf', 'required': False },
+    'path': { 'type': str, 'required': False },
+    'index': { 'type': str, 'default': '/var/cache/gns3vm/gns3_images_index.json', 'required': False },
+    'workers': { 'type': int, 'default': 0, 'required': False },
+    'block_size': { 'type': int, 'default': 8, 'required': False }
+  }
+
+  # Initialisation du dictionnaire de sortie
+  result = dict(changed = False)
+
+  # Création de l'objet module
+  module = AnsibleModule(
+    argument_spec = module_args,
+    supports_check_mode = True
+  )
+  parametres = module.params
+
+  # Répertoire des images
+  repertoire = parametres['path']
+  if repertoire is None:
+    try:
+      repertoire = lecture_ini(lecture_fichier(parametres['config-file'])).get('Server', dict()).get('images_path')
+    except ErreurConfig as erreur:
+      module.fail_json(msg = "Lecture du fichier de configuration " + parametres['config-file'] + " impossible : " + str(erreur), **result)
+    if not repertoire:
+      module.fail_json(msg = "Option images_path absente du fichier de configuration " + parametres['config-file'], **result)
+  repertoire = os.path.expanduser(repertoire.strip())
+  result['images_path'] = repertoire
+  result['images'] = list()
+  statistiques = { 'images': 0, 'index': 0, 'sidecar': 0, 'calcul': 0, 'sidecars_ecrits': 0, 'octets_calcules': 0 }
+  result['statistiques'] = statistiques
+  if not os.path.isdir(repertoire):
+    module.exit_json(**result)
+
+  # Lecture de l'index persistant
+  index = dict()
+  if parametres['index']:
+    try:
+      index = json.loads(lecture_fichier(parametres['index']) or '{}')
+    except ValueError:
+      index = dict()
+    if not isinstance(index, dict) or index.get('images_path') != repertoire:
+      index = dict()
+  entrees = index.get('images', dict())
+  nouvelles = dict()
+
+  # Origine de la somme de chaque image : index, fichier .md5sum plus récent que l'image, ou calcul
+  images = liste_images(repertoire)
+  manifeste = dict()
+  a_calculer = list()
+  for chemin, infos in images:
+    relatif = os.path.relpath(chemin, repertoire)
+    image = { 'chemin': relatif, 'type': type_image(relatif), 'taille': infos.st_size, 'md5': None, 'origine': None }
+    manifeste[chemin] = image
+    sidecar = lecture_md5(chemin + EXTENSION_MD5)
+    entree = entrees.get(relatif)
+    if entree is not None and entree.get('cle') == cle_fichier(infos) and RE_MD5.match(str(entree.get('md5'))):
+      image.update(md5 = entree['md5'], origine = 'index')
+    elif sidecar is not None and os.stat(chemin + EXTENSION_MD5).st_mtime_ns >= infos.st_mtime_ns:
+      image.update(md5 = sidecar, origine = 'sidecar')
+    else:
+      image['origine'] = 'calcul'
+      a_calculer.append((chemin, infos))
+    image['sidecar'] = sidecar
+
+  # Calcul parallèle des sommes, les plus grandes images en premier (aucun calcul en mode de vérification)
+  workers = parametres['workers'] or min(4, os.cpu_count() or 1)
+  statistiques['workers'] = workers
+  debut = time.monotonic()
+  if a_calculer and not module.check_mode:
+    a_calculer.sort(key = lambda element: -element[1].st_size)
+    with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executeur:
+      calculs = dict((executeur.submit(somme_md5, chemin, max(1, parametres['block_size']) * 1024 * 1024), chemin) for chemin, infos in a_calculer)
+      for calcul in concurrent.futures.as_completed(calculs):
+        chemin = calculs[calcul]
+        try:
+          manifeste[chemin]['md5'] = calcul.result()
+        except (IOError, OSError) as erreur:
+          module.warn("Calcul de la somme MD5 de " + chemin + " impossible : " + str(erreur))
+          continue
+        statistiques['octets_calcules'] += manifeste[chemin]['taille']
+  statistiques['duree'] = round(time.monotonic() - debut, 2)
+  if statistiques['duree'] > 0 and statistiques['octets_calcules']:
+    statistiques['debit_mbs'] = round(statistiques['octets_calcules'] / 1048576 / statistiques['duree'], 1)
+
+  # Ecriture des fichiers .md5sum manquants ou différents, au format de gns3-server (somme seule)
+  for chemin, infos in images:
+    image = manifeste[chemin]
+    sidecar = image.pop('sidecar')
+    statistiques['images'] += 1
+    statistiques[image['origine']] += 1
+    if image['origine'] == 'calcul' and module.check_mode:
+      result['changed'] = True
+      continue
+    if image['md5'] is None:
+      continue
+    nouvelles[image['chemin']] = { 'cle': cle_fichier(infos), 'md5': image['md5'] }
+    if sidecar == image['md5']:
+      continue
+    result['changed'] = True
+    statistiques['sidecars_ecrits'] += 1
+    if module.check_mode:
+      continue
+    if not ecriture_fichier(chemin + EXTENSION_MD5, image['md5'], infos.st_mode & 0o644):
+      module.fail_json(msg = "Ecriture du fichier " + chemin + EXTENSION_MD5 + " impossible", **result)
+    try:
+      os.chown(chemin + EXTENSION_MD5, infos.st_uid, infos.st_gid)
+    except OSError:
+      module.warn("Modification du propriétaire de " + chemin + EXTENSION_MD5 + " impossible")
+  result['images'] = [manifeste[chemin] for chemin, infos in images]
+
+  # Enregistrement de l'index, les images supprimées en sont retirées
+  if parametres['index'] and not module.check_mode and nouvelles != entrees:
+    if not os.path.isdir(os.path.dirname(parametres['index'])):
+      os.makedirs(os.path.dirname(parametres['index']), 0o755)
+    if not ecriture_fichier(parametres['index'], json.dumps({ 'images_path': repertoire, 'images': nouvelles })):
+      module.warn("Ecriture de l'index " + parametres['index'] + " impossible")
+
+  # Fin d'exécution normale
+  module.exit_json(**result)
+
+# Définition de fonction principale
+def main():
+  run_module()
+
+# Execution du programme
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*
+# Module de densité mémoire d'un hôte GNS3 VM SERVER (KSM, pages géantes transparentes, pages géantes et zram)
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: gns3_memory_density
+version_added: "1.0"
+short_description: Densité mémoire des hôtes Qemu (KSM, THP, pages géantes, zram).
+description:
+  - Active et règle la déduplication de pages mémoire (KSM) et le mode des pages géantes transparentes (THP).
+  - Réserve des pages géantes réparties entre les noeuds NUMA au prorata de leur mémoire.
+  - Ajoute optionnellement un espace d'échange compressé en mémoire (zram).
+  - Les réglages sont appliqués immédiatement et rendus persistants par un fichier C(tmpfiles.d)
+    et, pour zram, par un service systemd dédié.
+  - Le taux de partage mesuré par KSM est retourné à chaque exécution.
+options:
+  ksm:
+    description:
+      - Activation de KSM.
+    type: bool
+    default: True
+    required: False
+  ksm_pages_to_scan:
+    description:
+      - (ksm) Nombre de pages analysées à chaque passage.
+    type: int
+    default: 1000
+    required: False
+  ksm_sleep_millisecs:
+    description:
+      - (ksm) Pause en millisecondes entre deux passages.
+    type: int
+    default: 20
+    required: False
+  thp:
+    description:
+      - Mode des pages géantes transparentes.
+    type: str
+    choices: [ always, madvise, never ]
+    default: madvise
+    required: False
+  hugepages_memory:
+    description:
+      - Mémoire en Mo réservée en pages géantes (mémoire des machines virtuelles utilisant C(-mem-path)), 0 pour aucune réservation.
+    type: int
+    default: 0
+    required: False
+  hugepage_size:
+    description:
+      - Taille en Ko des pages géantes réservées.
+    type: int
+    default: 2048
+    required: False
+  zram:
+    description:
+      - Ajout d'un espace d'échange compressé en mémoire (C(/dev/zram0)).
+    type: bool
+    default: False
+    required: False
+  zram_size:
+    description:
+      - (zram) Taille de l'espace d'échange en pourcentage de la mémoire.
+    type: int
+    default: 25
+    required: False
+  zram_algorithm:
+    description:
+      - (zram) Algorithme de compression.
+    type: str
+    default: lz4
+    required: False
+  zram_priority:
+    description:
+      - (zram) Priorité de l'espace d'échange.
+    type: int
+    default: 100
+    required: False
+  config-file:
+    description:
+      - Fichier C(tmpfiles.d) de persistance des réglages.
+    type: str
+    default: "/etc/tmpfiles.d/gns3vm-memoire.conf"
+    required: False
+  root:
+    description:
+      - Racine du système, permet de travailler sur une arborescence de test.
+      - Aucune commande n'est exécutée si la racine n'est pas C(/).
+    type: str
+    default: "/"
+    required: False
+author:
+  - Pascal MIRALLES (@pamioc)
+notes:
+  - Support du mode de vérification C(check_mode).
+  - Les pages géantes réservées ne sont pas dédupliquées par KSM.
+seealso:
+  - module: verif_sys
+
+'''
+
+EXAMPLES = r'''
+- name: "Activation de KSM et pages géantes transparentes à la demande"
+  gns3_memory_density:
+    ksm: yes
+    thp: madvise
+
+- name: "Réservation de 64 Go de pages géantes et espace d'échange zram"
+  gns3_memory_density:
+    hugepages_memory: 65536
+    zram: yes
+    zram_size: 20
+  register: memoire
+
+'''
+
+RETURN = r'''
+ksm:
+  description: Réglages et mesures de KSM, taux de partage (pages partagées par page conservée) et mémoire économisée.
+  returned: toujours
+  type: dict
+  sample: {
+    "run": "1", "pages_to_scan": "1000", "sleep_millisecs": "20",
+    "pages_shared": 120000, "pages_sharing": 840000, "pages_unshared": 60000, "full_scans": 14,
+    "taux_partage": 7.0, "economie_mo": 3281
+  }
+thp:
+  description: Mode actif des pages géantes transparentes.
+  returned: toujours
+  type: str
+  sample: "madvise"
+hugepages:
+  description: Pages géantes par noeud NUMA, demandées, allouées et libres.
+  returned: toujours
+  type: dict
+  sample: {
+    "taille_ko": 2048,
+    "noeuds": { "0": { "demandees": 16384, "allouees": 16384, "libres": 16384 }, "1": { "demandees": 16384, "allouees": 16384, "libres": 16384 } },
+    "total_mo": 65536
+  }
+zram:
+  description: Etat de l'espace d'échange zram.
+  returned: toujours
+  type: dict
+  sample: { "actif": true, "taille_mo": 16064, "algorithme": "lz4", "priorite": 100 }
+valeurs:
+  description: Valeurs des réglages avant et après application.
+  returned: toujours
+  type: dict
+  sample: { "/sys/kernel/mm/ksm/run": { "avant": "0", "apres": "1" } }
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.gns3vm_config import lecture_fichier, ecriture_fichier, diff_fichier
+
+# Chargement des modules necessaires
+import os
+import re
+
+# Réglages du noyau
+KSM = '/sys/kernel/mm/ksm'
+THP = '/sys/kernel/mm/transparent_hugepage/enabled'
+NOEUDS = '/sys/devices/system/node'
+HUGEPAGES = '/sys/kernel/mm/hugepages'
+
+# Service systemd de l'espace d'échange zram
+SERVICE_ZRAM = 'gns3vm-zram'
+UNITE_ZRAM = '''# Fichier géré par Ansible (gns3vm)
+[Unit]
+Description=Espace d'échange compressé en mémoire (zram)
+DefaultDependencies=no
+Before=swap.target
+
+[Service]
+Type=oneshot
+RemainAfterExit=yes
+ExecStartPre=/sbin/modprobe zram num_devices=1
+ExecStart=/bin/sh -c 'echo {algorithme} > /sys/block/zram0/comp_algorithm && echo {taille}M > /sys/block/zram0/disksize && /sbin/mkswap /dev/zram0 && /sbin/swapon -p {priorite} /dev/zram0'
+ExecStop=/bin/sh -c '/sbin/swapoff /dev/zram0 && echo 1 > /sys/block/zram0/reset'
+
+[Install]
+WantedBy=swap.target
+'''
+
+# Expression de lecture d'un choix actif (toujours [madvise] never)
+RE_CHOIX = re.compile(r'\[([^\]]+)\]')
+
+# Construction d'un chemin relatif à la racine du système
+def chemin(racine, fichier):
+  return os.path.join(racine, fichier.lstrip('/'))
+
+# Lecture d'un réglage, le choix actif pour les réglages à choix multiples
+def lecture_reglage(fichier):
+  try:
+    with open(fichier, 'r') as f:
+      valeur = f.read().strip()
+  except (IOError, OSError):
+    return None
+  choix = RE_CHOIX.search(valeur)
+  return choix.group(1) if choix else valeur
+
+# Ecriture d'un réglage
+def ecriture_reglage(fichier, valeur):
+  try:
+    with open(fichier, 'w') as f:
+      f.write(str(valeur))
+    return True
+  except (IOError, OSError):
+    return False
+
+# Mémoire en Ko de chaque noeud NUMA, un seul noeud sans topologie NUMA
+def memoire_noeuds(racine):
+  noeuds = dict()
+  repertoire = chemin(racine, NOEUDS)
+  if os.path.isdir(repertoire):
+    for nom in sorted(os.listdir(repertoire)):
+      if re.match(r'^node[0-9]+$', nom):
+        texte = lecture_fichier(os.path.join(repertoire, nom, 'meminfo'))
+        memoire = re.search(r'MemTotal:\s+([0-9]+)', texte)
+        if memoire:
+          noeuds[nom[4:]] = int(memoire.group(1))
+  if not noeuds:
+    memoire = re.search(r'MemTotal:\s+([0-9]+)', lecture_fichier(chemin(racine, '/proc/meminfo')))
+    noeuds[None] = int(memoire.group(1)) if memoire else 0
+  return noeuds
+
+# Fichier de réglage des pages géantes d'un noeud (None : réglage global)
+def fichier_hugepages(noeud, taille, nom):
+  if noeud is None:
+    return HUGEPAGES + '/hugepages-' + str(taille) + 'kB/' + nom
+  return NOEUDS + '/node' + noeud + '/hugepages/hugepages-' + str(taille) + 'kB/' + nom
+
+# Répartition des pages géantes entre les noeuds au prorata de leur mémoire
+def repartition_hugepages(noeuds, memoire_mo, taille):
+  total = memoire_mo * 1024 // taille
+  memoire_totale = sum(noeuds.values()) or 1
+  repartition = dict()
+  reste = total
+  for i, (noeud, memoire) in enumerate(sorted(noeuds.items(), key = lambda element: str(element[0]))):
+    pages = reste if i == len(noeuds) - 1 else total * memoire // memoire_totale
+    repartition[noeud] = pages
+    reste -= pages
+  return repartition
+
+# Mesures de KSM et taux de partage
+def mesures_ksm(racine):
+  ksm = dict()
+  for nom in ('run', 'pages_to_scan', 'sleep_millisecs'):
+    ksm[nom] = lecture_reglage(chemin(racine, KSM + '/' + nom))
+  for nom in ('pages_shared', 'pages_sharing', 'pages_unshared', 'full_scans'):
+    valeur = lecture_reglage(chemin(racine, KSM + '/' + nom))
+    ksm[nom] = int(valeur) if valeur is not None and valeur.isdigit() else None
+  if ksm['pages_shared']:
+    ksm['taux_partage'] = round(ksm['pages_sharing'] / ksm['pages_shared'], 2)
+  else:
+    ksm['taux_partage'] = None
+  ksm['economie_mo'] = (ksm['pages_sharing'] or 0) * os.sysconf('SC_PAGE_SIZE') // 1048576
+  return ksm
+
+# Etat de l'espace d'échange zram
+def etat_zram(racine):
+  actif = any(ligne.split()[0] == '/dev/zram0' for ligne in lecture_fichier(chemin(racine, '/proc/swaps')).splitlines()[1:] if ligne.strip())
+  taille = lecture_reglage(chemin(racine, '/sys/block/zram0/disksize'))
+  return {
+    'actif': actif,
+    'taille_mo': int(taille) // 1048576 if taille and taille.isdigit() else 0,
+    'algorithme': lecture_reglage(chemin(racine, '/sys/block/zram0/comp_algorithm'))
+  }
+
+def run_module():
+  # Définition des options
+  module_args = {
+    'ksm': { 'type': bool, 'default': True, 'required': False },
+    'ksm_pages_to_scan': { 'type': int, 'default': 1000, 'required': False },
+    'ksm_sleep_millisecs': { 'type': int, 'default': 20, 'required': False },
+    'thp': { 'type': str, 'default': 'madvise', 'choices': ['always', 'madvise', 'never'], 'required': False },
+    'hugepages_memory': { 'type': int, 'default': 0, 'required': False },
+    'hugepage_size': { 'type': int, 'default': 2048, 'required': False },
+    'zram': { 'type': bool, 'default': False, 'required': False },
+    'zram_size': { 'type': int, 'default': 25, 'required': False },
+    'zram_algorithm': { 'type': str, 'default': 'lz4', 'required': False },
+    'zram_priority': { 'type': int, 'default': 100, 'required': False },
+    'config-file': { 'type': str, 'default': '/etc/tmpfiles.d/gns3vm-memoire.conf', 'required': False },
+    'root': { 'type': str, 'default': '/', 'required': False }
+  }
+
+  # Initialisation du dictionnaire de sortie
+  result = dict(changed = False, valeurs = dict())
+
+  # Création de l'objet module
+  module = AnsibleModule(
+    argument_spec = module_args,
+    supports_check_mode = True
+  )
+  parametres = module.params
+  racine = parametres['root']
+
+  # Réglages demandés, dans l'ordre d'application
+  reglages = list()
+  if parametres['ksm']:
+    reglages.append((KSM + '/pages_to_scan', str(parametres['ksm_pages_to_scan'])))
+    reglages.append((KSM + '/sleep_millisecs', str(parametres['ksm_sleep_millisecs'])))
+  reglages.append((KSM + '/run', '1' if parametres['ksm'] else '0'))
+  reglages.append((THP, parametres['thp']))
+
+  # Pages géantes réparties par noeud NUMA, au plus 90 % de la mémoire de chaque noeud
+  # Aucune réservation n'est modifiée sans mémoire demandée
+  taille = parametres['hugepage_size']
+  noeuds = memoire_noeuds(racine)
+  repartition = repartition_hugepages(noeuds, parametres['hugepages_memory'], taille) if parametres['hugepages_memory'] > 0 else dict()
+  for noeud, pages in sorted(repartition.items(), key = lambda element: str(element[0])):
+    if pages * taille > noeuds[noeud] * 0.9:
+      module.fail_json(msg = "Réservation de pages géantes supérieure à 90 % de la mémoire du noeud " + str(noeud), **result)
+    if not os.path.exists(chemin(racine, fichier_hugepages(noeud, taille, 'nr_hugepages'))):
+      module.fail_json(msg = "Pages géantes de " + str(taille) + " Ko non supportées par la cible", **result)
+    reglages.append((fichier_hugepages(noeud, taille, 'nr_hugepages'), str(pages)))
+
+  # Application immédiate des réglages différents des valeurs actives
+  for fichier, valeur in reglages:
+    avant = lecture_reglage(chemin(racine, fichier))
+    result['valeurs'][fichier] = { 'avant': avant, 'apres': avant }
+    if avant is None:
+      if fichier.startswith(KSM) and not parametres['ksm']:
+        continue
+      module.warn("Réglage " + fichier + " indisponible sur la cible")
+      continue
+    if avant == valeur:
+      continue
+    result['changed'] = True
+    if module.check_mode:
+      result['valeurs'][fichier]['apres'] = valeur
+    elif ecriture_reglage(chemin(racine, fichier), valeur):
+      result['valeurs'][fichier]['apres'] = lecture_reglage(chemin(racine, fichier))
+    else:
+      module.warn("Modification du réglage " + fichier + " impossible (conteneur ou espace de noms)")
+
+  # Persistance des réglages par systemd-tmpfiles au démarrage
+  fichier = chemin(racine, parametres['config-file'])
+  texte_actuel = lecture_fichier(fichier)
+  texte = '# Fichier géré par Ansible (gns3vm)\n' + ''.join('w ' + reglage + ' - - - - ' + valeur + '\n' for reglage, valeur in reglages)
+  if texte != texte_actuel:
+    result['changed'] = True
+    if module._diff:
+      result['diff'] = [diff_fichier(parametres['config-file'], texte_actuel, texte)]
+    if not module.check_mode:
+      if not os.path.isdir(os.path.dirname(fichier)):
+        os.makedirs(os.path.dirname(fichier), 0o755)
+      if not ecriture_fichier(fichier, texte):
+        module.fail_json(msg = "Ecriture du fichier " + parametres['config-file'] + " impossible", **result)
+
+  # Espace d'échange zram par un service systemd dédié
+  unite = chemin(racine, '/etc/systemd/system/' + SERVICE_ZRAM + '.service')
+  zram = etat_zram(racine)
+  if parametres['zram']:
+    memoire_mo = sum(noeuds.values()) // 1024
+    texte = UNITE_ZRAM.format(algorithme = parametres['zram_algorithm'], taille = memoire_mo * parametres['zram_size'] // 100, priorite = parametres['zram_priority'])
+    modifiee = texte != lecture_fichier(unite)
+    if modifiee or not zram['actif']:
+      result['changed'] = True
+      if not module.check_mode:
+        if not os.path.isdir(os.path.dirname(unite)):
+          os.makedirs(os.path.dirname(unite), 0o755)
+        if modifiee and not ecriture_fichier(unite, texte):
+          module.fail_json(msg = "Ecriture du service " + SERVICE_ZRAM + " impossible", **result)
+        if racine == '/':
+          systemctl = module.get_bin_path('systemctl', required = True)
+          commandes = [[systemctl, 'daemon-reload'], [systemctl, 'enable', SERVICE_ZRAM]]
+          commandes.append([systemctl, 'restart' if modifiee and zram['actif'] else 'start', SERVICE_ZRAM])
+          for commande in commandes:
+            rc, out, err = module.run_command(commande)
+            if rc != 0:
+              module.fail_json(msg = "Activation de l'espace d'échange zram impossible : " + err.strip(), **result)
+          zram = etat_zram(racine)
+  elif os.path.exists(unite):
+    result['changed'] = True
+    if not module.check_mode:
+      if racine == '/':
+        systemctl = module.get_bin_path('systemctl', required = True)
+        module.run_command([systemctl, 'disable', '--now', SERVICE_ZRAM])
+      os.unlink(unite)
+      zram = etat_zram(racine)
+  zram['priorite'] = parametres['zram_priority'] if parametres['zram'] else None
+  result['zram'] = zram
+
+  # Mesures
+  result['ksm'] = mesures_ksm(racine)
+  result['thp'] = lecture_reglage(chemin(racine, THP))
+  hugepages = { 'taille_ko': taille, 'noeuds': dict(), 'total_mo': 0 }
+  for noeud, pages in repartition.items():
+    allouees = lecture_reglage(chemin(racine, fichier_hugepages(noeud, taille, 'nr_hugepages')))
+    libres = lecture_reglage(chemin(racine, fichier_hugepages(noeud, taille, 'free_hugepages')))
+    allouees = int(allouees) if allouees and allouees.isdigit() else 0
+    hugepages['noeuds'][str(noeud if noeud is not None else 0)] = { 'demandees': pages, 'allouees': allouees, 'libres': int(libres) if libres and libres.isdigit() else None }
+    hugepages['total_mo'] += allouees * taille // 1024
+    if allouees < pages and not module.check_mode:
+      module.warn("Seules " + str(allouees) + " pages géantes sur " + str(pages) + " ont pu être réservées sur le noeud " + str(noeud if noeud is not None else 0) + " (mémoire fragmentée), un redémarrage permet la réservation complète")
+  result['hugepages'] = hugepages
+
+  # Fin d'exécution normale
+  module.exit_json(**result)
+
+# Définition de fonction principale
+def main():
+  run_module()
+
+# Execution du programme
+if __name__ == '__main__':
+  main()
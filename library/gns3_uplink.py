@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*
+# Module de configuration du lien de sortie des laboratoires GNS3 (pont ou macvtap sur une interface physique)
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: gns3_uplink
+version_added: "1.0"
+short_description: Lien de sortie des laboratoires GNS3 par un pont ou une interface macvtap.
+description:
+  - Crée et rend persistant un pont Linux ou une interface macvtap sur une interface physique dédiée,
+    alternative au réseau NAT de libvirt (C(virbr0)) dont le débit est limité par la traduction d'adresses et iptables.
+  - La configuration est écrite dans un fragment ifupdown (C(/etc/network/interfaces.d)) : MTU, nombre de files
+    de l'interface physique (multiqueue) et fonctions de délestage (offloads).
+  - Les interfaces absentes sont activées par C(ifup), le MTU, les files et les délestages des interfaces existantes
+    sont appliqués immédiatement sans interrompre le lien.
+  - Le lien est ajouté aux interfaces autorisées (C(allowed_interfaces)) des fichiers de configuration de gns3-server
+    qui définissent cette option, sans elle toutes les interfaces sont autorisées et le fichier n'est pas modifié.
+  - Avec C(root), la configuration est calculée à partir d'une arborescence de test (C(sys/class/net), C(etc/network))
+    et aucune commande n'est exécutée.
+options:
+  interface:
+    description:
+      - Interface physique portant le lien, elle ne doit pas être déclarée dans une autre configuration ifupdown.
+    type: str
+    required: True
+  mode:
+    description:
+      - Type de lien, C(bridge) (pont Linux) ou C(macvtap) (mode bridge, sans pont ni passage par la pile IP de l'hôte).
+    type: str
+    choices: [ bridge, macvtap ]
+    default: bridge
+    required: False
+  name:
+    description:
+      - Nom de l'interface du lien, C(br0) en mode C(bridge) et C(macvtap0) en mode C(macvtap) par défaut.
+    type: str
+    required: False
+  mtu:
+    description:
+      - MTU de l'interface physique et du lien, 0 pour conserver le MTU actuel de l'interface physique.
+    type: int
+    default: 0
+    required: False
+  queues:
+    description:
+      - Nombre de files combinées de l'interface physique (C(ethtool -L)) et de files de l'interface macvtap, 0 pour ne pas les modifier.
+    type: int
+    default: 0
+    required: False
+  offloads:
+    description:
+      - Fonctions de délestage de l'interface physique (C(ethtool -K)), par nom court (C(gro), C(gso), C(tso), C(lro), C(rx), C(tx), C(sg)).
+      - Le délestage C(lro) doit rester désactivé sur une interface membre d'un pont.
+    type: dict
+    default: { gro: on, gso: on, tso: on, lro: off }
+    required: False
+  address:
+    description:
+      - Adressage du lien en mode C(bridge) : C(manual) (sans adresse), C(dhcp) ou une adresse statique C(adresse/préfixe).
+    type: str
+    default: manual
+    required: False
+  gateway:
+    description:
+      - Passerelle de l'adresse statique.
+    type: str
+    required: False
+  gns3_config:
+    description:
+      - Fichiers de configuration de gns3-server dont les interfaces autorisées (C(allowed_interfaces)) sont complétées par le lien.
+      - Un fichier absent, ou sans option C(allowed_interfaces) (toutes les interfaces autorisées), n'est pas modifié.
+    type: list
+    default: []
+    required: False
+  config-file:
+    description:
+      - Fragment ifupdown dédié au lien.
+    type: str
+    default: "/etc/network/interfaces.d/gns3vm-uplink"
+    required: False
+  root:
+    description:
+      - Racine du système (arborescence de test), aucune commande n'est exécutée si elle n'est pas C(/).
+    type: str
+    default: "/"
+    required: False
+author:
+  - Pascal MIRALLES (@pamioc)
+notes:
+  - Support des modes C(check_mode) et C(diff).
+  - Requiert les paquets C(bridge-utils) (mode C(bridge)) et C(ethtool) sur la cible.
+  - En mode C(macvtap), l'hôte ne peut pas communiquer avec les noeuds par le lien (pas de retour vers l'interface parente).
+seealso:
+  - module: gns3server_daemon_config
+  - module: gns3_host_tuning
+
+'''
+
+EXAMPLES = r'''
+- name: "Pont br0 sur l'interface eno2 avec trames géantes"
+  gns3_uplink:
+    interface: eno2
+    mtu: 9000
+    queues: 8
+    gns3_config:
+      - /etc/gns3/gns3_server.conf
+
+- name: "Interface macvtap sur l'interface ens1f1"
+  gns3_uplink:
+    interface: ens1f1
+    mode: macvtap
+    queues: 4
+
+- name: "Rendu de la configuration sur une arborescence de test"
+  gns3_uplink:
+    interface: eno2
+    mtu: 9000
+    root: "/tmp/fixture"
+
+'''
+
+RETURN = r'''
+lien:
+  description: Paramètres de l'interface physique et du lien, délestages lus par C(ethtool) (null sans C(ethtool) ou avec C(root)).
+  returned: toujours
+  type: dict
+  sample: {
+    "mode": "bridge",
+    "nom": "br0",
+    "interface": {
+      "nom": "eno2", "pilote": "ixgbe", "adresse_mac": "3c:ec:ef:10:20:31", "etat": "up",
+      "vitesse": 10000, "duplex": "full", "mtu": 9000, "files_rx": 8, "files_tx": 8,
+      "offloads": { "gro": "on", "gso": "on", "tso": "on", "lro": "off" }
+    },
+    "uplink": { "present": true, "etat": "up", "mtu": 9000, "files_rx": 1, "files_tx": 1, "membres": [ "eno2" ] }
+  }
+modifications:
+  description: Modifications appliquées (ou prévues en mode de vérification).
+  returned: toujours
+  type: list
+  sample: [ "fragment /etc/network/interfaces.d/gns3vm-uplink", "ifup br0", "eno2 : mtu 1500 -> 9000" ]
+allowed_interfaces:
+  description: Interfaces autorisées de chaque fichier de configuration de gns3-server, null si toutes les interfaces sont autorisées.
+  returned: option gns3_config
+  type: dict
+  sample: { "/etc/gns3/gns3_server.conf": "virbr0,br0" }
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.gns3vm_config import ErreurConfig, lecture_fichier, ecriture_fichier, diff_fichier, lecture_ini, modification_ini, masquage_ini
+
+# Chargement des modules necessaires
+import os
+import re
+
+# Répertoire des interfaces réseau
+SYSFS_NET = '/sys/class/net'
+
+# Noms des fonctions de délestage dans la sortie de ethtool -k
+OFFLOADS = {
+  'gro': 'generic-receive-offload',
+  'gso': 'generic-segmentation-offload',
+  'tso': 'tcp-segmentation-offload',
+  'lro': 'large-receive-offload',
+  'rx': 'rx-checksumming',
+  'tx': 'tx-checksumming',
+  'sg': 'scatter-gather'
+}
+
+# Expression de reconnaissance d'une déclaration d'interface ifupdown
+RE_IFACE = re.compile(r'^\s*iface\s+(\S+)\s+inet6?\s+(\S+)', re.MULTILINE)
+
+# Construction d'un chemin relatif à la racine du système
+def chemin(racine, fichier):
+  return os.path.join(racine, fichier.lstrip('/'))
+
+# Lecture d'un attribut d'interface, None si indisponible
+def attribut(racine, interface, nom):
+  try:
+    with open(chemin(racine, SYSFS_NET + '/' + interface + '/' + nom), 'r') as f:
+      return f.read().strip()
+  except (IOError, OSError):
+    return None
+
+# Valeur entière d'un attribut d'interface, None si indisponible ou négative (lien inactif)
+def attribut_entier(racine, interface, nom):
+  valeur = attribut(racine, interface, nom)
+  try:
+    return int(valeur) if int(valeur) >= 0 else None
+  except (TypeError, ValueError):
+    return None
+
+# Nombre de files de réception et d'émission d'une interface
+def files(racine, interface):
+  repertoire = chemin(racine, SYSFS_NET + '/' + interface + '/queues')
+  noms = os.listdir(repertoire) if os.path.isdir(repertoire) else list()
+  return len([nom for nom in noms if nom.startswith('rx-')]), len([nom for nom in noms if nom.startswith('tx-')])
+
+# Lecture des délestages actifs (ethtool -k) par nom court, None pour une fonction inconnue
+def lecture_offloads(module, ethtool, interface):
+  rc, out, err = module.run_command([ethtool, '-k', interface])
+  if rc != 0:
+    return None
+  etats = dict()
+  for ligne in out.splitlines():
+    nom, sep, valeur = ligne.strip().partition(':')
+    if sep and valeur.split():
+      etats[nom] = valeur.split()[0]
+  return dict((court, etats.get(long)) for court, long in OFFLOADS.items())
+
+# Lecture du nombre de files combinées actuel (ethtool -l), None si non supporté
+def lecture_files_combinees(module, ethtool, interface):
+  rc, out, err = module.run_command([ethtool, '-l', interface])
+  if rc != 0 or 'Current hardware settings:' not in out:
+    return None
+  actuelles = re.search(r'Combined:\s+([0-9]+)', out.split('Current hardware settings:', 1)[1])
+  return int(actuelles.group(1)) if actuelles else None
+
+# Déclarations ifupdown de l'interface en dehors du fragment du module
+def declarations_existantes(racine, interface, fragment):
+  fichiers = [chemin(racine, '/etc/network/interfaces')]
+  repertoire = chemin(racine, '/etc/network/interfaces.d')
+  if os.path.isdir(repertoire):
+    fichiers += [os.path.join(repertoire, nom) for nom in sorted(os.listdir(repertoire))]
+  declarations = list()
+  for fichier in fichiers:
+    if os.path.abspath(fichier) == os.path.abspath(chemin(racine, fragment)) or not os.path.isfile(fichier):
+      continue
+    for nom, methode in RE_IFACE.findall(lecture_fichier(fichier)):
+      if nom == interface:
+        declarations.append(fichier[len(racine.rstrip('/')):] + ' (' + methode + ')')
+  return declarations
+
+# Génération du fragment ifupdown
+def fragment(parametres, nom, mtu):
+  interface = parametres['interface']
+  lignes = ['# Fichier géré par Ansible (gns3vm) : lien de sortie des laboratoires GNS3', '', 'auto ' + interface, 'iface ' + interface + ' inet manual']
+  if mtu:
+    lignes.append('    mtu ' + str(mtu))
+  if parametres['queues'] > 0:
+    lignes.append('    post-up ethtool -L ' + interface + ' combined ' + str(parametres['queues']) + ' || true')
+  if parametres['offloads']:
+    lignes.append('    post-up ethtool -K ' + interface + ''.join(' ' + cle + ' ' + valeur for cle, valeur in sorted(parametres['offloads'].items())) + ' || true')
+  lignes += ['', 'auto ' + nom]
+  if parametres['mode'] == 'bridge':
+    adresse = parametres['address']
+    lignes.append('iface ' + nom + ' inet ' + ('manual' if adresse == 'manual' else 'dhcp' if adresse == 'dhcp' else 'static'))
+    if adresse not in ('manual', 'dhcp'):
+      lignes.append('    address ' + adresse)
+      if parametres['gateway']:
+        lignes.append('    gateway ' + parametres['gateway'])
+    lignes += ['    bridge_ports ' + interface, '    bridge_stp off', '    bridge_fd 0', '    bridge_waitport 0']
+    if mtu:
+      lignes.append('    mtu ' + str(mtu))
+  else:
+    files_macvtap = ' numtxqueues ' + str(parametres['queues']) + ' numrxqueues ' + str(parametres['queues']) if parametres['queues'] > 0 else ''
+    lignes += [
+      'iface ' + nom + ' inet manual',
+      '    pre-up ip link add link ' + interface + ' name ' + nom + files_macvtap + ' type macvtap mode bridge',
+      '    up ip link set dev ' + nom + (' mtu ' + str(mtu) if mtu else '') + ' up',
+      '    post-down ip link del dev ' + nom
+    ]
+  return '\n'.join(lignes) + '\n'
+
+# Paramètres de l'interface physique et du lien
+def rapport_lien(module, racine, parametres, nom, ethtool):
+  interface = parametres['interface']
+  pilote = os.path.realpath(chemin(racine, SYSFS_NET + '/' + interface + '/device/driver'))
+  files_rx, files_tx = files(racine, interface)
+  lien = {
+    'mode': parametres['mode'],
+    'nom': nom,
+    'interface': {
+      'nom': interface,
+      'pilote': os.path.basename(pilote) if os.path.exists(pilote) else None,
+      'adresse_mac': attribut(racine, interface, 'address'),
+      'etat': attribut(racine, interface, 'operstate'),
+      'vitesse': attribut_entier(racine, interface, 'speed'),
+      'duplex': attribut(racine, interface, 'duplex'),
+      'mtu': attribut_entier(racine, interface, 'mtu'),
+      'files_rx': files_rx,
+      'files_tx': files_tx,
+      'offloads': lecture_offloads(module, ethtool, interface) if ethtool else None
+    }
+  }
+  present = os.path.exists(chemin(racine, SYSFS_NET + '/' + nom))
+  files_rx, files_tx = files(racine, nom)
+  membres = chemin(racine, SYSFS_NET + '/' + nom + '/brif')
+  lien['uplink'] = {
+    'present': present,
+    'etat': attribut(racine, nom, 'operstate'),
+    'mtu': attribut_entier(racine, nom, 'mtu'),
+    'files_rx': files_rx,
+    'files_tx': files_tx,
+    'membres': sorted(os.listdir(membres)) if os.path.isdir(membres) else list()
+  }
+  return lien
+
+# Ajout du lien aux interfaces autorisées d'un fichier de configuration de gns3-server
+# Sans option allowed_interfaces, gns3-server autorise toutes les interfaces : le fichier n'est pas modifié
+def maj_allowed_interfaces(module, racine, fichier, nom, result):
+  texte = lecture_fichier(chemin(racine, fichier))
+  config = lecture_ini(texte)
+  if 'allowed_interfaces' not in config.get('Server', dict()):
+    result['allowed_interfaces'][fichier] = None
+    return
+  autorisees = [autorisee.strip() for autorisee in config['Server']['allowed_interfaces'].split(',') if autorisee.strip()]
+  if nom not in autorisees:
+    autorisees.append(nom)
+  valeur = ','.join(autorisees)
+  result['allowed_interfaces'][fichier] = valeur
+  if config.get('Server', dict()).get('allowed_interfaces') == valeur:
+    return
+  texte_modifie = modification_ini(texte, { 'Server': { 'allowed_interfaces': valeur } })
+  result['changed'] = True
+  result['modifications'].append('allowed_interfaces ' + fichier)
+  if module._diff:
+    result['diff'].append(diff_fichier(fichier, masquage_ini(texte), masquage_ini(texte_modifie)))
+  if not module.check_mode and not ecriture_fichier(chemin(racine, fichier), texte_modifie, 0o644):
+    raise ErreurConfig("Ecriture du fichier de configuration " + fichier + " impossible")
+
+# Définition de la fonction d'exécution du module
+def run_module():
+  # Définition des options
+  module_args = {
+    'interface': { 'type': str, 'required': True },
+    'mode': { 'type': str, 'default': 'bridge', 'choices': ['bridge', 'macvtap'], 'required': False },
+    'name': { 'type': str, 'required': False },
+    'mtu': { 'type': int, 'default': 0, 'required': False },
+    'queues': { 'type': int, 'default': 0, 'required': False },
+    'offloads': { 'type': dict, 'default': { 'gro': 'on', 'gso': 'on', 'tso': 'on', 'lro': 'off' }, 'required': False },
+    'address': { 'type': str, 'default': 'manual', 'required': False },
+    'gateway': { 'type': str, 'required': False },
+    'gns3_config': { 'type': list, 'default': [], 'required': False },
+    'config-file': { 'type': str, 'default': '/etc/network/interfaces.d/gns3vm-uplink', 'required': False },
+    'root': { 'type': str, 'default': '/', 'required': False }
+  }
+
+  # Initialisation du dictionnaire de sortie
+  result = dict(changed = False, modifications = list())
+
+  # Création de l'objet module
+  module = AnsibleModule(
+    argument_spec = module_args,
+    supports_check_mode = True
+  )
+  parametres = module.params
+  racine = parametres['root']
+  interface = parametres['interface']
+  nom = parametres['name'] or ('br0' if parametres['mode'] == 'bridge' else 'macvtap0')
+  if module._diff:
+    result['diff'] = list()
+
+  # Contrôle des options
+  offloads = dict()
+  for cle, valeur in (parametres['offloads'] or dict()).items():
+    valeur = { True: 'on', False: 'off' }.get(valeur, str(valeur).lower())
+    if cle not in OFFLOADS or valeur not in ('on', 'off'):
+      module.fail_json(msg = "Délestage " + str(cle) + " invalide : " + ', '.join(sorted(OFFLOADS)) + " avec la valeur on ou off", **result)
+    offloads[cle] = valeur
+  parametres['offloads'] = offloads
+  if parametres['mode'] == 'bridge' and offloads.get('lro') == 'on':
+    module.fail_json(msg = "Le délestage lro doit être désactivé sur une interface membre d'un pont", **result)
+  if parametres['address'] not in ('manual', 'dhcp') and not re.match(r'^[0-9a-fA-F:.]+/[0-9]+$', parametres['address']):
+    module.fail_json(msg = "Option address invalide : manual, dhcp ou adresse/préfixe attendu", **result)
+  if parametres['mode'] == 'macvtap' and parametres['address'] != 'manual':
+    module.fail_json(msg = "L'option address n'est supportée qu'en mode bridge", **result)
+
+  # L'interface physique doit exister et ne pas être configurée ailleurs
+  if not os.path.exists(chemin(racine, SYSFS_NET + '/' + interface + '/device')):
+    module.fail_json(msg = "Interface physique " + interface + " introuvable", **result)
+  declarations = declarations_existantes(racine, interface, parametres['config-file'])
+  if declarations:
+    module.fail_json(msg = "Interface " + interface + " déjà configurée : " + ', '.join(declarations), **result)
+  if not re.search(r'^\s*source(-directory)?\s+/etc/network/interfaces\.d', lecture_fichier(chemin(racine, '/etc/network/interfaces')), re.MULTILINE):
+    module.warn("Le fichier /etc/network/interfaces n'inclut pas /etc/network/interfaces.d, le lien ne sera pas activé au démarrage")
+  mtu = parametres['mtu']
+  ethtool = module.get_bin_path('ethtool') if racine == '/' else None
+  if racine == '/' and ethtool is None and (parametres['queues'] > 0 or offloads):
+    module.warn("Commande ethtool introuvable, les files et délestages ne sont appliqués qu'au redémarrage si elle est installée")
+
+  # Une interface physique portant une adresse perdrait sa connectivité dans le pont
+  if racine == '/' and parametres['mode'] == 'bridge' and not os.path.exists(os.path.join(SYSFS_NET, nom, 'brif', interface)):
+    rc, out, err = module.run_command(['ip', '-o', 'addr', 'show', 'dev', interface, 'scope', 'global'])
+    if rc == 0 and out.strip():
+      module.fail_json(msg = "Interface " + interface + " porteuse d'une adresse, son adresse doit être déplacée sur le pont (option address)", **result)
+
+  # Ecriture du fragment ifupdown
+  texte = fragment(parametres, nom, mtu)
+  texte_actuel = lecture_fichier(chemin(racine, parametres['config-file']))
+  if texte != texte_actuel:
+    result['changed'] = True
+    result['modifications'].append('fragment ' + parametres['config-file'])
+    if module._diff:
+      result['diff'].append(diff_fichier(parametres['config-file'], texte_actuel, texte))
+    if not module.check_mode:
+      repertoire = os.path.dirname(chemin(racine, parametres['config-file']))
+      if not os.path.isdir(repertoire):
+        os.makedirs(repertoire, 0o755)
+      if not ecriture_fichier(chemin(racine, parametres['config-file']), texte):
+        module.fail_json(msg = "Ecriture du fichier " + parametres['config-file'] + " impossible", **result)
+
+  # Activation du lien absent, application immédiate du MTU, des files et des délestages
+  if not os.path.exists(chemin(racine, SYSFS_NET + '/' + nom)):
+    result['changed'] = True
+    result['modifications'].append('ifup ' + nom)
+    if racine == '/' and not module.check_mode:
+      for activation in (interface, nom):
+        rc, out, err = module.run_command(['ifup', activation])
+        if rc != 0:
+          module.fail_json(msg = "Activation de l'interface " + activation + " impossible : " + err.strip(), **result)
+  if mtu:
+    for lien in (interface, nom):
+      actuel = attribut_entier(racine, lien, 'mtu')
+      if actuel is not None and actuel != mtu:
+        result['changed'] = True
+        result['modifications'].append(lien + ' : mtu ' + str(actuel) + ' -> ' + str(mtu))
+        if racine == '/' and not module.check_mode:
+          module.run_command(['ip', 'link', 'set', 'dev', lien, 'mtu', str(mtu)], check_rc = True)
+  if ethtool and parametres['queues'] > 0:
+    actuelles = lecture_files_combinees(module, ethtool, interface)
+    if actuelles is not None and actuelles != parametres['queues']:
+      result['changed'] = True
+      result['modifications'].append(interface + ' : files ' + str(actuelles) + ' -> ' + str(parametres['queues']))
+      if not module.check_mode:
+        rc, out, err = module.run_command([ethtool, '-L', interface, 'combined', str(parametres['queues'])])
+        if rc != 0:
+          module.warn("Modification du nombre de files de " + interface + " impossible : " + err.strip())
+  if ethtool and offloads:
+    actifs = lecture_offloads(module, ethtool, interface) or dict()
+    differents = sorted(cle for cle, valeur in offloads.items() if actifs.get(cle) not in (None, valeur))
+    if differents:
+      result['changed'] = True
+      result['modifications'].append(interface + ' : ' + ', '.join(cle + ' ' + actifs[cle] + ' -> ' + offloads[cle] for cle in differents))
+      if not module.check_mode:
+        commande = [ethtool, '-K', interface]
+        for cle in differents:
+          commande += [cle, offloads[cle]]
+        rc, out, err = module.run_command(commande)
+        if rc != 0:
+          module.warn("Modification des délestages de " + interface + " impossible : " + err.strip())
+
+  # Interfaces autorisées de gns3-server
+  if parametres['gns3_config']:
+    result['allowed_interfaces'] = dict()
+    try:
+      for fichier in parametres['gns3_config']:
+        if os.path.exists(chemin(racine, fichier)):
+          maj_allowed_interfaces(module, racine, fichier, nom, result)
+    except ErreurConfig as erreur:
+      module.fail_json(msg = str(erreur), **result)
+
+  # Paramètres du lien après application
+  result['lien'] = rapport_lien(module, racine, parametres, nom, ethtool)
+  if result['lien']['interface']['etat'] not in (None, 'up'):
+    module.warn("Interface " + interface + " inactive (" + result['lien']['interface']['etat'] + ")")
+
+  # Fin d'exécution normale
+  module.exit_json(**result)
+
+# Definition de la fonction principale
+def main():
+  run_module()
+
+# Execution du programme
+if __name__ == '__main__':
+  main()
@@ -33,6 +33,9 @@ options:
   interface:
     description:
       - Nom de l'interface réseau d'écoute du démon gns3server.
+      - Avec C(auto), les interfaces sont classées par vitesse, adresse IPv4 et MTU à partir de sysfs et d'une requête netlink,
+        le démon écoute sur l'adresse de la meilleure interface, celle-ci est ajoutée à C(allowed_interfaces)
+        et devient C(default_nat_interface).
     type: str
     required: true
 
@@ -50,6 +53,58 @@ options:
     default: /opt/gns3
     required: false
 
+  configs_path:
+    description:
+      - Emplacement des configurations des noeuds, remplace C(<data-root>/configs).
+    type: str
+    required: false
+
+  images_path:
+    description:
+      - Emplacement des images des noeuds, remplace C(<data-root>/images).
+      - Les images de base sont lues par les noeuds et peuvent être placées sur un volume de grande capacité.
+    type: str
+    required: false
+
+  projects_path:
+    description:
+      - Emplacement des projets, remplace C(<data-root>/projects).
+      - Les disques des noeuds en copie sur écriture sont écrits dans les projets, à placer sur un stockage rapide (SSD, NVMe).
+      - Avec plusieurs instances, chaque instance N utilise C(<projects_path>-N).
+    type: str
+    required: false
+
+  appliances_path:
+    description:
+      - Emplacement des modèles d'équipements (appliances), remplace C(<data-root>/appliances).
+    type: str
+    required: false
+
+  symbols_path:
+    description:
+      - Emplacement des symboles, remplace C(<data-root>/symbols).
+    type: str
+    required: false
+
+  placement:
+    description:
+      - Vérification du placement des emplacements de données (système de fichiers, espace libre, reflink, options de montage et type de disque).
+      - Avec C(warn) un avertissement est émis et avec C(fail) le module échoue avant toute écriture si l'emplacement des projets
+        est sur un disque rotatif, un système de fichiers réseau ou dispose de moins de C(placement_min_free) % d'espace libre.
+      - Avec C(ignore) aucune vérification n'est faite.
+      - La vérification n'est pas faite avec l'option C(fingerprint).
+    type: str
+    choices: [ ignore, warn, fail ]
+    default: ignore
+    required: false
+
+  placement_min_free:
+    description:
+      - Espace libre minimum en pourcentage de l'emplacement des projets.
+    type: int
+    default: 10
+    required: false
+
   auth:
     description:
       - Option permettant d'activer l'authentification HTTP.
@@ -100,7 +155,90 @@ options:
     type: bool
     default: false
     required: false
- 
+
+  console_start_port_range:
+    description:
+      - Premier port TCP des consoles des noeuds.
+    type: int
+    required: false
+
+  console_end_port_range:
+    description:
+      - Dernier port TCP des consoles des noeuds.
+    type: int
+    required: false
+
+  vnc_console_start_port_range:
+    description:
+      - Premier port TCP des consoles VNC des noeuds.
+    type: int
+    required: false
+
+  vnc_console_end_port_range:
+    description:
+      - Dernier port TCP des consoles VNC des noeuds.
+    type: int
+    required: false
+
+  udp_start_port_range:
+    description:
+      - Premier port UDP des liens entre les noeuds.
+    type: int
+    required: false
+
+  udp_end_port_range:
+    description:
+      - Dernier port UDP des liens entre les noeuds.
+    type: int
+    required: false
+
+  mmap_support:
+    description:
+      - (Dynamips) Utilisation de fichiers projetés en mémoire pour la mémoire des routeurs.
+    type: bool
+    required: false
+
+  sparse_memory_support:
+    description:
+      - (Dynamips) Allocation de la mémoire des routeurs à la demande.
+    type: bool
+    required: false
+
+  ghost_ios_support:
+    description:
+      - (Dynamips) Partage de l'image IOS en mémoire entre les routeurs (Ghost IOS).
+    type: bool
+    required: false
+
+  capacity_profile:
+    description:
+      - Profil de capacité de la cible, C(noeuds) est le nombre de noeuds visé
+        et C(memoire_noeud) la mémoire moyenne en Mo de chaque noeud (512 par défaut).
+      - Les plages de ports console, VNC et UDP ainsi que les options mémoire de Dynamips
+        sont calculées à partir du profil, de la mémoire et du nombre de processeurs de la cible.
+      - Les options définies explicitement sont prioritaires sur les valeurs calculées.
+    type: dict
+    required: false
+
+  instances:
+    description:
+      - Nombre d'instances de gns3server, C(auto) pour une instance par noeud NUMA.
+      - Avec plusieurs instances, chaque instance N utilise le fichier de configuration C(<config-file>-N.conf),
+        le port C(port + N), le répertoire de projets C(<data-root>/projects-N) et une part des plages
+        de ports console, VNC et UDP.
+    type: str
+    default: "1"
+    required: false
+
+  fingerprint:
+    description:
+      - Mode empreinte, le fichier de configuration est lu et n'est jamais modifié.
+      - Retourne l'empreinte SHA-256 de la configuration effective normalisée, globale et par section,
+        et sa conformité à la configuration demandée, sans retourner les valeurs.
+    type: bool
+    default: false
+    required: false
+
   debug:
     description:
       - Activation du mode debug du module.
@@ -112,7 +250,11 @@ options:
 author:
   - Pascal MIRALLES (@pamioc)
 notes:
-  - Support du mode de vérification C(check_mode).
+  - Support du mode de vérification C(check_mode) et du mode C(diff).
+  - Les valeurs des options secrètes (password, secret, token) sont masquées dans la différence et les valeurs de retour de débogage.
+  - Seules les options dont la valeur normalisée change sont modifiées, les commentaires et l'ordre des lignes sont conservés.
+  - Le fichier est écrit de façon atomique (fichier temporaire synchronisé puis renommé).
+  - Un emplacement inexistant est analysé sur son premier répertoire parent existant.
 seealso:
 
 '''
@@ -145,9 +287,208 @@ EXAMPLES = r'''
     interface: "eth0"
     require_kvm: false
 
+
+- name: "Configuration d'une cible prévue pour 300 noeuds de 384 Mo en moyenne"
+  gns3server_daemon_config:
+    config-file: "/etc/gns3/gns3_server.conf"
+    force: true
+    interface: "eth0"
+    capacity_profile:
+      noeuds: 300
+      memoire_noeud: 384
+
+
+- name: "Configuration d'une instance de gns3server par noeud NUMA"
+  gns3server_daemon_config:
+    config-file: "/etc/gns3/gns3_server.conf"
+    interface: "eth0"
+    instances: auto
+
+
+- name: "Images sur un volume de grande capacité et projets sur NVMe, échec si les projets sont mal placés"
+  gns3server_daemon_config:
+    config-file: "/etc/gns3/gns3_server.conf"
+    force: true
+    interface: "eth0"
+    data-root: "/srv/gns3"
+    images_path: "/srv/stockage/gns3/images"
+    projects_path: "/srv/nvme/gns3/projects"
+    placement: fail
+
+
+- name: "Configuration en écoute sur l'interface la plus rapide"
+  gns3server_daemon_config:
+    config-file: "/etc/gns3/gns3_server.conf"
+    force: true
+    interface: auto
+
 '''
 
 RETURN = r'''
+interfaces:
+  description: Le classement des interfaces réseau, l'interface retenue est la première.
+  returned: option interface auto
+  type: list
+  sample: [
+    {
+      "rang": 1,
+      "nom": "bond0",
+      "type": "bond",
+      "vitesse": 50000,
+      "mtu": 9000,
+      "etat": "up",
+      "maitre": null,
+      "inferieures": [],
+      "ipv4": [ "10.20.0.11" ],
+      "ipv6": [ "2001:db8::11" ],
+      "exclusion": null
+    },
+    {
+      "rang": 2,
+      "nom": "eno1",
+      "type": "ethernet",
+      "vitesse": 1000,
+      "mtu": 1500,
+      "etat": "up",
+      "maitre": null,
+      "inferieures": [],
+      "ipv4": [ "192.168.10.21" ],
+      "ipv6": [],
+      "exclusion": null
+    },
+    {
+      "rang": null,
+      "nom": "ens1f0",
+      "type": "ethernet",
+      "vitesse": 25000,
+      "mtu": 9000,
+      "etat": "up",
+      "maitre": "bond0",
+      "inferieures": [],
+      "ipv4": [],
+      "ipv6": [],
+      "exclusion": "esclave de bond0"
+    }
+  ]
+
+empreintes:
+  description:
+    - Empreintes de la configuration effective par fichier, sa présence et sa conformité à la configuration demandée.
+    - Les options propres à la cible de la section Server (adresse, interfaces, port, projets, plages de ports) ont leur propre empreinte (empreinte_cible).
+  returned: option fingerprint
+  type: dict
+  sample: {
+    "/etc/gns3/gns3_server.conf": {
+      "present": true,
+      "empreinte": "136e0dc178e5062aceaf1c43f2327b2c2cf18cfd5e83c931538891b49373002b",
+      "sections": { "Server": "e6db37e4016451cb2da6bd5abde89359c28837c6ea180ff91d4f3565f46e240a", "Qemu": "6d0c5b1e0e5f3f1c1a3fa1b9d4fbd6cf3f1e2a6e5a4b8c7d9e0f1a2b3c4d5e6f" },
+      "empreinte_cible": "0f4c3b2a8e1d9c7b6a5f4e3d2c1b0a9f8e7d6c5b4a3f2e1d0c9b8a7f6e5d4c3b",
+      "conforme": true
+    }
+  }
+
+placement:
+  description: Le rapport de placement par emplacement de données, mesures du système de fichiers en Mo.
+  returned: option placement warn ou fail
+  type: dict
+  sample: {
+    "/srv/nvme/gns3/projects": {
+      "usages": [ "projects" ],
+      "repertoire_existant": "/srv/nvme/gns3/projects",
+      "point_montage": "/srv/nvme",
+      "peripherique": "259:1",
+      "source": "/dev/nvme0n1p1",
+      "systeme_fichiers": "xfs",
+      "options": [ "attr2", "discard", "inode64", "noatime", "rw" ],
+      "noatime": true,
+      "discard": true,
+      "reseau": false,
+      "rotatif": false,
+      "reflink": true,
+      "total_mo": 1906394,
+      "libre_mo": 1523112,
+      "libre_pct": 79.9,
+      "alertes": []
+    },
+    "/srv/stockage/gns3/images": {
+      "usages": [ "images" ],
+      "repertoire_existant": "/srv/stockage/gns3/images",
+      "point_montage": "/srv/stockage",
+      "peripherique": "8:17",
+      "source": "/dev/sdb1",
+      "systeme_fichiers": "ext4",
+      "options": [ "relatime", "rw" ],
+      "noatime": false,
+      "discard": false,
+      "reseau": false,
+      "rotatif": true,
+      "reflink": false,
+      "total_mo": 15023460,
+      "libre_mo": 9012331,
+      "libre_pct": 60.0,
+      "alertes": []
+    }
+  }
+
+instances:
+  description: La répartition des instances de gns3server.
+  returned: toujours
+  type: list
+  sample: [
+    {
+      "id": 0,
+      "service": "gns3-0",
+      "config-file": "/etc/gns3/gns3_server-0.conf",
+      "port": 3080,
+      "projects_path": "/opt/gns3/projects-0",
+      "console_start_port_range": 5000,
+      "console_end_port_range": 7499,
+      "vnc_console_start_port_range": 10000,
+      "vnc_console_end_port_range": 11249,
+      "udp_start_port_range": 10000,
+      "udp_end_port_range": 14999,
+      "numa_node": 0,
+      "cpus": "0-19,40-59"
+    },
+    {
+      "id": 1,
+      "service": "gns3-1",
+      "config-file": "/etc/gns3/gns3_server-1.conf",
+      "port": 3081,
+      "projects_path": "/opt/gns3/projects-1",
+      "console_start_port_range": 7500,
+      "console_end_port_range": 9999,
+      "vnc_console_start_port_range": 11250,
+      "vnc_console_end_port_range": 12499,
+      "udp_start_port_range": 15000,
+      "udp_end_port_range": 19999,
+      "numa_node": 1,
+      "cpus": "20-39,60-79"
+    }
+  ]
+
+capacity_profile:
+  description: Le profil de capacité calculé.
+  returned: option capacity_profile
+  type: dict
+  sample: {
+    "noeuds": 300,
+    "memoire_noeud": 384,
+    "memoire_mo": 64306,
+    "cpus": 16,
+    "noeuds_max_memoire": 150,
+    "noeuds_par_cpu": 18.8,
+    "console_start_port_range": 5000,
+    "console_end_port_range": 9999,
+    "vnc_console_start_port_range": 10000,
+    "vnc_console_end_port_range": 10374,
+    "udp_start_port_range": 10375,
+    "udp_end_port_range": 20374,
+    "mmap_support": true,
+    "sparse_memory_support": true,
+    "ghost_ios_support": true
+  }
+
 parametres:
   description: Les paramètres transmis au module.
   returned: mode debug
@@ -204,204 +545,25 @@ config_daemon:
 '''
 
 from ansible.module_utils.basic import AnsibleModule
-
-# Chargement des modules necessaires
-import os
-import socket
-import configparser
-
-# Vérification de l'existence d'une interface réseau
-def verif_interface_reseau(interface):
-  val_ret = False
-  try:
-    socket.if_nametoindex(interface)
-    val_ret = True
-  except OSError:
-    val_ret = False
-  return val_ret
-
-# Récupération de l'adresse IP d'une interface
-def get_ip_address(ifname):
-  import fcntl
-  import struct
-  s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-  return socket.inet_ntoa(fcntl.ioctl(
-    s.fileno(),
-    0x8915,  # SIOCGIFADDR
-    struct.pack('256s', bytes(ifname[:15], 'utf-8'))
-  )[20:24])
-
-# Définition de la fonction de lecture du fichier actuel
-def lecture_config(fichier):
-  parametres = dict()
-  config = configparser.ConfigParser()
-  config.read(fichier)
-  sections = config.sections()
-  for section in sections:
-    options = config.options(section)
-    temp_dict = dict()
-    for option in options:
-      temp_dict[option] = config.get(section,option)
-    parametres[section] = temp_dict
-  return parametres
-
-# Définition de la fonction d'enregistrement du fichier de configuration
-def ecriture_config(fichier, parametres):
-  config = configparser.ConfigParser()
-  config.read_dict(parametres)
-  config.update(parametres)
-  try:
-    with open(fichier, 'w') as f:
-      config.write(f)
-    return True
-  except IOError:
-    return False
-
-# Définition de la fonction de mise à jour de la configuration
-def maj_config(config, parametres):
-  import copy
-  # Création de la variable de configuration finale
-  configuration = copy.deepcopy(config)
-  # Si aucune section Server alors la configuration actuelle est vide
-  # donc on crée une configuration par défaut
-  if 'Server' not in configuration:
-    if parametres['data-root'] != None:
-      data_root = parametres['data-root']
-    else:
-      data_root = '/opt/gns3'
-    configuration = {
-      'Server': {
-        'host': '0.0.0.0', 'port': '3080',
-        'auth': 'False', 'user': 'gns3', 'password': 'gns3',
-        'ssl': 'False',
-        'configs_path': data_root + '/configs', 'images_path': data_root + '/images', 'projects_path': data_root + '/projects', 'appliances_path': data_root + '/appliances', 'symbols_path': data_root + '/symbols',
-        'allowed_interfaces': 'virbr0,br0', 'default_nat_interface': 'virbr0'
-      },
-      'IOU': { 'iourc_path': data_root + '/iourc.txt', 'license_check': 'True' },
-      'Qemu': {
-        'enable_kvm': 'True', 'require_kvm': 'True',
-        'enable_hardware_acceleration': 'True', 'require_hardware_acceleration': 'False'
-      }
-    }
-
-  # Définition du modèle de la configuration globale
-  modele_config = {
-    'Server': (
-      'host', 'port',
-      'auth', 'user', 'password',
-      'ssl', 'certfile', 'certkey',
-      'configs_path', 'images_path', 'projects_path', 'appliances_path', 'symbols_path',
-      'report_errors',
-      'console_start_port_range', 'console_end_port_range', 'vnc_console_start_port_range', 'vnc_console_end_port_range',
-      'udp_start_port_range', 'udp_end_port_range',
-      'ubridge_path',
-      'allowed_interfaces', 'default_nat_interface'
-    ),
-    'Dynamips': (
-      'dynamips_path', 'allocate_aux_console_ports', 'mmap_support', 'sparse_memory_support', 'ghost_ios_support'
-    ),
-    'IOU': (
-      'iourc_path', 'license_check'
-    ),
-    'Qemu': (
-      'enable_kvm', 'require_kvm', 'enable_hardware_acceleration', 'require_hardware_acceleration'
-    ),
-    'VPCS': (
-      'vpcs_path'
-    )
-  }
-  # On adapte les paramètres
-  for option in parametres:
-    if parametres[option] == None:
-      continue
-    if option == 'interface':
-        configuration['Server']['host'] = get_ip_address(parametres['interface'])
-        #configuration.update({'Server': '{'host': get_ip_address(parametres['interface'])
-        continue
-    if option == 'data-root':
-      for type in ( 'configs', 'images', 'projects', 'appliances', 'symbols'):
-        configuration['Server'][type + '_path'] = parametres[option] + '/' + type
-      continue
-    for section in modele_config:
-      if modele_config[section].count(option) > 0:
-        if section not in configuration:
-          configuration[section] = dict()
-        configuration[section][option] = str(parametres[option])
-        break
-  return configuration
+from ansible.module_utils.gns3vm_config import ErreurConfig
+from ansible.module_utils.gns3vm_gns3server import ARGUMENTS, application
 
 # Définition de la fonction d'exécution du module
 def run_module():
-  # Définition des options
-  module_args = {
-    'config-file': { 'type': str, 'default': '/etc/gns3/gns3_server.conf', 'required': False },
-    'force': { 'type': bool, 'default': False, 'required': False },
-    'interface': { 'type': str, 'required': True },
-    'port': { 'type': int, 'required': False },
-    'data-root': { 'type': str, 'required': False },
-    'auth': { 'type': bool, 'required': False },
-    'user': { 'type': str, 'required': False },
-    'password': { 'type': str, 'required': False },
-    'require_kvm': { 'type': bool, 'required': False },
-    'enable_kvm': { 'type': bool, 'required': False },
-    'enable_hardware_acceleration': { 'type': bool, 'required': False },
-    'require_hardware_acceleration': { 'type': bool, 'required': False },
-    'debug': { 'type': bool, 'default': False, 'required': False }
-  }
-
   # Initialisation du dictionnaire de sortie
   result = dict(changed = False)
 
   # Création de l'objet module
   module = AnsibleModule(
-    argument_spec = module_args,
+    argument_spec = ARGUMENTS,
     supports_check_mode = True
   )
 
-  # Ajout des paramètres dans la variable de retour en mode debug
-  if module.params['debug']:
-    result['parametres'] = module.params
-
-  # Sortie si le mode de vérification est activé
-  if module.check_mode:
-    module.exit_json(**result)
-
-  # Vérification de la présence de l'interface réseau spécifiée
-  if not verif_interface_reseau(module.params['interface']):
-    module.fail_json(msg = "Interface [" + module.params['interface'] + "] introuvable", **result)
-
-  # Initialisation des variables de configuration
-  config_actuelle = dict()
-  config_daemon = dict()
-
-  # Test si le fichier de configuration est présent
-  if os.path.exists(module.params['config-file']):
-    # Si l'option force est activé alors on lit le fichier de configuration
-    if module.params['force']:
-      config_actuelle = lecture_config(module.params['config-file'])
-    # Sinon on sort car aucun paramètre ne sera enregistré
-    else:
-      module.exit_json(**result)
-
-  # Ajout des paramètres dans la variable de retour en mode debug
-  if module.params['debug']:
-    result['config_actuelle'] = config_actuelle
-
-  # Mise à jour des valeurs dans la variable configuration
-  config_daemon = maj_config(config_actuelle, module.params)
-
-  # Ajout des paramètres dans la variable de retour en mode debug
-  if module.params['debug']:
-    result['config_daemon'] = config_daemon
-
-  # Test si la nouvelle configuration est différente
-  if not config_daemon == config_actuelle:
-    # Ecriture du fichier de configuration
-    if not ecriture_config(module.params['config-file'], config_daemon):
-      module.fail_json(msg = "Ecriture du fichier de configuration du service docker impossible", **result)
-    else:
-      # La modification de configuration a été effectuée
-      result['changed'] = True
+  # Application de la configuration
+  try:
+    application(module, module.params, result)
+  except ErreurConfig as erreur:
+    module.fail_json(msg = str(erreur), **result)
 
   # Fin d'exécution normale
   module.exit_json(**result)
@@ -413,4 +575,3 @@ def main():
 # Execution du programme
 if __name__ == '__main__':
   main()
-
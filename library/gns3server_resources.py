@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*
+# Module de calcul des limites de ressources des services de gns3-server
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: gns3server_resources
+version_added: "1.0"
+short_description: Calcul des limites de ressources systemd des services de gns3-server.
+description:
+  - Calcule les directives de limitation de ressources de chaque service de gns3-server
+    (descripteurs de fichiers, tâches, poids processeur et disques, mémoire et affinité processeur)
+    à partir du nombre de noeuds prévus et des ressources de l'hôte.
+  - Les noeuds Qemu, Dynamips, VPCS et ubridge sont des processus fils de gns3-server et partagent les limites de son service,
+    une réserve de mémoire et des poids inférieurs à ceux des autres services protègent l'hôte (sshd, dockerd).
+  - Détecte la hiérarchie des groupes de contrôle, les directives cgroup v2 sont remplacées par leurs équivalents cgroup v1
+    si la hiérarchie unifiée n'est pas utilisée.
+  - Le module ne modifie pas la cible, les directives retournées sont utilisées par le modèle du service.
+options:
+  instances:
+    description:
+      - Instances de gns3-server retournées par le module M(gns3server_daemon_config) (C(service), C(numa_node) et C(cpus)).
+    type: list
+    required: True
+  nodes:
+    description:
+      - Nombre de noeuds prévus sur l'hôte, 0 pour une estimation à partir de la mémoire et de C(node_memory).
+    type: int
+    default: 0
+    required: False
+  node_memory:
+    description:
+      - Mémoire en Mo d'un noeud, utilisée pour l'estimation du nombre de noeuds.
+    type: int
+    default: 512
+    required: False
+  reserved_memory:
+    description:
+      - Mémoire en Mo réservée à l'hôte hors des services de gns3-server, 0 pour 10 % de la mémoire avec un minimum de 1 Go.
+    type: int
+    default: 0
+    required: False
+  memory_high:
+    description:
+      - Seuil de récupération mémoire (C(MemoryHigh)) en pourcentage de la limite (C(MemoryMax)).
+    type: int
+    default: 90
+    required: False
+  cpu_weight:
+    description:
+      - Poids processeur de chaque service (C(CPUWeight)), 100 pour les autres services de l'hôte.
+    type: int
+    default: 80
+    required: False
+  io_weight:
+    description:
+      - Poids des accès disques de chaque service (C(IOWeight)), 100 pour les autres services de l'hôte.
+    type: int
+    default: 80
+    required: False
+  cpu_affinity:
+    description:
+      - Processeurs des instances non liées à un noeud NUMA (C(CPUAffinity)), par exemple C(2-31) pour réserver deux processeurs à l'hôte.
+    type: str
+    required: False
+  overrides:
+    description:
+      - Directives remplaçant ou complétant les valeurs calculées pour tous les services, une valeur vide supprime la directive.
+    type: dict
+    required: False
+author:
+  - Pascal MIRALLES (@pamioc)
+notes:
+  - Support du mode C(check_mode).
+  - Les pages géantes réservées ne sont pas comptées dans la mémoire des groupes de contrôle et sont déduites de la mémoire répartie.
+  - En cgroup v1, C(MemoryHigh) n'a pas d'équivalent et n'est pas retourné.
+  - C(NUMAPolicy) et C(NUMAMask) nécessitent systemd 243, sinon la mémoire est liée au noeud NUMA par C(numactl)
+    placé devant la commande du service (C(prefixes)).
+seealso:
+  - module: gns3server_daemon_config
+  - module: gns3_memory_density
+
+'''
+
+EXAMPLES = r'''
+- name: "Limites de ressources pour 200 noeuds"
+  gns3server_resources:
+    instances: "{{ gns3_config.instances }}"
+    nodes: 200
+  register: gns3_ressources
+
+- name: "Limites de ressources avec deux processeurs et 4 Go réservés à l'hôte"
+  gns3server_resources:
+    instances: "{{ gns3_config.instances }}"
+    reserved_memory: 4096
+    cpu_affinity: "2-31"
+    overrides:
+      LimitNOFILE: 1048576
+
+'''
+
+RETURN = r'''
+cgroup:
+  description: Version de la hiérarchie des groupes de contrôle (C(v2) unifiée, C(v1) hybride ou historique).
+  returned: toujours
+  type: str
+  sample: "v2"
+calcul:
+  description: Données utilisées pour le calcul, mémoires en Mo.
+  returned: toujours
+  type: dict
+  sample: {
+    "noeuds": 200, "estimation": false, "noeuds_instance": 100, "memoire_mo": 257642, "hugepages_mo": 65536,
+    "reserve_mo": 25764, "memoire_services_mo": 166342, "nr_open": 1048576, "pid_max": 4194304,
+    "controleurs": [ "cpuset", "cpu", "io", "memory", "pids" ]
+  }
+services:
+  description: Directives systemd de chaque service, dans l'ordre d'écriture.
+  returned: toujours
+  type: dict
+  sample: {
+    "gns3-0": {
+      "LimitNOFILE": "16384", "TasksMax": "6912", "CPUWeight": "80", "IOWeight": "80",
+      "MemoryHigh": "74853M", "MemoryMax": "83171M", "CPUAffinity": "0-15", "NUMAPolicy": "bind", "NUMAMask": "0"
+    }
+  }
+systemd:
+  description: Version de systemd sur la cible, null si elle n'a pas pu être lue.
+  returned: toujours
+  type: int
+  sample: 247
+prefixes:
+  description: Préfixe de la commande de chaque service lié à un noeud NUMA lorsque systemd ne supporte pas C(NUMAPolicy).
+  returned: toujours
+  type: dict
+  sample: { "gns3-0": "/usr/bin/numactl --membind=0 " }
+ignorees:
+  description: Directives non retournées faute de contrôleur disponible sur la cible.
+  returned: toujours
+  type: list
+  sample: [ "IOWeight" ]
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+
+# Chargement des modules necessaires
+import os
+import re
+
+# Racine des groupes de contrôle
+CGROUP = '/sys/fs/cgroup'
+
+# Version minimale de systemd des directives NUMAPolicy et NUMAMask
+SYSTEMD_NUMA = 243
+
+# Descripteurs de fichiers et tâches par noeud : consoles, interfaces tap et vhost, sockets UDP de ubridge,
+# fichiers d'images et fils d'exécution Qemu (processeurs virtuels et réserve d'entrées-sorties)
+DESCRIPTEURS_NOEUD = 64
+TACHES_NOEUD = 32
+
+# Contrôleur cgroup v2 de chaque directive
+CONTROLEURS = {
+  'TasksMax': 'pids',
+  'CPUWeight': 'cpu',
+  'IOWeight': 'io',
+  'MemoryHigh': 'memory',
+  'MemoryMax': 'memory'
+}
+
+# Equivalents cgroup v1 des directives cgroup v2 (None : sans équivalent)
+DIRECTIVES_V1 = {
+  'CPUWeight': ('CPUShares', lambda poids: int(poids) * 1024 // 100),
+  'IOWeight': ('BlockIOWeight', int),
+  'MemoryHigh': None,
+  'MemoryMax': ('MemoryLimit', str)
+}
+
+# Puissance de 2 supérieure ou égale
+def puissance2(valeur):
+  return 1 << (max(int(valeur), 1) - 1).bit_length()
+
+# Lecture d'un fichier de /proc ou /sys, None si indisponible
+def lecture(fichier):
+  try:
+    with open(fichier, 'r') as f:
+      return f.read().strip()
+  except (IOError, OSError):
+    return None
+
+# Lecture d'une valeur en Ko de meminfo
+def meminfo(texte, cle):
+  resultat = re.search(r'^(?:Node [0-9]+ )?' + cle + r':\s+([0-9]+)', texte or '', re.MULTILINE)
+  return int(resultat.group(1)) if resultat else 0
+
+# Mémoire totale et mémoire des pages géantes en Mo, globale puis par noeud NUMA
+def lecture_memoire():
+  texte = lecture('/proc/meminfo')
+  memoire = { None: (meminfo(texte, 'MemTotal') // 1024, meminfo(texte, 'HugePages_Total') * meminfo(texte, 'Hugepagesize') // 1024) }
+  repertoire = '/sys/devices/system/node'
+  if os.path.isdir(repertoire):
+    for nom in os.listdir(repertoire):
+      if re.match(r'^node[0-9]+$', nom):
+        texte = lecture(os.path.join(repertoire, nom, 'meminfo'))
+        pages = 0
+        hugepages = os.path.join(repertoire, nom, 'hugepages')
+        for taille in os.listdir(hugepages) if os.path.isdir(hugepages) else list():
+          nombre = lecture(os.path.join(hugepages, taille, 'nr_hugepages'))
+          pages += int(nombre or 0) * int(re.sub(r'[^0-9]', '', taille)) // 1024
+        memoire[int(nom[4:])] = (meminfo(texte, 'MemTotal') // 1024, pages)
+  return memoire
+
+# Version de la hiérarchie des groupes de contrôle et contrôleurs disponibles
+# En mode hybride, systemd utilise la hiérarchie cgroup v1 pour les contrôleurs de ressources
+def lecture_cgroup():
+  controleurs = lecture(os.path.join(CGROUP, 'cgroup.controllers'))
+  if controleurs is not None:
+    return 'v2', controleurs.split()
+  return 'v1', sorted(nom for nom in ('cpu', 'blkio', 'memory', 'pids', 'cpuset') if os.path.isdir(os.path.join(CGROUP, nom)))
+
+# Version de systemd, None si elle n'a pas pu être lue
+def lecture_systemd(module):
+  rc, sortie, erreur = module.run_command(['systemctl', '--version'])
+  resultat = re.match(r'^systemd ([0-9]+)', sortie or '')
+  return int(resultat.group(1)) if rc == 0 and resultat else None
+
+# Calcul des directives d'un service
+def calcul_service(instance, noeuds, memoire_mo, parametres, limites):
+  directives = {
+    'LimitNOFILE': min(max(16384, puissance2(noeuds * DESCRIPTEURS_NOEUD + 4096)), limites['nr_open']),
+    'TasksMax': min(max(4096, noeuds * TACHES_NOEUD + 512), limites['pid_max']),
+    'CPUWeight': parametres['cpu_weight'],
+    'IOWeight': parametres['io_weight']
+  }
+  if memoire_mo > 0:
+    directives['MemoryHigh'] = str(memoire_mo * parametres['memory_high'] // 100) + 'M'
+    directives['MemoryMax'] = str(memoire_mo) + 'M'
+  # Affinité du noeud NUMA de l'instance, sinon affinité demandée
+  if instance.get('cpus'):
+    directives['CPUAffinity'] = instance['cpus']
+    directives['NUMAPolicy'] = 'bind'
+    directives['NUMAMask'] = instance['numa_node']
+  elif parametres['cpu_affinity']:
+    directives['CPUAffinity'] = parametres['cpu_affinity']
+  return directives
+
+# Adaptation des directives à la hiérarchie des groupes de contrôle
+def adaptation(directives, version, controleurs, ignorees):
+  resultat = dict()
+  for directive, valeur in directives.items():
+    controleur = CONTROLEURS.get(directive)
+    if version == 'v1' and directive in DIRECTIVES_V1:
+      if DIRECTIVES_V1[directive] is None:
+        ignorees.add(directive)
+        continue
+      directive, conversion = DIRECTIVES_V1[directive]
+      valeur = conversion(valeur)
+      controleur = { 'CPUShares': 'cpu', 'BlockIOWeight': 'blkio', 'MemoryLimit': 'memory' }[directive]
+    if controleur is not None and controleur not in controleurs:
+      ignorees.add(directive)
+      continue
+    resultat[directive] = str(valeur)
+  return resultat
+
+# Définition de la fonction d'exécution du module
+def run_module():
+  # Définition des options
+  module_args = {
+    'instances': { 'type': list, 'required': True },
+    'nodes': { 'type': int, 'default': 0, 'required': False },
+    'node_memory': { 'type': int, 'default': 512, 'required': False },
+    'reserved_memory': { 'type': int, 'default': 0, 'required': False },
+    'memory_high': { 'type': int, 'default': 90, 'required': False },
+    'cpu_weight': { 'type': int, 'default': 80, 'required': False },
+    'io_weight': { 'type': int, 'default': 80, 'required': False },
+    'cpu_affinity': { 'type': str, 'required': False },
+    'overrides': { 'type': dict, 'required': False }
+  }
+
+  # Initialisation du dictionnaire de sortie
+  result = dict(changed = False)
+
+  # Création de l'objet module
+  module = AnsibleModule(
+    argument_spec = module_args,
+    supports_check_mode = True
+  )
+  parametres = module.params
+
+  # Contrôle des options
+  instances = parametres['instances']
+  if not instances or not all(isinstance(instance, dict) and instance.get('service') for instance in instances):
+    module.fail_json(msg = "Option instances invalide : liste des instances de gns3server_daemon_config attendue", **result)
+  if not 1 <= parametres['cpu_weight'] <= 10000 or not 1 <= parametres['io_weight'] <= 10000:
+    module.fail_json(msg = "Les poids processeur et disques doivent être compris entre 1 et 10000", **result)
+  if not 1 <= parametres['memory_high'] <= 100:
+    module.fail_json(msg = "Option memory_high invalide : pourcentage entre 1 et 100 attendu", **result)
+
+  # Ressources de l'hôte
+  version, controleurs = lecture_cgroup()
+  systemd = lecture_systemd(module)
+  memoire = lecture_memoire()
+  memoire_mo, hugepages_mo = memoire[None]
+  reserve_mo = parametres['reserved_memory'] or max(1024, memoire_mo // 10)
+  memoire_services_mo = max(0, memoire_mo - hugepages_mo - reserve_mo)
+  limites = {
+    'nr_open': int(lecture('/proc/sys/fs/nr_open') or 1048576),
+    'pid_max': min(int(lecture('/proc/sys/kernel/pid_max') or 32768), int(lecture('/proc/sys/kernel/threads-max') or 32768))
+  }
+  if memoire_mo > 0 and memoire_services_mo == 0:
+    module.warn("Aucune mémoire disponible pour les services de gns3-server après la réserve de l'hôte et les pages géantes, limites mémoire non calculées")
+
+  # Nombre de noeuds, réparti entre les instances
+  noeuds = parametres['nodes']
+  estimation = noeuds < 1
+  if estimation:
+    noeuds = max(1, memoire_services_mo // max(parametres['node_memory'], 1))
+  noeuds_instance = -(-noeuds // len(instances))
+  result['cgroup'] = version
+  result['systemd'] = systemd
+  result['calcul'] = dict(limites, noeuds = noeuds, estimation = estimation, noeuds_instance = noeuds_instance, memoire_mo = memoire_mo,
+                          hugepages_mo = hugepages_mo, reserve_mo = reserve_mo, memoire_services_mo = memoire_services_mo,
+                          controleurs = controleurs)
+
+  # Directives de chaque service
+  # La mémoire d'une instance liée à un noeud NUMA est proportionnelle à la mémoire du noeud hors pages géantes,
+  # partagée entre les instances du noeud
+  ignorees = set()
+  services = dict()
+  prefixes = dict()
+  instances_noeud = dict()
+  for instance in instances:
+    instances_noeud[instance.get('numa_node')] = instances_noeud.get(instance.get('numa_node'), 0) + 1
+  for instance in instances:
+    noeud = instance.get('numa_node')
+    if noeud is not None and noeud in memoire and memoire_mo > hugepages_mo:
+      part = float(memoire[noeud][0] - memoire[noeud][1]) / (memoire_mo - hugepages_mo)
+      memoire_instance = int(memoire_services_mo * part) // instances_noeud[noeud]
+    else:
+      memoire_instance = memoire_services_mo // len(instances)
+    directives = calcul_service(instance, noeuds_instance, memoire_instance, parametres, limites)
+    for directive, valeur in (parametres['overrides'] or dict()).items():
+      if valeur is None or str(valeur) == '':
+        directives.pop(directive, None)
+      else:
+        directives[directive] = valeur
+    # Avant systemd 243, la mémoire est liée au noeud NUMA par numactl
+    if systemd is not None and systemd < SYSTEMD_NUMA and 'NUMAMask' in directives:
+      directives.pop('NUMAPolicy', None)
+      masque = directives.pop('NUMAMask')
+      numactl = module.get_bin_path('numactl')
+      if numactl:
+        prefixes[instance['service']] = numactl + ' --membind=' + str(masque) + ' '
+      else:
+        ignorees.update(('NUMAPolicy', 'NUMAMask'))
+        module.warn("systemd " + str(systemd) + " ne supporte pas NUMAPolicy et numactl est absent : mémoire de " + instance['service'] + " non liée au noeud NUMA")
+    services[instance['service']] = adaptation(directives, version, controleurs, ignorees)
+  result['services'] = services
+  result['prefixes'] = prefixes
+  result['ignorees'] = sorted(ignorees)
+
+  # Fin d'exécution normale
+  module.exit_json(**result)
+
+# Definition de la fonction principale
+def main():
+  run_module()
+
+# Execution du programme
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*
+# Module d'attente de la disponibilité de l'API de gns3-server
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: gns3server_wait_ready
+version_added: "1.0"
+short_description: Attente de la disponibilité de l'API de gns3-server.
+description:
+  - Lit l'adresse d'écoute, le port, le protocole et l'authentification dans le fichier de configuration de gns3-server
+    puis interroge C(/v2/version) jusqu'à obtenir une réponse valide.
+  - L'intervalle entre deux tentatives double à chaque échec, de C(delay) jusqu'à C(max_delay).
+  - Une adresse d'écoute générique (C(0.0.0.0) ou C(::)) est remplacée par l'adresse de bouclage correspondante.
+  - En cas d'expiration du délai, le module échoue avec les dernières lignes du journal de gns3-server.
+options:
+  config-file:
+    description:
+      - Fichier de configuration de gns3-server.
+    type: str
+    default: "/etc/gns3/gns3_server.conf"
+    required: False
+  host:
+    description:
+      - Adresse interrogée, remplace l'adresse d'écoute du fichier de configuration.
+    type: str
+    required: False
+  port:
+    description:
+      - Port interrogé, remplace le port du fichier de configuration.
+    type: int
+    required: False
+  user:
+    description:
+      - Utilisateur de l'authentification HTTP, remplace celui du fichier de configuration.
+    type: str
+    required: False
+  password:
+    description:
+      - Mot de passe de l'authentification HTTP, remplace celui du fichier de configuration.
+    type: str
+    required: False
+  timeout:
+    description:
+      - Délai maximum d'attente en secondes.
+    type: int
+    default: 120
+    required: False
+  delay:
+    description:
+      - Intervalle initial en secondes entre deux tentatives.
+    type: float
+    default: 0.5
+    required: False
+  max_delay:
+    description:
+      - Intervalle maximum en secondes entre deux tentatives.
+    type: float
+    default: 5
+    required: False
+  log-file:
+    description:
+      - Journal de gns3-server dont les dernières lignes sont retournées en cas d'échec.
+    type: str
+    default: "/var/log/gns3/gns3.log"
+    required: False
+  log_lines:
+    description:
+      - Nombre de lignes du journal retournées en cas d'échec.
+    type: int
+    default: 40
+    required: False
+author:
+  - Pascal MIRALLES (@pamioc)
+notes:
+  - Support du mode de vérification C(check_mode), l'API est interrogée de la même façon.
+  - Une réponse HTTP 401 (authentification refusée) provoque un échec immédiat.
+seealso:
+  - module: gns3server_daemon_config
+
+'''
+
+EXAMPLES = r'''
+- name: "Attente de la disponibilité de gns3server"
+  gns3server_wait_ready:
+    config-file: /etc/gns3/gns3_server.conf
+    log-file: /var/log/gns3/gns3.log
+    timeout: 120
+
+- name: "Attente de toutes les instances de gns3server"
+  gns3server_wait_ready:
+    config-file: "{{ item['config-file'] }}"
+    log-file: "/var/log/gns3/{{ item.service }}.log"
+  loop: "{{ gns3_config.instances }}"
+
+'''
+
+RETURN = r'''
+url:
+  description: Adresse de l'API interrogée.
+  returned: toujours
+  type: str
+  sample: "http://127.0.0.1:3080/v2/version"
+version:
+  description: Version retournée par gns3-server.
+  returned: succès
+  type: str
+  sample: "2.2.20"
+temps_pret:
+  description: Temps en secondes écoulé avant la première réponse valide.
+  returned: toujours
+  type: float
+  sample: 3.42
+tentatives:
+  description: Nombre de requêtes envoyées.
+  returned: toujours
+  type: int
+  sample: 5
+erreur:
+  description: Dernière erreur rencontrée.
+  returned: échec
+  type: str
+  sample: "<urlopen error [Errno 111] Connection refused>"
+journal:
+  description: Dernières lignes du journal de gns3-server.
+  returned: échec
+  type: list
+  sample: [ "2021-05-02 10:12:01 INFO run.py:237 GNS3 server version 2.2.20" ]
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.urls import open_url
+from ansible.module_utils.gns3vm_config import ErreurConfig, lecture_fichier, lecture_ini
+
+# Chargement des modules necessaires
+import json
+import time
+
+# Adresses de bouclage utilisées à la place des adresses d'écoute génériques
+BOUCLAGE = { '': '127.0.0.1', '0.0.0.0': '127.0.0.1', '::': '::1' }
+
+# Chemin de l'API interrogée
+API_VERSION = '/v2/version'
+
+# Définition de la fonction de construction de l'adresse de l'API
+def adresse_api(protocole, hote, port):
+  hote = BOUCLAGE.get(hote, hote)
+  if ':' in hote:
+    hote = '[' + hote + ']'
+  return protocole + '://' + hote + ':' + str(port) + API_VERSION
+
+# Lecture des dernières lignes du journal de gns3-server
+def fin_journal(fichier, lignes):
+  try:
+    with open(fichier, 'rb') as f:
+      f.seek(0, 2)
+      taille = f.tell()
+      f.seek(max(0, taille - 256 * lignes))
+      texte = f.read().decode('utf-8', 'replace')
+  except (IOError, OSError):
+    return list()
+  return texte.splitlines()[-lignes:] if lignes > 0 else list()
+
+# Interrogation de l'API, retourne la version ou lève une exception
+def interrogation(url, utilisateur, mot_de_passe, delai):
+  reponse = open_url(url, method = 'GET', timeout = delai, validate_certs = False,
+                     url_username = utilisateur, url_password = mot_de_passe, force_basic_auth = utilisateur is not None)
+  contenu = json.loads(reponse.read().decode('utf-8'))
+  if not isinstance(contenu, dict) or 'version' not in contenu:
+    raise ValueError("Réponse invalide : " + json.dumps(contenu)[:200])
+  return str(contenu['version'])
+
+# Définition de la fonction d'exécution du module
+def run_module():
+  # Définition des options
+  module_args = {
+    'config-file': { 'type': str, 'default': '/etc/gns3/gns3_server.conf', 'required': False },
+    'host': { 'type': str, 'required': False },
+    'port': { 'type': int, 'required': False },
+    'user': { 'type': str, 'required': False },
+    'password': { 'type': str, 'required': False, 'no_log': True },
+    'timeout': { 'type': int, 'default': 120, 'required': False },
+    'delay': { 'type': float, 'default': 0.5, 'required': False },
+    'max_delay': { 'type': float, 'default': 5, 'required': False },
+    'log-file': { 'type': str, 'default': '/var/log/gns3/gns3.log', 'required': False },
+    'log_lines': { 'type': int, 'default': 40, 'required': False }
+  }
+
+  # Initialisation du dictionnaire de sortie
+  result = dict(changed = False)
+
+  # Création de l'objet module
+  module = AnsibleModule(
+    argument_spec = module_args,
+    supports_check_mode = True
+  )
+  parametres = module.params
+
+  # Lecture de l'adresse d'écoute et de l'authentification dans la configuration
+  try:
+    serveur = lecture_ini(lecture_fichier(parametres['config-file'])).get('Server', dict())
+  except ErreurConfig as erreur:
+    module.fail_json(msg = "Lecture du fichier de configuration " + parametres['config-file'] + " impossible : " + str(erreur), **result)
+  hote = parametres['host'] if parametres['host'] is not None else serveur.get('host', '').strip()
+  try:
+    port = parametres['port'] if parametres['port'] is not None else int(serveur.get('port', 3080))
+  except ValueError:
+    module.fail_json(msg = "Port invalide dans le fichier de configuration : " + serveur.get('port'), **result)
+  protocole = serveur.get('protocol', 'http').strip() or 'http'
+  utilisateur = mot_de_passe = None
+  if parametres['user'] is not None or serveur.get('auth', 'False').strip().lower() in ('true', 'yes', 'on', '1'):
+    utilisateur = parametres['user'] if parametres['user'] is not None else serveur.get('user', '')
+    mot_de_passe = parametres['password'] if parametres['password'] is not None else serveur.get('password', '')
+  result['url'] = adresse_api(protocole, hote, port)
+
+  # Interrogation de l'API avec un intervalle croissant entre les tentatives
+  debut = time.monotonic()
+  limite = debut + parametres['timeout']
+  intervalle = max(parametres['delay'], 0.05)
+  tentatives = 0
+  erreur = None
+  while True:
+    tentatives += 1
+    try:
+      result['version'] = interrogation(result['url'], utilisateur, mot_de_passe, max(1, min(10, limite - time.monotonic())))
+      break
+    except Exception as exception:
+      erreur = str(exception)
+      if getattr(exception, 'code', None) == 401:
+        result.update(temps_pret = round(time.monotonic() - debut, 2), tentatives = tentatives, erreur = erreur)
+        module.fail_json(msg = "Authentification refusée par gns3server (" + result['url'] + ")", **result)
+    restant = limite - time.monotonic()
+    if restant <= 0:
+      result.update(temps_pret = round(time.monotonic() - debut, 2), tentatives = tentatives, erreur = erreur,
+                    journal = fin_journal(parametres['log-file'], parametres['log_lines']))
+      module.fail_json(msg = "gns3server indisponible après " + str(parametres['timeout']) + " secondes (" + result['url'] + ") : " + erreur, **result)
+    time.sleep(min(intervalle, restant))
+    intervalle = min(intervalle * 2, max(parametres['max_delay'], parametres['delay']))
+
+  result['temps_pret'] = round(time.monotonic() - debut, 2)
+  result['tentatives'] = tentatives
+
+  # Fin d'exécution normale
+  module.exit_json(**result)
+
+# Definition de la fonction principale
+def main():
+  run_module()
+
+# Execution du programme
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*
+# Module d'inventaire des composants GNS3 VM SERVER installés sur la cible
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: gns3vm_facts
+version_added: "1.0"
+short_description: Inventaire des composants GNS3 VM installés.
+description:
+  - Détection en une seule exécution de tous les composants d'un serveur GNS3 VM
+    (ubridge, dynamips, vpcs, gns3server, docker, compatibilité 32 bits IOU).
+  - Pour chaque composant sont retournés la version, l'empreinte SHA-256 du binaire,
+    ses capacités (setcap) et la version enregistrée par le cache de binaires.
+  - La version et l'empreinte sont conservées en cache tant que l'inode, la taille et la date
+    de modification du binaire ne changent pas.
+options:
+  components:
+    description:
+      - Liste de composants séparés par des virgules, tous les composants par défaut.
+    type: str
+    required: False
+  expected:
+    description:
+      - Version attendue par composant, comparée à la version enregistrée par le cache de binaires
+        puis à la version détectée, afin de déterminer l'action à réaliser.
+    type: dict
+    required: False
+  paths:
+    description:
+      - Chemin du fichier de chaque composant, remplace le chemin par défaut
+        (par exemple C(gns3server) installé dans un environnement virtuel).
+    type: dict
+    required: False
+  hash:
+    description:
+      - Calcul de l'empreinte SHA-256 des binaires.
+    type: bool
+    default: True
+    required: False
+  cache:
+    description:
+      - Fichier de cache des versions et empreintes des binaires.
+      - Une chaîne vide désactive le cache.
+    type: str
+    default: "/var/cache/gns3vm/gns3vm_facts.json"
+    required: False
+  root:
+    description:
+      - Racine du système analysé, permet de travailler sur une arborescence de test.
+      - Le cache n'est pas utilisé si la racine n'est pas C(/).
+    type: str
+    default: "/"
+    required: False
+author:
+  - Pascal MIRALLES (@pamioc)
+notes:
+  - Support du mode de vérification C(check_mode), le cache n'est alors pas modifié.
+seealso:
+
+'''
+
+EXAMPLES = r'''
+- name: "Inventaire de tous les composants"
+  gns3vm_facts:
+
+- name: "Inventaire de ubridge et dynamips avec détection de mise à jour"
+  gns3vm_facts:
+    components: "ubridge,dynamips"
+    expected:
+      ubridge: "0.9.18"
+
+- name: "Installation de vpcs si nécessaire"
+  ansible.builtin.include_tasks: install-vpcs.yml
+  when: gns3vm_composants.vpcs.action != 'aucune'
+
+'''
+
+RETURN = r'''
+ansible_facts:
+  description: Inventaire des composants.
+  returned: toujours
+  type: complex
+  contains:
+    gns3vm_composants:
+      description: Etat de chaque composant demandé.
+      type: dict
+      sample: {
+        "ubridge": {
+          "chemin": "/usr/local/bin/ubridge",
+          "installe": true,
+          "version": "0.9.18",
+          "sha256": "5f1c0d0c8cf1b8b3f6c2ad1d2e4b1d7e0c0a9b8f7e6d5c4b3a29180706050403",
+          "capacites": "cap_net_admin,cap_net_raw=ep",
+          "capacites_ok": true,
+          "cle": "ubridge-5c1b2a3d4e5f-x86_64-debian10",
+          "action": "aucune"
+        },
+        "docker": {
+          "chemin": "/usr/bin/dockerd",
+          "installe": false,
+          "version": null,
+          "sha256": null,
+          "capacites": "",
+          "capacites_ok": true,
+          "cle": null,
+          "action": "installation"
+        }
+      }
+
+cache:
+  description: Liste des composants dont la version et l'empreinte ont été lues depuis le cache.
+  returned: toujours
+  type: list
+  sample: [ "ubridge", "dynamips" ]
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+
+# Chargement des modules necessaires
+import os
+import re
+import json
+import struct
+import hashlib
+import tempfile
+
+# Composants détectés : binaire, arguments d'affichage de la version ou paquet dpkg, capacités requises
+COMPOSANTS = {
+  'ubridge': {
+    'chemin': '/usr/local/bin/ubridge',
+    'arguments': ['-v'],
+    'capacites': ['cap_net_admin', 'cap_net_raw']
+  },
+  'dynamips': {
+    'chemin': '/usr/local/bin/dynamips',
+    'arguments': ['--help']
+  },
+  'vpcs': {
+    'chemin': '/usr/local/bin/vpcs',
+    'arguments': ['-v']
+  },
+  'gns3server': {
+    'chemin': '/usr/local/bin/gns3server',
+    'arguments': ['--version']
+  },
+  'docker': {
+    'chemin': '/usr/bin/dockerd',
+    'arguments': ['--version']
+  },
+  'iou': {
+    'chemin': '/usr/lib/i386-linux-gnu/libcrypto.so.1.1',
+    'paquet': ('libssl1.1', 'i386')
+  }
+}
+
+RE_VERSION = re.compile(r'(?:version\s+)?v?(\d+\.\d+(?:\.\d+)?(?:[-.\w]*\w)?)', re.IGNORECASE)
+DELAI_VERSION = 10
+REPERTOIRE_VERSIONS = '/var/lib/gns3vm/versions'
+DPKG_STATUS = '/var/lib/dpkg/status'
+
+# Noms des capacités Linux par numéro
+CAPACITES = [
+  'cap_chown', 'cap_dac_override', 'cap_dac_read_search', 'cap_fowner', 'cap_fsetid', 'cap_kill',
+  'cap_setgid', 'cap_setuid', 'cap_setpcap', 'cap_linux_immutable', 'cap_net_bind_service',
+  'cap_net_broadcast', 'cap_net_admin', 'cap_net_raw', 'cap_ipc_lock', 'cap_ipc_owner', 'cap_sys_module',
+  'cap_sys_rawio', 'cap_sys_chroot', 'cap_sys_ptrace', 'cap_sys_pacct', 'cap_sys_admin', 'cap_sys_boot',
+  'cap_sys_nice', 'cap_sys_resource', 'cap_sys_time', 'cap_sys_tty_config', 'cap_mknod', 'cap_lease',
+  'cap_audit_write', 'cap_audit_control', 'cap_setfcap', 'cap_mac_override', 'cap_mac_admin', 'cap_syslog',
+  'cap_wake_alarm', 'cap_block_suspend', 'cap_audit_read', 'cap_perfmon', 'cap_bpf', 'cap_checkpoint_restore'
+]
+VFS_CAP_FLAGS_EFFECTIVE = 0x000001
+
+# Construction d'un chemin relatif à la racine du système analysé
+def chemin(racine, fichier):
+  return os.path.join(racine, fichier.lstrip('/'))
+
+# Lecture du contenu d'un fichier court
+def lecture_valeur(fichier, defaut = None):
+  try:
+    with open(fichier, 'r') as f:
+      return f.read().strip()
+  except (IOError, OSError):
+    return defaut
+
+# Lecture du cache des versions et empreintes
+def lecture_cache(fichier):
+  if not fichier:
+    return dict()
+  try:
+    with open(fichier, 'r') as f:
+      cache = json.load(f)
+  except (IOError, OSError, ValueError):
+    return dict()
+  return cache if isinstance(cache, dict) else dict()
+
+# Enregistrement atomique du cache
+def ecriture_cache(fichier, cache):
+  try:
+    repertoire = os.path.dirname(fichier)
+    if not os.path.isdir(repertoire):
+      os.makedirs(repertoire, 0o755)
+    descripteur, temporaire = tempfile.mkstemp(dir = repertoire, prefix = '.gns3vm_facts.')
+    with os.fdopen(descripteur, 'w') as f:
+      json.dump(cache, f)
+    os.rename(temporaire, fichier)
+    return True
+  except (IOError, OSError):
+    return False
+
+# Clé de validité du cache d'un binaire
+def cle_fichier(infos):
+  return [infos.st_ino, infos.st_size, infos.st_mtime_ns]
+
+# Empreinte SHA-256 d'un fichier
+def empreinte(fichier):
+  somme = hashlib.sha256()
+  with open(fichier, 'rb') as f:
+    for bloc in iter(lambda: f.read(1024 * 1024), b''):
+      somme.update(bloc)
+  return somme.hexdigest()
+
+# Version affichée par un binaire, son exécution est limitée à DELAI_VERSION secondes par la commande timeout
+def version_binaire(module, fichier, arguments):
+  if not os.access(fichier, os.X_OK):
+    return None
+  commande = [fichier] + arguments
+  delai = module.get_bin_path('timeout')
+  if delai:
+    commande = [delai, str(DELAI_VERSION)] + commande
+  rc, sortie, erreur = module.run_command(commande, errors = 'surrogate_or_replace')
+  resultat = RE_VERSION.search(sortie + erreur)
+  return resultat.group(1) if resultat else None
+
+# Version d'un paquet installé selon la base dpkg
+def version_paquet(racine, nom, architecture):
+  try:
+    with open(chemin(racine, DPKG_STATUS), 'r', encoding = 'utf-8', errors = 'replace') as f:
+      paragraphes = f.read().split('\n\n')
+  except (IOError, OSError):
+    return None
+  for paragraphe in paragraphes:
+    champs = dict()
+    for ligne in paragraphe.splitlines():
+      if ':' in ligne and not ligne.startswith(' '):
+        cle, valeur = ligne.split(':', 1)
+        champs[cle] = valeur.strip()
+    if champs.get('Package') == nom and champs.get('Architecture') == architecture \
+       and champs.get('Status', '').endswith(' installed'):
+      return champs.get('Version')
+  return None
+
+# Décodage de l'attribut étendu security.capability au format setcap
+def capacites_fichier(fichier):
+  try:
+    donnees = os.getxattr(fichier, 'security.capability')
+  except (AttributeError, IOError, OSError):
+    return ''
+  if len(donnees) < 12:
+    return ''
+  magic = struct.unpack_from('<I', donnees)[0]
+  mots = (len(donnees) - 4) // 8
+  permises, heritables = 0, 0
+  for indice in range(min(mots, 2)):
+    permis, herite = struct.unpack_from('<II', donnees, 4 + indice * 8)
+    permises |= permis << (32 * indice)
+    heritables |= herite << (32 * indice)
+  groupes = dict()
+  for numero, nom in enumerate(CAPACITES):
+    drapeaux = ''
+    if permises & (1 << numero):
+      drapeaux += 'e' if magic & VFS_CAP_FLAGS_EFFECTIVE else ''
+      drapeaux += 'i' if heritables & (1 << numero) else ''
+      drapeaux += 'p'
+    elif heritables & (1 << numero):
+      drapeaux = 'i'
+    if drapeaux:
+      groupes.setdefault(drapeaux, []).append(nom)
+  return ' '.join(','.join(noms) + '=' + drapeaux for drapeaux, noms in sorted(groupes.items()))
+
+# Vérification de la présence des capacités requises (effectives et permises)
+def verif_capacites(capacites, requises):
+  presentes = set()
+  for groupe in capacites.split():
+    noms, drapeaux = groupe.split('=', 1)
+    if 'e' in drapeaux and 'p' in drapeaux:
+      presentes.update(noms.split(','))
+  return set(requises).issubset(presentes)
+
+# Action à réaliser selon l'état du composant et la version attendue
+def action_composant(composant, attendue):
+  if not composant['installe']:
+    return 'installation'
+  if attendue and attendue not in (composant['cle'], composant['version']):
+    return 'mise_a_jour'
+  return 'aucune'
+
+# Détection d'un composant
+def sonde_composant(module, racine, nom, cache, calcul_empreinte, attendue, chemin_composant = None):
+  description = dict(COMPOSANTS[nom])
+  if chemin_composant:
+    description['chemin'] = chemin_composant
+  fichier = chemin(racine, description['chemin'])
+  composant = dict(chemin = description['chemin'], installe = False, version = None, sha256 = None,
+                   capacites = '', capacites_ok = True, cle = None)
+  composant['cle'] = lecture_valeur(chemin(racine, os.path.join(REPERTOIRE_VERSIONS, nom)))
+  try:
+    infos = os.stat(fichier)
+  except (IOError, OSError):
+    infos = None
+  if infos is not None:
+    composant['installe'] = True
+    memoire = cache.get(nom, dict())
+    if memoire.get('chemin') == description['chemin'] and memoire.get('fichier') == cle_fichier(infos) \
+       and (memoire.get('sha256') or not calcul_empreinte):
+      composant['version'] = memoire.get('version')
+      composant['sha256'] = memoire.get('sha256') if calcul_empreinte else None
+      lu = True
+    else:
+      if 'paquet' in description:
+        composant['version'] = version_paquet(racine, *description['paquet'])
+      else:
+        composant['version'] = version_binaire(module, fichier, description['arguments'])
+      if calcul_empreinte:
+        composant['sha256'] = empreinte(fichier)
+      cache[nom] = dict(chemin = description['chemin'], fichier = cle_fichier(infos),
+                        version = composant['version'], sha256 = composant['sha256'])
+      lu = False
+    # Les capacités sont relues à chaque exécution (setcap ne modifie pas la date de modification)
+    composant['capacites'] = capacites_fichier(fichier)
+    composant['capacites_ok'] = verif_capacites(composant['capacites'], description.get('capacites', []))
+  else:
+    cache.pop(nom, None)
+    lu = False
+  composant['action'] = action_composant(composant, attendue)
+  return composant, lu
+
+def run_module():
+  # Définition des options
+  module_args = dict(
+    components = dict(type = str, required = False),
+    expected = dict(type = dict, required = False),
+    paths = dict(type = dict, required = False),
+    hash = dict(type = bool, default = True, required = False),
+    cache = dict(type = str, default = '/var/cache/gns3vm/gns3vm_facts.json', required = False),
+    root = dict(type = str, default = '/', required = False)
+  )
+
+  # Initialisation du dictionnaire de sortie
+  result = dict(changed = False, cache = [])
+
+  # Création de l'objet module
+  module = AnsibleModule(
+    argument_spec = module_args,
+    supports_check_mode = True
+  )
+
+  # Composants demandés
+  if module.params['components']:
+    noms = [nom.strip() for nom in module.params['components'].split(',') if nom.strip()]
+  else:
+    noms = list(COMPOSANTS)
+  inconnus = [nom for nom in noms if nom not in COMPOSANTS]
+  if inconnus:
+    module.fail_json(msg = "Composant inconnu : " + ", ".join(inconnus), **result)
+  attendues = module.params['expected'] or dict()
+  inconnus = [nom for nom in attendues if nom not in COMPOSANTS]
+  if inconnus:
+    module.fail_json(msg = "Composant inconnu dans expected : " + ", ".join(inconnus), **result)
+  chemins = module.params['paths'] or dict()
+  inconnus = [nom for nom in chemins if nom not in COMPOSANTS]
+  if inconnus:
+    module.fail_json(msg = "Composant inconnu dans paths : " + ", ".join(inconnus), **result)
+
+  # Lecture du cache
+  racine = module.params['root']
+  if racine != '/':
+    module.params['cache'] = ''
+  cache = lecture_cache(module.params['cache'])
+  reference = json.dumps(cache, sort_keys = True)
+
+  # Détection des composants
+  composants = dict()
+  for nom in noms:
+    try:
+      composants[nom], lu = sonde_composant(module, racine, nom, cache, module.params['hash'], attendues.get(nom), chemins.get(nom))
+    except (IOError, OSError) as erreur:
+      module.fail_json(msg = "Détection du composant " + nom + " impossible : " + str(erreur), **result)
+    if lu:
+      result['cache'].append(nom)
+
+  # Le cache n'est pas modifié en mode de vérification
+  if module.params['cache'] and not module.check_mode and json.dumps(cache, sort_keys = True) != reference:
+    ecriture_cache(module.params['cache'], cache)
+
+  result['ansible_facts'] = { 'gns3vm_composants': composants }
+
+  # Fin d'exécution normale
+  module.exit_json(**result)
+
+# Définition de fonction principale
+def main():
+  run_module()
+
+# Execution du programme
+if __name__ == '__main__':
+  main()
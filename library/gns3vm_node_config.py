@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*
+# Module de configuration agrégée d'un noeud GNS3 VM SERVER (gns3server, docker et noyau)
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: gns3vm_node_config
+version_added: "1.0"
+short_description: Configuration de gns3server, docker et du noyau en une seule exécution.
+description:
+  - Applique en une seule exécution du module la configuration de gns3-server, du démon docker
+    et des paramètres noyau (sysctl) d'un noeud GNS3 VM.
+  - Chaque section accepte les mêmes options que le module correspondant
+    (M(gns3server_daemon_config), M(docker_daemon_config)) et retourne son propre indicateur C(changed)
+    afin de notifier sélectivement les gestionnaires.
+  - Les sections sont appliquées dans l'ordre noyau, docker puis gns3server. Une section absente n'est pas appliquée.
+options:
+  gns3server:
+    description:
+      - Options de configuration de gns3-server, identiques à celles du module M(gns3server_daemon_config).
+    type: dict
+    required: False
+  docker:
+    description:
+      - Options de configuration du démon docker, identiques à celles du module M(docker_daemon_config).
+    type: dict
+    required: False
+  kernel:
+    description:
+      - Paramètres noyau.
+    type: dict
+    required: False
+    suboptions:
+      sysctl:
+        description:
+          - Dictionnaire des paramètres sysctl (par exemple C(net.ipv4.ip_forward)).
+        type: dict
+        required: True
+      config-file:
+        description:
+          - Fichier de configuration persistante dédié, il contient exactement les paramètres demandés.
+        type: str
+        default: "/etc/sysctl.d/90-gns3vm.conf"
+      apply:
+        description:
+          - Application immédiate des valeurs différentes des valeurs actives.
+        type: bool
+        default: True
+      debug:
+        description:
+          - Ajout des paramètres à la valeur de retour de la section.
+        type: bool
+        default: False
+author:
+  - Pascal MIRALLES (@pamioc)
+notes:
+  - Support des modes C(check_mode) et C(diff).
+seealso:
+  - module: gns3server_daemon_config
+  - module: docker_daemon_config
+
+'''
+
+EXAMPLES = r'''
+- name: "Configuration du noeud"
+  gns3vm_node_config:
+    gns3server:
+      config-file: /etc/gns3/gns3_server.conf
+      interface: auto
+      data-root: /opt/gns3
+      force: yes
+    docker:
+      data-root: /opt/docker
+      live-restore: yes
+      force: yes
+    kernel:
+      sysctl:
+        net.ipv4.ip_forward: 1
+  register: config_noeud
+
+- name: "Redémarrage docker si sa configuration a changé"
+  ansible.builtin.set_fact:
+    docker_config: "{{ config_noeud.sections.docker }}"
+  changed_when: config_noeud.sections.docker.changed
+  notify: "Configuration docker modifiée"
+
+'''
+
+RETURN = r'''
+sections:
+  description: Résultat de chaque section appliquée, identique au résultat du module correspondant.
+  returned: toujours
+  type: dict
+  sample: {
+    "kernel": {
+      "changed": false,
+      "valeurs": { "net.ipv4.ip_forward": { "avant": "1", "apres": "1" } }
+    },
+    "docker": {
+      "changed": true
+    },
+    "gns3server": {
+      "changed": false,
+      "instances": [
+        { "id": 0, "service": "gns3", "config-file": "/etc/gns3/gns3_server.conf", "port": 3080, "projects_path": null, "numa_node": null, "cpus": null }
+      ]
+    }
+  }
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.gns3vm_config import ErreurConfig
+from ansible.module_utils import gns3vm_gns3server, gns3vm_docker, gns3vm_noyau
+
+# Sections dans l'ordre d'application
+SECTIONS = (
+  ('kernel', gns3vm_noyau),
+  ('docker', gns3vm_docker),
+  ('gns3server', gns3vm_gns3server)
+)
+
+# Définition de la fonction d'exécution du module
+def run_module():
+  # Définition des options, chaque section reprend les options du module correspondant
+  module_args = dict((nom, { 'type': dict, 'required': False, 'options': configuration.ARGUMENTS }) for nom, configuration in SECTIONS)
+
+  # Initialisation du dictionnaire de sortie
+  result = dict(changed = False, sections = dict())
+
+  # Création de l'objet module
+  module = AnsibleModule(
+    argument_spec = module_args,
+    supports_check_mode = True
+  )
+
+  # Application des sections demandées
+  if module._diff:
+    result['diff'] = list()
+  for nom, configuration in SECTIONS:
+    if module.params[nom] is None:
+      continue
+    section = dict(changed = False)
+    result['sections'][nom] = section
+    try:
+      configuration.application(module, module.params[nom], section)
+    except ErreurConfig as erreur:
+      module.fail_json(msg = nom + " : " + str(erreur), **result)
+    result['changed'] = result['changed'] or section['changed']
+    if module._diff:
+      result['diff'].extend(section.pop('diff', list()))
+
+  # Fin d'exécution normale
+  module.exit_json(**result)
+
+# Definition de la fonction principale
+def main():
+  run_module()
+
+# Execution du programme
+if __name__ == '__main__':
+  main()
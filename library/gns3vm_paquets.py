@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*
+# Module d'installation consolidée des paquets de tous les rôles GNS3 VM SERVER
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: gns3vm_paquets
+version_added: "1.0"
+short_description: Installation consolidée des paquets des rôles.
+description:
+  - Construit l'union des paquets apt des rôles demandés et les installe en une seule transaction apt.
+  - L'état des paquets est lu en une seule requête dpkg, le cache apt est rafraîchi au plus une fois
+    et uniquement si des paquets sont à installer.
+  - Les architectures étrangères des paquets qualifiés (par exemple C(libssl1.1:i386)) sont ajoutées automatiquement.
+options:
+  plan:
+    description:
+      - Dictionnaire des paquets par rôle.
+    type: dict
+    required: True
+  update_cache:
+    description:
+      - Rafraîchissement du cache apt avant l'installation.
+    type: bool
+    default: True
+    required: False
+  cache_valid_time:
+    description:
+      - Age maximum en secondes du cache apt au-delà duquel il est rafraîchi.
+    type: int
+    default: 3600
+    required: False
+author:
+  - Pascal MIRALLES (@pamioc)
+notes:
+  - Support du mode de vérification C(check_mode), le plan est alors retourné sans installation.
+seealso:
+
+'''
+
+EXAMPLES = r'''
+- name: "Installation des paquets de tous les rôles"
+  gns3vm_paquets:
+    plan:
+      pre-req: [ "gcc", "make", "git" ]
+      qemu: [ "qemu-kvm", "qemu-utils" ]
+      iou: [ "libssl1.1:i386" ]
+
+- name: "Installation des paquets Qemu si nécessaire"
+  ansible.builtin.apt:
+    name: qemu-kvm,qemu-utils
+  when: not (gns3vm_paquets.roles.qemu.present | default(false))
+
+'''
+
+RETURN = r'''
+ansible_facts:
+  description: Plan d'installation des paquets.
+  returned: toujours
+  type: complex
+  contains:
+    gns3vm_paquets:
+      description:
+        - Etat des paquets par rôle, paquets installés et durée de chaque phase en secondes.
+        - La durée d'installation de chaque rôle est estimée au prorata de la taille installée de ses paquets manquants.
+      type: dict
+      sample: {
+        "roles": {
+          "pre-req": { "paquets": [ "gcc", "make", "git" ], "manquants": [], "present": true, "duree": 0.0 },
+          "iou": { "paquets": [ "libssl1.1:i386" ], "manquants": [ "libssl1.1:i386" ], "present": true, "duree": 11.8 }
+        },
+        "architectures": [ "i386" ],
+        "installes": [ "libssl1.1:i386" ],
+        "cache_rafraichi": true,
+        "phases": { "architectures": 0.01, "etat": 0.04, "cache": 6.2, "installation": 11.8 }
+      }
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+
+# Chargement des modules necessaires
+import os
+import time
+
+# Fichier dont la date de modification indique le dernier rafraîchissement du cache apt
+CACHE_APT = '/var/cache/apt/pkgcache.bin'
+
+# Environnement des commandes apt
+ENVIRONNEMENT_APT = { 'DEBIAN_FRONTEND': 'noninteractive', 'LC_ALL': 'C' }
+
+# Séparation du nom et de l'architecture d'un paquet
+def nom_architecture(paquet):
+  nom, sep, architecture = paquet.partition(':')
+  return nom, architecture or None
+
+# Lecture des architectures native et étrangères de dpkg
+def lecture_architectures(module, dpkg):
+  rc, native, err = module.run_command([dpkg, '--print-architecture'])
+  if rc != 0:
+    module.fail_json(msg = "Lecture de l'architecture dpkg impossible : " + err.strip())
+  rc, etrangeres, err = module.run_command([dpkg, '--print-foreign-architectures'])
+  return native.strip(), etrangeres.split()
+
+# Lecture en une seule requête de l'état de tous les paquets demandés
+def paquets_installes(module, paquets, native):
+  dpkg_query = module.get_bin_path('dpkg-query', required = True)
+  noms = sorted(set(nom_architecture(paquet)[0] for paquet in paquets))
+  rc, out, err = module.run_command([dpkg_query, '-W', '-f', '${Package} ${Architecture} ${db:Status-Abbrev}\n'] + noms)
+  installes = set()
+  for ligne in out.splitlines():
+    champs = ligne.split()
+    if len(champs) >= 3 and champs[2].startswith('ii'):
+      installes.add((champs[0], champs[1]))
+  presents = set()
+  for paquet in paquets:
+    nom, architecture = nom_architecture(paquet)
+    architectures = (architecture,) if architecture else (native, 'all')
+    if any((nom, arch) in installes for arch in architectures):
+      presents.add(paquet)
+  return presents
+
+# Taille installée en Ko des paquets, lue en une seule requête
+def tailles_installees(module, paquets, native):
+  dpkg_query = module.get_bin_path('dpkg-query', required = True)
+  noms = sorted(set(nom_architecture(paquet)[0] for paquet in paquets))
+  rc, out, err = module.run_command([dpkg_query, '-W', '-f', '${Package} ${Architecture} ${Installed-Size}\n'] + noms)
+  tailles = dict()
+  for ligne in out.splitlines():
+    champs = ligne.split()
+    if len(champs) >= 3 and champs[2].isdigit():
+      tailles[(champs[0], champs[1])] = int(champs[2])
+  resultat = dict()
+  for paquet in paquets:
+    nom, architecture = nom_architecture(paquet)
+    architectures = (architecture,) if architecture else (native, 'all')
+    resultat[paquet] = next((tailles[(nom, arch)] for arch in architectures if (nom, arch) in tailles), 0)
+  return resultat
+
+# Répartition de la durée d'installation entre les rôles au prorata de la taille installée de leurs paquets manquants,
+# un paquet demandé par plusieurs rôles est partagé entre eux
+def durees_roles(plan, manquants, tailles, duree):
+  demandeurs = dict()
+  for role, liste in plan.items():
+    for paquet in set(liste) & set(manquants):
+      demandeurs[paquet] = demandeurs.get(paquet, 0) + 1
+  parts = dict((role, sum(float(tailles.get(paquet, 0)) / demandeurs[paquet] for paquet in set(liste) & set(manquants)))
+               for role, liste in plan.items())
+  total = sum(parts.values())
+  if total == 0:
+    # Tailles inconnues : répartition au nombre de paquets
+    parts = dict((role, sum(1.0 / demandeurs[paquet] for paquet in set(liste) & set(manquants))) for role, liste in plan.items())
+    total = sum(parts.values())
+  return dict((role, round(duree * part / total, 2) if total else 0.0) for role, part in parts.items())
+
+def run_module():
+  # Définition des options
+  module_args = dict(
+    plan = dict(type = dict, required = True),
+    update_cache = dict(type = bool, default = True, required = False),
+    cache_valid_time = dict(type = int, default = 3600, required = False)
+  )
+
+  # Initialisation du dictionnaire de sortie
+  result = dict(changed = False)
+
+  # Création de l'objet module
+  module = AnsibleModule(
+    argument_spec = module_args,
+    supports_check_mode = True
+  )
+
+  # Lecture du plan, une liste peut être une chaîne de paquets séparés par des virgules
+  plan = dict()
+  for role, paquets in module.params['plan'].items():
+    if isinstance(paquets, str):
+      paquets = paquets.split(',')
+    if not isinstance(paquets, list):
+      module.fail_json(msg = "La liste des paquets du rôle " + role + " est invalide", **result)
+    plan[role] = [str(paquet).strip() for paquet in paquets if str(paquet).strip()]
+  paquets = sorted(set(paquet for liste in plan.values() for paquet in liste))
+  phases = dict()
+  dpkg = module.get_bin_path('dpkg', required = True)
+  apt_get = module.get_bin_path('apt-get', required = True)
+
+  # Ajout des architectures étrangères des paquets qualifiés
+  debut = time.monotonic()
+  native, etrangeres = lecture_architectures(module, dpkg)
+  architectures = sorted(set(nom_architecture(paquet)[1] for paquet in paquets) - set([None, native, 'all']))
+  ajoutees = [architecture for architecture in architectures if architecture not in etrangeres]
+  if ajoutees:
+    result['changed'] = True
+    if not module.check_mode:
+      for architecture in ajoutees:
+        rc, out, err = module.run_command([dpkg, '--add-architecture', architecture])
+        if rc != 0:
+          module.fail_json(msg = "Ajout de l'architecture " + architecture + " impossible : " + err.strip(), **result)
+  phases['architectures'] = round(time.monotonic() - debut, 2)
+
+  # Etat des paquets, les paquets d'une architecture non encore ajoutée sont manquants
+  debut = time.monotonic()
+  presents = paquets_installes(module, paquets, native)
+  manquants = [paquet for paquet in paquets if paquet not in presents]
+  phases['etat'] = round(time.monotonic() - debut, 2)
+
+  # Rafraîchissement unique du cache apt, uniquement si des paquets sont à installer
+  # (toujours après l'ajout d'une architecture)
+  cache_rafraichi = False
+  if manquants and module.params['update_cache']:
+    try:
+      age = time.time() - os.path.getmtime(CACHE_APT)
+    except OSError:
+      age = None
+    if ajoutees or age is None or age > module.params['cache_valid_time']:
+      debut = time.monotonic()
+      if not module.check_mode:
+        rc, out, err = module.run_command([apt_get, 'update', '-q'], environ_update = ENVIRONNEMENT_APT)
+        if rc != 0:
+          module.fail_json(msg = "Rafraîchissement du cache apt impossible : " + err.strip(), **result)
+      cache_rafraichi = True
+      phases['cache'] = round(time.monotonic() - debut, 2)
+
+  # Installation de tous les paquets manquants en une seule transaction
+  if manquants:
+    result['changed'] = True
+    debut = time.monotonic()
+    if not module.check_mode:
+      rc, out, err = module.run_command([apt_get, 'install', '-y', '-q',
+                                         '-o', 'Dpkg::Options::=--force-confdef', '-o', 'Dpkg::Options::=--force-confold'] + manquants,
+                                        environ_update = ENVIRONNEMENT_APT)
+      if rc != 0:
+        module.fail_json(msg = "Installation des paquets impossible : " + (err.strip() or out.strip()[-2000:]), manquants = manquants, **result)
+      presents.update(manquants)
+    phases['installation'] = round(time.monotonic() - debut, 2)
+
+  # Durée d'installation estimée par rôle, la transaction apt étant unique
+  durees = dict((role, 0.0) for role in plan)
+  if manquants and not module.check_mode:
+    durees = durees_roles(plan, manquants, tailles_installees(module, manquants, native), phases['installation'])
+
+  # Etat par rôle, un rôle est présent si tous ses paquets sont installés
+  roles = dict()
+  for role, liste in plan.items():
+    roles[role] = {
+      'paquets': liste,
+      'manquants': [paquet for paquet in liste if paquet in manquants],
+      'present': all(paquet in presents for paquet in liste),
+      'duree': durees[role]
+    }
+
+  result['ansible_facts'] = { 'gns3vm_paquets': {
+    'roles': roles,
+    'architectures': architectures,
+    'installes': manquants if not module.check_mode else [],
+    'cache_rafraichi': cache_rafraichi,
+    'phases': phases
+  } }
+
+  # Fin d'exécution normale
+  module.exit_json(**result)
+
+# Définition de fonction principale
+def main():
+  run_module()
+
+# Execution du programme
+if __name__ == '__main__':
+  main()
@@ -34,15 +34,148 @@ options:
     type: bool
     default: True
     required: False
+  cache:
+    description:
+      - Fichier de cache des informations matérielles collectées.
+      - Le cache est valide tant que l'identifiant de démarrage du noyau (boot_id) ne change pas.
+      - Une chaîne vide désactive le cache.
+    type: str
+    default: "/var/cache/gns3vm/verif_sys.json"
+    required: False
+  kvm_report:
+    description:
+      - Interrogation du périphérique KVM (ioctl KVM_GET_API_VERSION et KVM_CHECK_EXTENSION)
+        et estimation du nombre de noeuds Qemu supportés par la cible.
+    type: bool
+    default: False
+    required: False
+  vcpus_noeud:
+    description:
+      - (kvm_report) Nombre de vCPU alloués à chaque noeud Qemu.
+    type: int
+    default: 1
+    required: False
+  ratio_vcpu:
+    description:
+      - (kvm_report) Nombre de vCPU alloués par processeur logique de la cible.
+    type: int
+    default: 4
+    required: False
+  memoire_noeud:
+    description:
+      - (kvm_report) Mémoire en Mo allouée à chaque noeud Qemu.
+    type: int
+    default: 512
+    required: False
+  tun_report:
+    description:
+      - Analyse du chemin de données réseau de Qemu (vhost-net, TAP multiqueue)
+        et des droits d'accès de l'utilisateur C(tun_user) aux périphériques.
+    type: bool
+    default: False
+    required: False
+  tun_user:
+    description:
+      - (tun_report) Utilisateur dont les droits d'accès aux périphériques sont vérifiés.
+    type: str
+    default: gns3
+    required: False
+  vhost_net_load:
+    description:
+      - Chargement du module noyau vhost_net et chargement automatique au démarrage
+        (C(/etc/modules-load.d/vhost_net.conf)).
+      - Si C(root) n'est pas C(/), seul le fichier de chargement au démarrage de l'arborescence est écrit.
+    type: bool
+    default: False
+    required: False
+  vhost_net_require:
+    description:
+      - Echec si le périphérique C(/dev/vhost-net) est absent ou si le module vhost_net n'est pas chargé.
+    type: bool
+    default: False
+    required: False
+  storage_bench:
+    description:
+      - Liste de répertoires séparés par des virgules dont les performances de stockage sont mesurées.
+      - Les mesures (séquentielles et aléatoires 4K en lecture et écriture) utilisent C(O_DIRECT)
+        sur un fichier temporaire créé dans le répertoire, ou son premier parent existant.
+      - Un seul répertoire est mesuré par système de fichiers.
+      - Aucune mesure n'est réalisée en mode de vérification.
+    type: str
+    required: False
+  storage_bench_size:
+    description:
+      - (storage_bench) Taille maximale en Mo du fichier de test.
+    type: int
+    default: 256
+    required: False
+  storage_bench_time:
+    description:
+      - (storage_bench) Durée maximale en secondes des mesures de chaque répertoire.
+    type: int
+    default: 20
+    required: False
+  storage_thresholds:
+    description:
+      - (storage_bench) Seuils minimum des mesures.
+      - Clés acceptées C(seq_ecriture_mbs), C(seq_lecture_mbs), C(alea_lecture_iops), C(alea_ecriture_iops).
+    type: dict
+    required: False
+  storage_thresholds_action:
+    description:
+      - (storage_bench) Action lorsqu'un seuil n'est pas atteint, avertissement ou échec.
+      - Un répertoire sans espace libre suffisant pour le fichier de test n'est pas mesuré avec C(warn) et provoque l'échec avec C(fail).
+    type: str
+    choices: [ warn, fail ]
+    default: warn
+    required: False
+  root:
+    description:
+      - Racine du système analysé, permet de travailler sur une arborescence de test.
+      - Si le périphérique C(dev/kvm) de cette arborescence est un fichier régulier,
+        il est lu comme un document JSON contenant C(api_version) et C(extensions).
+      - Le cache n'est pas utilisé si la racine n'est pas C(/).
+    type: str
+    default: "/"
+    required: False
 author:
   - Pascal MIRALLES (@pamioc)
 notes:
-  - Support du mode de vérification C(check_mode).
+  - Support du mode de vérification C(check_mode), le cache n'est alors pas modifié.
 seealso:
 
 '''
 
 EXAMPLES = r'''
+- name: "Vérification de tous les périphériques et récupération des informations du processeur"
+  verif_sys:
+  register: verif
+
+- name: "Vérification de tous les périphériques sans utiliser de cache"
+  verif_sys:
+    cache: ""
+
+- name: "Vérification de vhost-net et des TAP multiqueue avec chargement persistant de vhost_net"
+  verif_sys:
+    tun_report: True
+    vhost_net_load: True
+    vhost_net_require: True
+
+- name: "Mesure des performances de stockage des données GNS3 et docker, échec sous 100 Mo/s ou 2000 IOPS"
+  verif_sys:
+    storage_bench: "/opt/gns3,/opt/docker"
+    storage_bench_size: 512
+    storage_thresholds:
+      seq_lecture_mbs: 100
+      alea_lecture_iops: 2000
+    storage_thresholds_action: fail
+
+- name: "Estimation du nombre de noeuds Qemu de 2 vCPU et 1 Go de mémoire"
+  verif_sys:
+    kvm_report: True
+    vcpus_noeud: 2
+    memoire_noeud: 1024
+
 - name: "Vérification des périphériques sauf le processeur"
   verif_sys:
     cpu: False
@@ -56,23 +189,495 @@ EXAMPLES = r'''
 '''
 
 RETURN = r'''
+ansible_facts:
+  description: Informations matérielles collectées sur la cible.
+  returned: toujours
+  type: complex
+  contains:
+    gns3vm_cpu:
+      description: Topologie et capacités de virtualisation du processeur.
+      type: dict
+      sample: {
+        "fabricant": "GenuineIntel",
+        "modele": "Intel(R) Xeon(R) Gold 6248 CPU @ 2.50GHz",
+        "vmx": true,
+        "svm": false,
+        "ept": true,
+        "npt": false,
+        "sockets": 2,
+        "coeurs": 40,
+        "threads": 80,
+        "noeuds_numa": [
+          { "id": 0, "cpus": "0-19,40-59", "nb_cpus": 40, "memoire_ko": 196608000 },
+          { "id": 1, "cpus": "20-39,60-79", "nb_cpus": 40, "memoire_ko": 196608000 }
+        ]
+      }
+
+    gns3vm_kvm:
+      description: Capacités du périphérique KVM et estimation de la capacité de la cible.
+      returned: option kvm_report
+      type: dict
+      sample: {
+        "api_version": 12,
+        "vcpus_recommandes": 240,
+        "vcpus_max": 288,
+        "vcpu_id_max": 1023,
+        "memslots": 509,
+        "irqchip": true,
+        "irq_routing": true,
+        "module": "kvm_intel",
+        "nested": true,
+        "memoire_mo": 385024,
+        "capacite": {
+          "noeuds_cpu": 320,
+          "noeuds_memoire": 346,
+          "noeuds_qemu": 320,
+          "limite": "cpu"
+        }
+      }
 
+    gns3vm_tun:
+      description: Etat du chemin de données réseau de Qemu.
+      returned: option tun_report
+      type: dict
+      sample: {
+        "tun": true,
+        "multiqueue": true,
+        "multiqueue_creation": true,
+        "vnet_hdr": true,
+        "vhost_net": {
+          "peripherique": true,
+          "module": true,
+          "persistant": true
+        },
+        "utilisateur": "gns3",
+        "acces": {
+          "/dev/kvm": true,
+          "/dev/net/tun": true,
+          "/dev/vhost-net": true
+        }
+      }
+
+    gns3vm_stockage:
+      description: Mesures des performances de stockage par répertoire demandé.
+      returned: option storage_bench
+      type: dict
+      sample: {
+        "/opt/gns3": {
+          "repertoire_mesure": "/opt",
+          "o_direct": true,
+          "taille_mo": 256,
+          "seq_ecriture_mbs": 1450.2,
+          "seq_lecture_mbs": 2650.8,
+          "alea_lecture_iops": 48211,
+          "alea_ecriture_iops": 39102
+        }
+      }
+
+cache:
+  description: Indique si les informations ont été lues depuis le cache.
+  returned: toujours
+  type: bool
+  sample: true
 '''
 
 from ansible.module_utils.basic import AnsibleModule  
+from ansible.module_utils.gns3vm_systeme import chemin, lecture_valeur, compte_cpulist, sonde_numa
 
 # Chargement des modules necessaires
 import os
+import re
+import json
+import tempfile
+
+# Lecture de l'identifiant de démarrage du noyau
+def lecture_boot_id(racine):
+  return lecture_valeur(chemin(racine, '/proc/sys/kernel/random/boot_id'))
+
+# Lecture du cache si il correspond au démarrage actuel du noyau
+def lecture_cache(fichier, boot_id):
+  if not fichier or boot_id is None:
+    return dict()
+  try:
+    with open(fichier, 'r') as f:
+      cache = json.load(f)
+  except (IOError, OSError, ValueError):
+    return dict()
+  if not isinstance(cache, dict) or cache.get('boot_id') != boot_id:
+    return dict()
+  return cache
+
+# Enregistrement atomique du cache
+def ecriture_cache(fichier, cache):
+  try:
+    repertoire = os.path.dirname(fichier)
+    if not os.path.isdir(repertoire):
+      os.makedirs(repertoire, 0o755)
+    descripteur, temporaire = tempfile.mkstemp(dir = repertoire, prefix = '.verif_sys.')
+    with os.fdopen(descripteur, 'w') as f:
+      json.dump(cache, f)
+    os.rename(temporaire, fichier)
+    return True
+  except (IOError, OSError):
+    return False
+
+# Numéros des requêtes ioctl et des extensions KVM (linux/kvm.h)
+KVM_API_VERSION = 12
+KVM_GET_API_VERSION = 0xAE00
+KVM_CHECK_EXTENSION = 0xAE03
+KVM_EXTENSIONS = {
+  'irqchip': 0,
+  'nr_vcpus': 9,
+  'nr_memslots': 10,
+  'irq_routing': 25,
+  'max_vcpus': 66,
+  'max_vcpu_id': 128
+}
+
+# Interrogation du périphérique KVM
+# Un fichier régulier est lu comme un jeu de données JSON de test
+def interroge_kvm(peripherique):
+  import stat
+  extensions = dict()
+  if stat.S_ISCHR(os.stat(peripherique).st_mode):
+    import fcntl
+    fd = os.open(peripherique, os.O_RDWR | os.O_CLOEXEC)
+    try:
+      api_version = fcntl.ioctl(fd, KVM_GET_API_VERSION)
+      for nom, numero in KVM_EXTENSIONS.items():
+        extensions[nom] = fcntl.ioctl(fd, KVM_CHECK_EXTENSION, numero)
+    finally:
+      os.close(fd)
+  else:
+    with open(peripherique, 'r') as f:
+      donnees = json.load(f)
+    api_version = int(donnees['api_version'])
+    for nom in KVM_EXTENSIONS:
+      extensions[nom] = int(donnees.get('extensions', dict()).get(nom, 0))
+  return api_version, extensions
+
+# Lecture de l'état de la virtualisation imbriquée
+def sonde_nested(racine):
+  for module in ('kvm_intel', 'kvm_amd'):
+    valeur = lecture_valeur(chemin(racine, '/sys/module/' + module + '/parameters/nested'))
+    if valeur is not None:
+      return module, valeur in ('Y', 'y', '1')
+  return None, False
+
+# Lecture de la mémoire totale en Mo
+def sonde_memoire(racine):
+  meminfo = lecture_valeur(chemin(racine, '/proc/meminfo'), '')
+  resultat = re.search(r'MemTotal:\s+([0-9]+)', meminfo)
+  return int(resultat.group(1)) // 1024 if resultat else 0
+
+# Fonction de génération du rapport KVM et de l'estimation de capacité
+def rapport_kvm(racine, cpu, vcpus_noeud, ratio_vcpu, memoire_noeud):
+  api_version, extensions = interroge_kvm(chemin(racine, '/dev/kvm'))
+  # Valeurs par défaut définies par la documentation de l'API KVM
+  vcpus_recommandes = extensions['nr_vcpus'] or 4
+  vcpus_max = extensions['max_vcpus'] or vcpus_recommandes
+  module, nested = sonde_nested(racine)
+  memoire = sonde_memoire(racine)
+
+  # Estimation du nombre de noeuds Qemu en conservant une réserve mémoire pour le système
+  reserve = max(1024, memoire // 10)
+  noeuds_cpu = (cpu['threads'] * ratio_vcpu) // vcpus_noeud if vcpus_noeud <= vcpus_max else 0
+  noeuds_memoire = max(0, memoire - reserve) // memoire_noeud
+  capacite = {
+    'noeuds_cpu': noeuds_cpu,
+    'noeuds_memoire': noeuds_memoire,
+    'noeuds_qemu': min(noeuds_cpu, noeuds_memoire),
+    'limite': 'cpu' if noeuds_cpu <= noeuds_memoire else 'memoire'
+  }
+
+  return {
+    'api_version': api_version,
+    'vcpus_recommandes': vcpus_recommandes,
+    'vcpus_max': vcpus_max,
+    'vcpu_id_max': extensions['max_vcpu_id'] or vcpus_max,
+    'memslots': extensions['nr_memslots'],
+    'irqchip': extensions['irqchip'] > 0,
+    'irq_routing': extensions['irq_routing'] > 0,
+    'module': module,
+    'nested': nested,
+    'memoire_mo': memoire,
+    'capacite': capacite
+  }
+
+# Constantes de l'interface TUN/TAP (linux/if_tun.h)
+TUNSETIFF = 0x400454ca
+TUNGETFEATURES = 0x800454cf
+IFF_TAP = 0x0002
+IFF_MULTI_QUEUE = 0x0100
+IFF_NO_PI = 0x1000
+IFF_VNET_HDR = 0x4000
+
+# Fichier de chargement automatique du module vhost_net
+VHOST_NET_CONF = '/etc/modules-load.d/vhost_net.conf'
+
+# Vérification du chargement d'un module noyau
+def module_noyau_charge(racine, nom):
+  if os.path.isdir(chemin(racine, '/sys/module/' + nom)):
+    return True
+  modules = lecture_valeur(chemin(racine, '/proc/modules'), '')
+  return any(ligne.split(' ', 1)[0] == nom for ligne in modules.splitlines())
+
+# Vérification des droits de lecture/écriture d'un utilisateur sur un fichier
+def acces_utilisateur(fichier, utilisateur):
+  import pwd
+  import grp
+  try:
+    compte = pwd.getpwnam(utilisateur)
+    infos = os.stat(fichier)
+  except (KeyError, OSError):
+    return None
+  if compte.pw_uid == 0:
+    return True
+  if infos.st_uid == compte.pw_uid:
+    return infos.st_mode & 0o600 == 0o600
+  groupes = [groupe.gr_gid for groupe in grp.getgrall() if utilisateur in groupe.gr_mem]
+  if infos.st_gid == compte.pw_gid or infos.st_gid in groupes:
+    return infos.st_mode & 0o060 == 0o060
+  return infos.st_mode & 0o006 == 0o006
+
+# Création temporaire d'une interface TAP multiqueue avec deux files
+# L'interface n'est pas persistante et disparaît à la fermeture des descripteurs
+def creation_tap_multiqueue(peripherique):
+  import fcntl
+  import struct
+  descripteurs = list()
+  nom = b'gns3mq%d'
+  try:
+    for file in range(2):
+      fd = os.open(peripherique, os.O_RDWR | os.O_CLOEXEC)
+      descripteurs.append(fd)
+      ifreq = fcntl.ioctl(fd, TUNSETIFF, struct.pack('16sH22x', nom, IFF_TAP | IFF_NO_PI | IFF_MULTI_QUEUE))
+      nom = ifreq[:16].rstrip(b'\0')
+    return True
+  except (IOError, OSError):
+    return False
+  finally:
+    for fd in descripteurs:
+      os.close(fd)
+
+# Fonction d'analyse du chemin de données réseau de Qemu
+def rapport_tun(racine, utilisateur, creation):
+  peripherique = chemin(racine, '/dev/net/tun')
+  rapport = {
+    'tun': os.path.exists(peripherique),
+    'multiqueue': None,
+    'multiqueue_creation': None,
+    'vnet_hdr': None,
+    'vhost_net': {
+      'peripherique': os.path.exists(chemin(racine, '/dev/vhost-net')),
+      'module': module_noyau_charge(racine, 'vhost_net'),
+      'persistant': 'vhost_net' in lecture_valeur(chemin(racine, VHOST_NET_CONF), '').split()
+    },
+    'utilisateur': utilisateur,
+    'acces': dict()
+  }
 
-# Fonction de récupération des information du CPU
-def cpu_vmx_svm():
-  with open('/proc/cpuinfo', 'r') as cpuinfo:
+  # Les fonctionnalités de l'interface TUN/TAP sont interrogées uniquement sur le système réel
+  if rapport['tun'] and racine == '/':
+    import fcntl
+    import struct
+    try:
+      fd = os.open(peripherique, os.O_RDWR | os.O_CLOEXEC)
+      try:
+        fonctionnalites = struct.unpack('I', fcntl.ioctl(fd, TUNGETFEATURES, struct.pack('I', 0)))[0]
+      finally:
+        os.close(fd)
+      rapport['multiqueue'] = fonctionnalites & IFF_MULTI_QUEUE != 0
+      rapport['vnet_hdr'] = fonctionnalites & IFF_VNET_HDR != 0
+      if creation and rapport['multiqueue']:
+        rapport['multiqueue_creation'] = creation_tap_multiqueue(peripherique)
+    except (IOError, OSError):
+      pass
+
+  for fichier in ('/dev/kvm', '/dev/net/tun', '/dev/vhost-net'):
+    rapport['acces'][fichier] = acces_utilisateur(chemin(racine, fichier), utilisateur)
+  return rapport
+
+# Chargement du module vhost_net et configuration du chargement au démarrage
+# Le module n'est chargé dans le noyau que si la racine analysée est celle du système
+def chargement_vhost_net(module, racine):
+  changed = False
+  if racine == '/' and not module_noyau_charge(racine, 'vhost_net'):
+    changed = True
+    if not module.check_mode:
+      modprobe = module.get_bin_path('modprobe', required = True, opt_dirs = ['/sbin', '/usr/sbin'])
+      rc, out, err = module.run_command([modprobe, 'vhost_net'])
+      if rc != 0:
+        module.fail_json(msg = "Chargement du module vhost_net impossible : " + err.strip())
+  fichier = chemin(racine, VHOST_NET_CONF)
+  if 'vhost_net' not in lecture_valeur(fichier, '').split():
+    changed = True
+    if not module.check_mode:
+      try:
+        if not os.path.isdir(os.path.dirname(fichier)):
+          os.makedirs(os.path.dirname(fichier), 0o755)
+        with open(fichier, 'w') as f:
+          f.write('vhost_net\n')
+      except (IOError, OSError) as erreur:
+        module.fail_json(msg = "Ecriture du fichier " + VHOST_NET_CONF + " impossible : " + str(erreur))
+  return changed
+
+# Tailles des blocs des mesures de stockage
+BLOC_SEQUENTIEL = 1024 * 1024
+BLOC_ALEATOIRE = 4096
+
+# Recherche du premier répertoire existant d'un chemin
+def repertoire_existant(repertoire):
+  repertoire = os.path.abspath(repertoire)
+  while not os.path.isdir(repertoire):
+    repertoire = os.path.dirname(repertoire)
+  return repertoire
+
+# Ouverture d'un fichier en E/S directes si le système de fichiers le permet
+def ouverture_directe(fichier):
+  import errno
+  try:
+    return os.open(fichier, os.O_RDWR | os.O_DIRECT), True
+  except OSError as erreur:
+    if erreur.errno != errno.EINVAL:
+      raise
+  return os.open(fichier, os.O_RDWR), False
+
+# Mesure des performances de stockage d'un répertoire
+# Chaque phase (écriture séquentielle, lecture séquentielle, lecture et écriture aléatoires 4K)
+# dispose d'un quart de la durée maximale
+def mesure_stockage(repertoire, taille, duree):
+  import mmap
+  import time
+  import random
+  descripteur, fichier = tempfile.mkstemp(dir = repertoire, prefix = '.gns3vm-bench-')
+  os.close(descripteur)
+  # Tampon aligné sur une page mémoire comme l'exige O_DIRECT
+  tampon = mmap.mmap(-1, BLOC_SEQUENTIEL)
+  tampon.write(os.urandom(BLOC_SEQUENTIEL))
+  bloc = memoryview(tampon)[:BLOC_ALEATOIRE]
+  limite = duree / 4.0
+  try:
+    fd, direct = ouverture_directe(fichier)
+    try:
+      # Ecriture séquentielle
+      ecrits = 0
+      debut = time.monotonic()
+      while ecrits < taille and time.monotonic() - debut < limite:
+        ecrits += os.pwritev(fd, [tampon], ecrits)
+      os.fsync(fd)
+      duree_ecriture = time.monotonic() - debut
+      if not direct:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+      # Lecture séquentielle
+      lus = 0
+      debut = time.monotonic()
+      while lus < ecrits and time.monotonic() - debut < limite:
+        lu = os.preadv(fd, [tampon], lus)
+        if lu == 0:
+          break
+        lus += lu
+      duree_lecture = time.monotonic() - debut
+
+      # Lecture aléatoire 4K
+      blocs = max(1, ecrits // BLOC_ALEATOIRE)
+      lectures = 0
+      debut = time.monotonic()
+      while time.monotonic() - debut < limite:
+        os.preadv(fd, [bloc], random.randrange(blocs) * BLOC_ALEATOIRE)
+        lectures += 1
+      duree_lectures = time.monotonic() - debut
+
+      # Ecriture aléatoire 4K, la synchronisation finale fait partie de la mesure
+      ecritures = 0
+      debut = time.monotonic()
+      while time.monotonic() - debut < limite:
+        os.pwritev(fd, [bloc], random.randrange(blocs) * BLOC_ALEATOIRE)
+        ecritures += 1
+      os.fdatasync(fd)
+      duree_ecritures = time.monotonic() - debut
+    finally:
+      os.close(fd)
+  finally:
+    bloc.release()
+    tampon.close()
+    os.unlink(fichier)
+
+  return {
+    'repertoire_mesure': repertoire,
+    'o_direct': direct,
+    'taille_mo': ecrits // BLOC_SEQUENTIEL,
+    'seq_ecriture_mbs': round(ecrits / BLOC_SEQUENTIEL / duree_ecriture, 1),
+    'seq_lecture_mbs': round(lus / BLOC_SEQUENTIEL / duree_lecture, 1),
+    'alea_lecture_iops': int(lectures / duree_lectures),
+    'alea_ecriture_iops': int(ecritures / duree_ecritures)
+  }
+
+# Fonction de mesure des performances de stockage d'une liste de répertoires
+# Un répertoire sans espace libre suffisant pour le fichier de test n'est pas mesuré (avertissement ou échec selon storage_thresholds_action)
+def rapport_stockage(module, repertoires):
+  rapport = dict()
+  mesures = dict()
+  taille = module.params['storage_bench_size'] * BLOC_SEQUENTIEL
+  for repertoire in repertoires:
+    existant = repertoire_existant(repertoire)
+    infos = os.statvfs(existant)
+    if infos.f_bavail * infos.f_frsize < taille * 2:
+      if module.params['storage_thresholds_action'] == 'fail':
+        module.fail_json(msg = "Espace libre insuffisant pour la mesure des performances de " + repertoire)
+      module.warn("Espace libre insuffisant pour la mesure des performances de " + repertoire + ", répertoire non mesuré")
+      continue
+    # Un seul répertoire est mesuré par système de fichiers
+    peripherique = os.stat(existant).st_dev
+    if peripherique not in mesures:
+      mesures[peripherique] = mesure_stockage(existant, taille, module.params['storage_bench_time'])
+    rapport[repertoire] = mesures[peripherique]
+  return rapport
+
+# Vérification des seuils des mesures de stockage
+def verif_seuils_stockage(rapport, seuils):
+  messages = list()
+  for repertoire, mesure in rapport.items():
+    for cle, seuil in seuils.items():
+      if cle in mesure and mesure[cle] < float(seuil):
+        messages.append(repertoire + " : " + cle + " = " + str(mesure[cle]) + " (minimum " + str(seuil) + ")")
+  return messages
+
+# Fonction de récupération des informations du CPU
+# Seul le premier bloc de /proc/cpuinfo est analysé, les autres processeurs logiques
+# sont dénombrés à partir de /sys/devices/system/cpu/online
+def sonde_cpu(racine):
+  infos = dict()
+  with open(chemin(racine, '/proc/cpuinfo'), 'r') as cpuinfo:
     for ligne in cpuinfo:
-      data = ligne.replace('\t','').replace('\n','').split(':')
-      if data[0] == 'flags':
-        if 'vmx' in data[1] or 'svm' in data[1]:
-          return True
-  return False
+      cle, sep, valeur = ligne.partition(':')
+      if not sep:
+        # Une ligne vide termine le bloc du premier processeur
+        if infos and not ligne.strip():
+          break
+        continue
+      infos[cle.strip()] = valeur.strip()
+
+  drapeaux = set(infos.get('flags', '').split()) | set(infos.get('vmx flags', '').split())
+  online = lecture_valeur(chemin(racine, '/sys/devices/system/cpu/online'))
+  threads = compte_cpulist(online) if online else (os.cpu_count() or 1)
+  siblings = int(infos.get('siblings', threads)) or threads
+  coeurs_socket = int(infos.get('cpu cores', siblings)) or siblings
+  sockets = max(1, threads // siblings)
+
+  return {
+    'fabricant': infos.get('vendor_id'),
+    'modele': infos.get('model name'),
+    'vmx': 'vmx' in drapeaux,
+    'svm': 'svm' in drapeaux,
+    'ept': 'ept' in drapeaux,
+    'npt': 'npt' in drapeaux,
+    'sockets': sockets,
+    'coeurs': coeurs_socket * sockets,
+    'threads': threads,
+    'noeuds_numa': sonde_numa(racine)
+  }
 
 # Definition de la fonction d'exécution du module
 def run_module():
@@ -80,7 +685,22 @@ def run_module():
   module_args = dict(
     cpu = dict(type = bool, default = True, required = False),
     kvm = dict(type = bool, default = True, required = False),
-    tun = dict(type = bool, default = True, required = False)
+    tun = dict(type = bool, default = True, required = False),
+    cache = dict(type = str, default = '/var/cache/gns3vm/verif_sys.json', required = False),
+    kvm_report = dict(type = bool, default = False, required = False),
+    vcpus_noeud = dict(type = int, default = 1, required = False),
+    ratio_vcpu = dict(type = int, default = 4, required = False),
+    memoire_noeud = dict(type = int, default = 512, required = False),
+    tun_report = dict(type = bool, default = False, required = False),
+    tun_user = dict(type = str, default = 'gns3', required = False),
+    vhost_net_load = dict(type = bool, default = False, required = False),
+    vhost_net_require = dict(type = bool, default = False, required = False),
+    storage_bench = dict(type = str, required = False),
+    storage_bench_size = dict(type = int, default = 256, required = False),
+    storage_bench_time = dict(type = int, default = 20, required = False),
+    storage_thresholds = dict(type = dict, required = False),
+    storage_thresholds_action = dict(type = str, default = 'warn', choices = ['warn', 'fail'], required = False),
+    root = dict(type = str, default = '/', required = False)
   )
 
   # Initialisation du dictionnaire de sortie
@@ -92,25 +712,81 @@ def run_module():
     supports_check_mode = True
   )
 
-  # Sortie si le mode de vérification est activé
-  if module.check_mode:
-    module.exit_json(**result)
+  # Lecture du cache des informations matérielles
+  racine = module.params['root']
+  if racine != '/':
+    module.params['cache'] = ''
+  boot_id = lecture_boot_id(racine)
+  cache = lecture_cache(module.params['cache'], boot_id)
+  result['cache'] = 'cpu' in cache
+
+  # Collecte des informations du processeur
+  if not result['cache']:
+    try:
+      cache['cpu'] = sonde_cpu(racine)
+    except (IOError, OSError) as erreur:
+      module.fail_json(msg = "Lecture des informations du CPU impossible : " + str(erreur), **result)
+    # Le cache n'est pas modifié en mode de vérification
+    if module.params['cache'] and boot_id is not None and not module.check_mode:
+      cache['boot_id'] = boot_id
+      ecriture_cache(module.params['cache'], cache)
+  result['ansible_facts'] = { 'gns3vm_cpu': cache['cpu'] }
 
   # Vérification de la compatibilité du CPU
   if module.params['cpu']:
-    if not cpu_vmx_svm():
+    if not (cache['cpu']['vmx'] or cache['cpu']['svm']):
       module.fail_json(msg = "Drapeau VMX/SVM introuvable sur le CPU", **result)
 
   # Vérification de la présence du periphérique kvm
   if module.params['kvm']:
-    if not os.path.exists("/dev/kvm"):
+    if not os.path.exists(chemin(racine, "/dev/kvm")):
       module.fail_json(msg = "Périphérique kvm introuvable", **result)
 
+  # Génération du rapport des capacités KVM
+  if module.params['kvm_report']:
+    if module.params['vcpus_noeud'] < 1 or module.params['ratio_vcpu'] < 1 or module.params['memoire_noeud'] < 1:
+      module.fail_json(msg = "Les options vcpus_noeud, ratio_vcpu et memoire_noeud doivent être supérieures à 0", **result)
+    try:
+      kvm = rapport_kvm(racine, cache['cpu'], module.params['vcpus_noeud'], module.params['ratio_vcpu'], module.params['memoire_noeud'])
+    except (IOError, OSError, ValueError, KeyError) as erreur:
+      module.fail_json(msg = "Interrogation du périphérique kvm impossible : " + str(erreur), **result)
+    if kvm['api_version'] != KVM_API_VERSION:
+      module.fail_json(msg = "Version de l'API KVM non supportée : " + str(kvm['api_version']), **result)
+    result['ansible_facts']['gns3vm_kvm'] = kvm
+
   # Vérification de la présence du periphérique tun/tap
   if module.params['tun']:
-    if not os.path.exists("/dev/net/tun"):
+    if not os.path.exists(chemin(racine, "/dev/net/tun")):
       module.fail_json(msg = "Périphérique tun/tap introuvable", **result)
 
+  # Chargement du module vhost_net
+  if module.params['vhost_net_load']:
+    result['changed'] = chargement_vhost_net(module, racine)
+
+  # Analyse du chemin de données réseau de Qemu
+  if module.params['tun_report'] or module.params['vhost_net_require']:
+    tun = rapport_tun(racine, module.params['tun_user'], not module.check_mode)
+    result['ansible_facts']['gns3vm_tun'] = tun
+    if module.params['vhost_net_require'] and not module.check_mode:
+      if not (tun['vhost_net']['peripherique'] and tun['vhost_net']['module']):
+        module.fail_json(msg = "Accélération vhost-net indisponible (périphérique /dev/vhost-net ou module vhost_net absent)", **result)
+
+  # Mesure des performances de stockage, aucune écriture en mode de vérification
+  if module.params['storage_bench'] and not module.check_mode:
+    if module.params['storage_bench_size'] < 1 or module.params['storage_bench_time'] < 1:
+      module.fail_json(msg = "Les options storage_bench_size et storage_bench_time doivent être supérieures à 0", **result)
+    repertoires = [chemin(racine, repertoire.strip()) for repertoire in module.params['storage_bench'].split(',') if repertoire.strip()]
+    try:
+      stockage = rapport_stockage(module, repertoires)
+    except (IOError, OSError) as erreur:
+      module.fail_json(msg = "Mesure des performances de stockage impossible : " + str(erreur), **result)
+    result['ansible_facts']['gns3vm_stockage'] = stockage
+    messages = verif_seuils_stockage(stockage, module.params['storage_thresholds'] or dict())
+    if messages and module.params['storage_thresholds_action'] == 'fail':
+      module.fail_json(msg = "Performances de stockage insuffisantes : " + ", ".join(messages), **result)
+    for message in messages:
+      module.warn("Performances de stockage insuffisantes : " + message)
+
   # Fin d'exécution normale
   #module.exit_json(changed = False, module_args = module.params)
   module.exit_json(**result)
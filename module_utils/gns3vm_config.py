@@ -0,0 +1,231 @@
+# -*- coding: UTF-8 -*
+# Moteur commun de lecture, modification et écriture des fichiers de configuration GNS3 VM SERVER
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+# Chargement des modules necessaires
+import os
+import re
+import json
+import hashlib
+import tempfile
+import configparser
+
+# Erreur de configuration, le message est retourné par le module
+class ErreurConfig(Exception):
+  pass
+
+# Définition de la fonction de lecture du fichier actuel
+def lecture_fichier(fichier):
+  try:
+    with open(fichier, 'r') as f:
+      return f.read()
+  except IOError:
+    return ''
+
+# Définition de la fonction d'enregistrement d'un fichier de configuration
+# Ecriture dans un fichier temporaire synchronisé puis renommé, le fichier d'origine
+# reste intact en cas d'erreur et ses droits sont conservés
+def ecriture_fichier(fichier, texte, mode = 0o644):
+  repertoire = os.path.dirname(os.path.abspath(fichier))
+  temporaire = None
+  try:
+    descripteur, temporaire = tempfile.mkstemp(dir = repertoire, prefix = '.' + os.path.basename(fichier) + '.')
+    with os.fdopen(descripteur, 'w') as f:
+      f.write(texte)
+      f.flush()
+      os.fsync(f.fileno())
+    if os.path.exists(fichier):
+      infos = os.stat(fichier)
+      os.chmod(temporaire, infos.st_mode & 0o7777)
+      os.chown(temporaire, infos.st_uid, infos.st_gid)
+    else:
+      os.chmod(temporaire, mode)
+    os.rename(temporaire, fichier)
+    descripteur = os.open(repertoire, os.O_RDONLY)
+    try:
+      os.fsync(descripteur)
+    finally:
+      os.close(descripteur)
+    return True
+  except (IOError, OSError):
+    if temporaire is not None and os.path.exists(temporaire):
+      os.unlink(temporaire)
+    return False
+
+# Différence d'un fichier au format attendu par le mode diff d'Ansible
+def diff_fichier(fichier, avant, apres):
+  return { 'before_header': fichier, 'before': avant, 'after_header': fichier, 'after': apres }
+
+# Expressions de reconnaissance des lignes de section et d'option des fichiers INI
+RE_SECTION = re.compile(r'^\s*\[([^\]]+)\]')
+RE_OPTION = re.compile(r'^(\s*([^#;\s\[=:][^=:]*?)\s*[=:]\s*)(.*?)\s*$')
+
+# Définition de la fonction d'analyse d'une configuration INI
+def lecture_ini(texte):
+  parametres = dict()
+  config = configparser.ConfigParser(interpolation = None)
+  try:
+    config.read_string(texte)
+  except configparser.Error as erreur:
+    raise ErreurConfig(str(erreur))
+  sections = config.sections()
+  for section in sections:
+    options = config.options(section)
+    temp_dict = dict()
+    for option in options:
+      temp_dict[option] = config.get(section,option)
+    parametres[section] = temp_dict
+  return parametres
+
+# Normalisation d'une valeur pour la comparaison des configurations
+def normalisation(valeur):
+  valeur = str(valeur).strip()
+  if valeur.lower() in ('true', 'yes', 'on'):
+    return 'true'
+  if valeur.lower() in ('false', 'no', 'off'):
+    return 'false'
+  try:
+    return str(int(valeur))
+  except ValueError:
+    pass
+  if len(valeur) > 1 and valeur.endswith('/'):
+    return valeur.rstrip('/')
+  return valeur
+
+# Normalisation d'une configuration INI complète
+def ini_normalisee(config):
+  return dict((section, dict((option, normalisation(valeur)) for option, valeur in options.items())) for section, options in config.items())
+
+# Définition de la fonction de modification du texte d'une configuration INI
+# Seules les options dont la valeur normalisée change sont modifiées,
+# les commentaires et l'ordre des lignes sont conservés
+def modification_ini(texte, config):
+  lignes = texte.splitlines()
+  restantes = dict((section, dict(options)) for section, options in config.items())
+  resultat = list()
+
+  # Ajout des options absentes en fin de section, avant les lignes vides
+  def ajout_options(section):
+    if section not in restantes:
+      return
+    position = len(resultat)
+    while position > 0 and not resultat[position - 1].strip():
+      position -= 1
+    nouvelles = [option + ' = ' + str(valeur) for option, valeur in restantes.pop(section).items()]
+    resultat[position:position] = nouvelles
+
+  section = None
+  for ligne in lignes:
+    correspondance = RE_SECTION.match(ligne)
+    if correspondance:
+      ajout_options(section)
+      section = correspondance.group(1).strip()
+    elif section in restantes:
+      correspondance = RE_OPTION.match(ligne)
+      if correspondance:
+        option = correspondance.group(2).lower()
+        if option in restantes[section]:
+          valeur = str(restantes[section].pop(option))
+          if normalisation(valeur) != normalisation(correspondance.group(3)):
+            ligne = correspondance.group(1) + valeur
+    resultat.append(ligne)
+  ajout_options(section)
+
+  # Ajout des sections absentes en fin de fichier
+  for section, options in restantes.items():
+    if resultat and resultat[-1].strip():
+      resultat.append('')
+    resultat.append('[' + section + ']')
+    resultat.extend(option + ' = ' + str(valeur) for option, valeur in options.items())
+  return '\n'.join(resultat) + '\n'
+
+# Options secrètes (mots de passe), masquées dans les différences et les valeurs de retour de débogage
+RE_SECRET = re.compile(r'password|secret|token', re.IGNORECASE)
+MASQUE = '********'
+
+# Texte d'une configuration INI dont les valeurs des options secrètes sont masquées
+def masquage_ini(texte):
+  lignes = list()
+  for ligne in texte.splitlines(True):
+    contenu = ligne.rstrip('\r\n')
+    correspondance = RE_OPTION.match(contenu)
+    if correspondance and RE_SECRET.search(correspondance.group(2)) and correspondance.group(3):
+      ligne = correspondance.group(1) + MASQUE + ligne[len(contenu):]
+    lignes.append(ligne)
+  return ''.join(lignes)
+
+# Configuration INI analysée dont les valeurs des options secrètes sont masquées
+def masquage_config(config):
+  return dict((section, dict((option, MASQUE if RE_SECRET.search(option) else valeur) for option, valeur in options.items()))
+              for section, options in config.items())
+
+# Définition de la fonction d'analyse d'une configuration JSON
+def lecture_json(texte):
+  if not texte.strip():
+    return dict()
+  try:
+    config = json.loads(texte)
+  except ValueError as erreur:
+    raise ErreurConfig(str(erreur))
+  if not isinstance(config, dict):
+    raise ErreurConfig("objet JSON attendu")
+  return config
+
+# Texte d'une configuration JSON
+def texte_json(config):
+  return json.dumps(config, indent = 2) + '\n'
+
+# Empreinte SHA-256 d'une valeur sous sa forme JSON canonique (clés triées, sans espaces)
+def empreinte(valeur):
+  return hashlib.sha256(json.dumps(valeur, sort_keys = True, separators = (',', ':')).encode('utf-8')).hexdigest()
+
+# Empreintes d'une configuration normalisée, globale et par section (ou par clé de premier niveau)
+# Les options propres à chaque cible (propres : options par section) sont exclues des empreintes comparées
+# entre cibles et ont leur propre empreinte
+# Seules les empreintes sont retournées, jamais les valeurs (mots de passe)
+def empreintes_config(config, present = True, propres = None):
+  propres = propres or dict()
+  commune = dict()
+  specifique = dict()
+  for section, valeur in config.items():
+    if section in propres:
+      commune[section] = dict((option, v) for option, v in valeur.items() if option not in propres[section])
+      specifique[section] = dict((option, v) for option, v in valeur.items() if option in propres[section])
+    else:
+      commune[section] = valeur
+  empreintes = {
+    'present': present,
+    'empreinte': empreinte(commune),
+    'sections': dict((section, empreinte(valeur)) for section, valeur in commune.items())
+  }
+  if propres:
+    empreintes['empreinte_cible'] = empreinte(specifique)
+  return empreintes
+
+# Expression de reconnaissance des lignes des fichiers sysctl
+RE_SYSCTL = re.compile(r'^\s*-?\s*([^#;=\s][^=]*?)\s*=\s*(.*?)\s*$')
+
+# Définition de la fonction d'analyse d'un fichier sysctl
+def lecture_sysctl(texte):
+  parametres = dict()
+  for ligne in texte.splitlines():
+    correspondance = RE_SYSCTL.match(ligne)
+    if correspondance:
+      parametres[correspondance.group(1).replace('/', '.')] = correspondance.group(2)
+  return parametres
+
+# Normalisation d'une valeur sysctl (espaces et tabulations multiples)
+def normalisation_sysctl(valeur):
+  return ' '.join(str(valeur).split())
+
+# Texte d'un fichier sysctl
+def texte_sysctl(config, entete = None):
+  lignes = ['# ' + entete] if entete else []
+  lignes.extend(cle + ' = ' + normalisation_sysctl(valeur) for cle, valeur in sorted(config.items()))
+  return '\n'.join(lignes) + '\n'
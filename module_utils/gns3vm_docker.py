@@ -0,0 +1,497 @@
+# -*- coding: UTF-8 -*
+# Génération de la configuration du démon docker, utilisée par les modules docker_daemon_config et gns3vm_node_config
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.module_utils.gns3vm_config import ErreurConfig, lecture_fichier, ecriture_fichier, diff_fichier, lecture_json, texte_json, empreintes_config
+
+# Chargement des modules necessaires
+import os
+import json
+
+# Définition des options
+ARGUMENTS = {
+  'data-root': { 'type': str, 'required': False },
+  'dns': { 'type': 'raw', 'required': False },
+  'dns-search': { 'type': 'raw', 'required': False },
+  'storage-driver': { 'type': str, 'required': False },
+  'storage-opts': { 'type': 'raw', 'required': False },
+  'max-concurrent-downloads': { 'type': 'raw', 'required': False },
+  'max-concurrent-uploads': { 'type': 'raw', 'required': False },
+  'registry-mirrors': { 'type': 'raw', 'required': False },
+  'live-restore': { 'type': 'raw', 'required': False },
+  'log-driver': { 'type': str, 'required': False },
+  'log-opts': { 'type': 'raw', 'required': False },
+  'default-ulimits': { 'type': 'raw', 'required': False },
+  'default-address-pools': { 'type': 'raw', 'required': False },
+  'config-file': { 'type': str, 'default': '/etc/docker/daemon.json', 'required': False },
+  'force': { 'type': bool, 'default': False, 'required': False },
+  'migrate': { 'type': bool, 'default': False, 'required': False },
+  'migrate_mode': { 'type': str, 'default': 'copy', 'choices': ['copy', 'move'], 'required': False },
+  'fingerprint': { 'type': bool, 'default': False, 'required': False },
+  'debug': { 'type': bool, 'default': False, 'required': False }
+}
+
+# Schéma des options du fichier de configuration du démon docker
+# Types : chaine, chemin, entier, booleen, liste (avec le type des éléments) et dictionnaire (avec le type des valeurs)
+SCHEMA = {
+  'data-root': { 'type': 'chemin' },
+  'dns': { 'type': 'liste', 'elements': 'ip' },
+  'dns-search': { 'type': 'liste', 'elements': 'chaine' },
+  'storage-driver': { 'type': 'chaine', 'choix': ('overlay2', 'fuse-overlayfs', 'btrfs', 'zfs', 'devicemapper', 'vfs') },
+  'storage-opts': { 'type': 'liste', 'elements': 'chaine' },
+  'max-concurrent-downloads': { 'type': 'entier', 'min': 1 },
+  'max-concurrent-uploads': { 'type': 'entier', 'min': 1 },
+  'registry-mirrors': { 'type': 'liste', 'elements': 'url' },
+  'live-restore': { 'type': 'booleen' },
+  'log-driver': { 'type': 'chaine', 'choix': ('json-file', 'local', 'journald', 'syslog', 'gelf', 'fluentd', 'awslogs', 'splunk', 'etwlogs', 'gcplogs', 'logentries', 'none') },
+  'log-opts': { 'type': 'dictionnaire', 'valeurs': 'chaine' },
+  'default-ulimits': { 'type': 'dictionnaire', 'valeurs': 'ulimit' },
+  'default-address-pools': { 'type': 'liste', 'elements': 'pool' }
+}
+
+# Conversion d'une valeur booléenne sans évaluation de code
+def valeur_booleenne(valeur):
+  if isinstance(valeur, bool):
+    return valeur
+  if str(valeur).strip().lower() in ('true', 'yes', 'on', '1'):
+    return True
+  if str(valeur).strip().lower() in ('false', 'no', 'off', '0'):
+    return False
+  raise ValueError("booléen attendu")
+
+# Conversion d'une valeur entière
+def valeur_entiere(valeur, minimum = None):
+  if isinstance(valeur, bool):
+    raise ValueError("entier attendu")
+  try:
+    valeur = int(str(valeur).strip())
+  except ValueError:
+    raise ValueError("entier attendu")
+  if minimum is not None and valeur < minimum:
+    raise ValueError("valeur minimum " + str(minimum))
+  return valeur
+
+# Conversion d'une limite de ressource (ulimit) au format docker
+# Formats acceptés : entier, "souple:stricte" ou dictionnaire Soft/Hard
+def valeur_ulimit(nom, valeur):
+  if isinstance(valeur, dict):
+    souple = valeur.get('Soft', valeur.get('soft'))
+    stricte = valeur.get('Hard', valeur.get('hard', souple))
+  else:
+    souple, sep, stricte = str(valeur).partition(':')
+    stricte = stricte if sep else souple
+  souple = valeur_entiere(souple, -1)
+  stricte = valeur_entiere(stricte, -1)
+  if stricte != -1 and (souple == -1 or souple > stricte):
+    raise ValueError("limite souple supérieure à la limite stricte")
+  return { 'Name': nom, 'Hard': stricte, 'Soft': souple }
+
+# Conversion d'un pool d'adresses des réseaux docker
+# Formats acceptés : dictionnaire base/size ou chaîne "base:size"
+def valeur_pool(valeur):
+  import ipaddress
+  if isinstance(valeur, dict):
+    base = valeur.get('base')
+    taille = valeur.get('size')
+  else:
+    base, sep, taille = str(valeur).partition(':')
+  try:
+    reseau = ipaddress.ip_network(str(base).strip())
+  except ValueError:
+    raise ValueError("réseau invalide " + str(base))
+  taille = valeur_entiere(taille, reseau.prefixlen)
+  if taille > reseau.max_prefixlen:
+    raise ValueError("taille de sous-réseau invalide " + str(taille))
+  return { 'base': str(reseau), 'size': taille }
+
+# Conversion d'un élément ou d'une valeur selon son type
+def valeur_element(type_element, valeur, nom = None):
+  if type_element == 'chaine':
+    return str(valeur).strip()
+  if type_element == 'ip':
+    import ipaddress
+    try:
+      return str(ipaddress.ip_address(str(valeur).strip()))
+    except ValueError:
+      raise ValueError("adresse IP invalide " + str(valeur))
+  if type_element == 'url':
+    from urllib.parse import urlparse
+    url = urlparse(str(valeur).strip())
+    if url.scheme not in ('http', 'https') or not url.netloc:
+      raise ValueError("URL invalide " + str(valeur))
+    return url.geturl()
+  if type_element == 'ulimit':
+    return valeur_ulimit(nom, valeur)
+  if type_element == 'pool':
+    return valeur_pool(valeur)
+  raise ValueError("type inconnu " + type_element)
+
+# Définition de la fonction de validation d'une option selon le schéma
+def validation(option, valeur):
+  schema = SCHEMA[option]
+  type_option = schema['type']
+  if type_option in ('chaine', 'chemin'):
+    valeur = str(valeur).strip()
+    if type_option == 'chemin' and not valeur.startswith('/'):
+      raise ValueError("chemin absolu attendu")
+    if 'choix' in schema and valeur not in schema['choix']:
+      raise ValueError("valeurs acceptées " + ", ".join(schema['choix']))
+    return valeur
+  if type_option == 'entier':
+    return valeur_entiere(valeur, schema.get('min'))
+  if type_option == 'booleen':
+    return valeur_booleenne(valeur)
+  if type_option == 'liste':
+    # Une chaîne est une liste d'éléments séparés par des virgules
+    if isinstance(valeur, str):
+      valeur = [element for element in valeur.split(',') if element.strip()]
+    if not isinstance(valeur, list):
+      raise ValueError("liste attendue")
+    return [valeur_element(schema['elements'], element) for element in valeur]
+  if type_option == 'dictionnaire':
+    # Une chaîne est une liste de paires cle=valeur séparées par des virgules
+    if isinstance(valeur, str):
+      valeur = dict(paire.split('=', 1) for paire in valeur.split(',') if '=' in paire)
+    if not isinstance(valeur, dict):
+      raise ValueError("dictionnaire attendu")
+    return dict((str(cle).strip(), valeur_element(schema['valeurs'], element, str(cle).strip())) for cle, element in valeur.items())
+  raise ValueError("type inconnu " + type_option)
+
+# Définition de la fonction de mise à jour de la configuration
+def maj_config(config, parametres):
+  import copy
+  # Création de la variable de configuration finale
+  configuration = copy.deepcopy(config)
+  # Si la configuration actuelle est vide
+  # on crée une configuration par défaut
+  if len(configuration) == 0:
+    configuration = {
+      'data-root': '/var/lib/docker'
+    }
+
+  # On adapte les paramètres définis dans le schéma
+  for option in SCHEMA:
+    if parametres.get(option) is None:
+      continue
+    try:
+      configuration[option] = validation(option, parametres[option])
+    except ValueError as erreur:
+      raise ValueError(option + " : " + str(erreur))
+
+  return configuration
+
+# Requête ioctl de clonage de fichier par référence (reflink, linux/fs.h)
+FICLONE = 0x40049409
+# Taille des blocs de la copie par morceaux
+BLOC_COPIE = 8 * 1024 * 1024
+# Fichier d'état de la migration, placé dans le nouvel emplacement de stockage
+ETAT_MIGRATION = '.gns3vm-migration.json'
+
+# Recherche du premier répertoire existant d'un chemin
+def repertoire_existant(repertoire):
+  repertoire = os.path.abspath(repertoire)
+  while not os.path.isdir(repertoire):
+    repertoire = os.path.dirname(repertoire)
+  return repertoire
+
+# Entrées non parcourues d'un répertoire : fichiers et liens symboliques vers un répertoire,
+# qu'os.walk liste parmi les sous-répertoires sans les parcourir (liens l/<id> d'overlay2)
+def entrees(repertoire, sous_repertoires, noms):
+  return noms + [nom for nom in sous_repertoires if os.path.islink(os.path.join(repertoire, nom))]
+
+# Inventaire d'une arborescence : nombre de fichiers et taille totale des fichiers réguliers
+def inventaire(racine):
+  import stat
+  fichiers = 0
+  octets = 0
+  for repertoire, sous_repertoires, noms in os.walk(racine):
+    for nom in entrees(repertoire, sous_repertoires, noms):
+      infos = os.lstat(os.path.join(repertoire, nom))
+      if stat.S_ISSOCK(infos.st_mode):
+        continue
+      fichiers += 1
+      if stat.S_ISREG(infos.st_mode):
+        octets += infos.st_size
+  return fichiers, octets
+
+# Copie des attributs d'un fichier : propriétaire, droits, attributs étendus et dates
+def copie_attributs(source, destination, infos):
+  import stat
+  os.chown(destination, infos.st_uid, infos.st_gid, follow_symlinks = False)
+  if not stat.S_ISLNK(infos.st_mode):
+    os.chmod(destination, stat.S_IMODE(infos.st_mode))
+  # Les attributs étendus portent notamment les informations de superposition d'overlay2
+  try:
+    for attribut in os.listxattr(source, follow_symlinks = False):
+      os.setxattr(destination, attribut, os.getxattr(source, attribut, follow_symlinks = False), follow_symlinks = False)
+  except OSError:
+    pass
+  os.utime(destination, ns = (infos.st_atime_ns, infos.st_mtime_ns), follow_symlinks = False)
+
+# Copie d'un fichier régulier par reflink, lien physique ou copie par morceaux reprenable
+# Retourne la méthode utilisée
+def copie_fichier(source, destination, infos, lien_physique):
+  import fcntl
+  # Fichier déjà copié lors d'une exécution précédente
+  if os.path.lexists(destination):
+    existant = os.lstat(destination)
+    if existant.st_size == infos.st_size and existant.st_mtime_ns == infos.st_mtime_ns:
+      return 'existant'
+  else:
+    # Clonage par référence, sans copie des données
+    try:
+      with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+      copie_attributs(source, destination, infos)
+      return 'reflink'
+    except OSError:
+      if os.path.lexists(destination):
+        os.unlink(destination)
+    # Lien physique sur le même système de fichiers
+    if lien_physique:
+      try:
+        os.link(source, destination)
+        return 'lien'
+      except OSError:
+        pass
+
+  # Copie par morceaux reprise à partir du dernier morceau complet
+  fd_source = os.open(source, os.O_RDONLY)
+  try:
+    fd_destination = os.open(destination, os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+      position = min(os.fstat(fd_destination).st_size, infos.st_size)
+      position -= position % BLOC_COPIE
+      os.ftruncate(fd_destination, position)
+      while position < infos.st_size:
+        envoyes = os.sendfile(fd_destination, fd_source, position, min(BLOC_COPIE, infos.st_size - position))
+        if envoyes == 0:
+          break
+        position += envoyes
+      os.fsync(fd_destination)
+    finally:
+      os.close(fd_destination)
+  finally:
+    os.close(fd_source)
+  copie_attributs(source, destination, infos)
+  return 'copie'
+
+# Enregistrement de l'état d'avancement de la migration
+def ecriture_etat(destination, etat):
+  try:
+    with open(os.path.join(destination, ETAT_MIGRATION), 'w') as f:
+      json.dump(etat, f)
+  except IOError:
+    pass
+
+# Copie d'une arborescence en conservant les liens physiques internes, les liens symboliques,
+# les fichiers spéciaux (whiteouts d'overlay2) et les attributs
+def copie_arborescence(source, destination, etat, lien_physique):
+  import stat
+  import time
+  inodes = dict()
+  derniere_ecriture = time.monotonic()
+  for repertoire, sous_repertoires, noms in os.walk(source):
+    cible = os.path.join(destination, os.path.relpath(repertoire, source))
+    if not os.path.isdir(cible):
+      os.mkdir(cible)
+    for nom in entrees(repertoire, sous_repertoires, noms):
+      chemin_source = os.path.join(repertoire, nom)
+      chemin_cible = os.path.join(cible, nom)
+      infos = os.lstat(chemin_source)
+      if stat.S_ISREG(infos.st_mode):
+        # Liens physiques internes à l'arborescence
+        if infos.st_nlink > 1 and (infos.st_dev, infos.st_ino) in inodes:
+          if not os.path.lexists(chemin_cible):
+            os.link(inodes[(infos.st_dev, infos.st_ino)], chemin_cible)
+          methode = 'lien'
+        else:
+          methode = copie_fichier(chemin_source, chemin_cible, infos, lien_physique)
+          inodes[(infos.st_dev, infos.st_ino)] = chemin_cible
+        etat['methodes'][methode] = etat['methodes'].get(methode, 0) + 1
+        etat['octets_copies'] += infos.st_size
+      elif not os.path.lexists(chemin_cible):
+        if stat.S_ISLNK(infos.st_mode):
+          os.symlink(os.readlink(chemin_source), chemin_cible)
+        elif stat.S_ISCHR(infos.st_mode) or stat.S_ISBLK(infos.st_mode) or stat.S_ISFIFO(infos.st_mode):
+          os.mknod(chemin_cible, infos.st_mode, infos.st_rdev)
+        else:
+          continue
+        copie_attributs(chemin_source, chemin_cible, infos)
+      etat['fichiers_copies'] += 1
+      # Avancement enregistré toutes les 5 secondes
+      if time.monotonic() - derniere_ecriture > 5:
+        ecriture_etat(destination, etat)
+        derniere_ecriture = time.monotonic()
+  # Attributs des répertoires appliqués en dernier pour conserver leurs dates
+  for repertoire, sous_repertoires, noms in os.walk(source):
+    copie_attributs(repertoire, os.path.join(destination, os.path.relpath(repertoire, source)), os.lstat(repertoire))
+
+# Définition de la fonction de planification de la migration des données docker
+def plan_migration(ancien, nouveau, mode):
+  existant = repertoire_existant(nouveau)
+  infos = os.statvfs(existant)
+  fichiers, octets = inventaire(ancien)
+  plan = {
+    'source': ancien,
+    'destination': nouveau,
+    'mode': mode,
+    'fichiers': fichiers,
+    'octets': octets,
+    'espace_libre': infos.f_bavail * infos.f_frsize,
+    'meme_systeme_fichiers': os.stat(ancien).st_dev == os.stat(existant).st_dev,
+    'reprise': os.path.exists(os.path.join(nouveau, ETAT_MIGRATION))
+  }
+  return plan
+
+# Définition de la fonction de migration des données docker
+def migration(module, plan):
+  import time
+  import shutil
+  debut = time.monotonic()
+  ancien = plan['source']
+  nouveau = plan['destination']
+  systemctl = module.get_bin_path('systemctl', required = True)
+
+  # Arrêt du démon docker et de son socket d'activation
+  rc, out, err = module.run_command([systemctl, 'stop', 'docker.socket', 'docker.service'])
+  if rc != 0:
+    raise ErreurConfig("Arrêt du service docker impossible : " + err.strip())
+
+  # En cas d'échec, le démon docker est redémarré avec l'ancienne configuration, encore inchangée,
+  # et la migration reprendra à la prochaine exécution
+  try:
+    etat = { 'source': ancien, 'destination': nouveau, 'octets': plan['octets'], 'octets_copies': 0, 'fichiers_copies': 0, 'methodes': dict() }
+    # Déplacement direct sur le même système de fichiers
+    if plan['mode'] == 'move' and plan['meme_systeme_fichiers'] and not plan['reprise']:
+      if os.path.isdir(nouveau):
+        os.rmdir(nouveau)
+      elif not os.path.isdir(os.path.dirname(nouveau)):
+        os.makedirs(os.path.dirname(nouveau))
+      os.rename(ancien, nouveau)
+      etat['methodes']['deplacement'] = 1
+      etat['octets_copies'] = plan['octets']
+      etat['fichiers_copies'] = plan['fichiers']
+    else:
+      if not os.path.isdir(nouveau):
+        os.makedirs(nouveau, 0o711)
+      ecriture_etat(nouveau, etat)
+      # Les liens physiques vers la source ne sont utilisés qu'en mode move : en mode copy la source est conservée
+      # et une écriture par l'un des emplacements modifierait l'autre
+      copie_arborescence(ancien, nouveau, etat, plan['meme_systeme_fichiers'] and plan['mode'] == 'move')
+      # Vérification du nombre de fichiers copiés avant la suppression de l'état et de la source
+      fichiers, octets = inventaire(nouveau)
+      if fichiers - 1 != plan['fichiers'] or octets < plan['octets']:
+        raise ErreurConfig("Vérification de la copie des données docker en échec : " + str(fichiers - 1) + " fichiers copiés sur " + str(plan['fichiers']))
+      os.unlink(os.path.join(nouveau, ETAT_MIGRATION))
+      if plan['mode'] == 'move':
+        shutil.rmtree(ancien)
+  except (ErreurConfig, IOError, OSError):
+    module.run_command([systemctl, 'start', 'docker.socket', 'docker.service'])
+    raise
+
+  etat['duree'] = round(time.monotonic() - debut, 1)
+  etat['debit_mbs'] = round(etat['octets_copies'] / 1048576.0 / etat['duree'], 1) if etat['duree'] > 0 else None
+  return dict(plan, **etat)
+
+# Vérification de l'emplacement de stockage utilisé par le démon docker après redémarrage
+def verif_migration(module, nouveau):
+  systemctl = module.get_bin_path('systemctl', required = True)
+  rc, out, err = module.run_command([systemctl, 'start', 'docker.service'])
+  if rc != 0:
+    return "Démarrage du service docker impossible : " + err.strip()
+  docker = module.get_bin_path('docker', required = True)
+  rc, out, err = module.run_command([docker, 'info', '--format', '{{.DockerRootDir}}'])
+  if rc != 0 or os.path.realpath(out.strip()) != os.path.realpath(nouveau):
+    return "Le démon docker n'utilise pas l'emplacement " + nouveau + " : " + (out.strip() or err.strip())
+  return None
+
+# Définition de la fonction d'application de la configuration
+# Le dictionnaire result est complété, une erreur ErreurConfig interrompt l'application
+def application(module, parametres, result):
+  fichier = parametres['config-file']
+
+  # Ajout des paramètres dans la variable de retour en mode debug
+  if parametres['debug']:
+    result['parametres'] = dict(parametres)
+
+  # Initialisation des variables de configuration
+  config_daemon = dict()
+  config_actuelle = dict()
+  texte_actuel = ''
+
+  # Test si le fichier de configuration est présent
+  if os.path.exists(fichier):
+    # Si l'option force ou le mode empreinte est activé alors on lit le fichier de configuration
+    if parametres['force'] or parametres['fingerprint']:
+      texte_actuel = lecture_fichier(fichier)
+      try:
+        config_actuelle = lecture_json(texte_actuel)
+      except ErreurConfig as erreur:
+        raise ErreurConfig("Lecture du fichier de configuration " + fichier + " impossible : " + str(erreur))
+    # Sinon on sort car aucun paramètre ne sera enregistré
+    else:
+      return result
+
+  # Ajout des paramètres dans la variable de retour en mode debug
+  if parametres['debug']:
+    result['config_actuelle'] = config_actuelle
+
+  # Mise à jour et validation des valeurs dans la variable configuration
+  try:
+    config_daemon = maj_config(config_actuelle, parametres)
+  except ValueError as erreur:
+    raise ErreurConfig("Valeur invalide : " + str(erreur))
+
+  # Ajout des paramètres dans la variable de retour en mode debug
+  if parametres['debug']:
+    result['config_daemon'] = config_daemon
+
+  # Empreintes de la configuration effective, aucune modification en mode empreinte
+  if parametres['fingerprint']:
+    result['empreintes'] = { fichier: empreintes_config(config_actuelle, os.path.exists(fichier)) }
+    result['empreintes'][fichier]['conforme'] = config_daemon == config_actuelle
+    return result
+
+  # Planification de la migration des données lors d'un changement d'emplacement de stockage
+  plan = None
+  ancien = config_actuelle.get('data-root', '/var/lib/docker')
+  nouveau = config_daemon['data-root']
+  if parametres['migrate'] and os.path.realpath(ancien) != os.path.realpath(nouveau) and os.path.isdir(ancien) and os.listdir(ancien):
+    plan = plan_migration(ancien, nouveau, parametres['migrate_mode'])
+    result['migration'] = plan
+    if os.path.isdir(nouveau) and os.listdir(nouveau) and not plan['reprise']:
+      raise ErreurConfig("Le nouvel emplacement " + nouveau + " n'est pas vide")
+    # Seul un déplacement sur le même système de fichiers ne consomme pas d'espace, une copie duplique les données
+    if not (plan['mode'] == 'move' and plan['meme_systeme_fichiers']) and plan['espace_libre'] < plan['octets'] * 1.05:
+      raise ErreurConfig("Espace libre insuffisant sur " + nouveau + " pour la migration des données docker")
+
+  # Test si la nouvelle configuration est différente
+  if not config_daemon == config_actuelle:
+    result['changed'] = True
+    if module._diff:
+      result['diff'] = [diff_fichier(fichier, texte_actuel, texte_json(config_daemon))]
+    # Sortie si le mode de vérification est activé
+    if module.check_mode:
+      return result
+    # Migration des données, le démon docker est arrêté
+    if plan is not None:
+      try:
+        result['migration'] = migration(module, plan)
+      except (IOError, OSError) as erreur:
+        raise ErreurConfig("Migration des données docker interrompue, elle reprendra à la prochaine exécution : " + str(erreur))
+    # Ecriture du fichier de configuration
+    if not ecriture_fichier(fichier, texte_json(config_daemon)):
+      raise ErreurConfig("Ecriture du fichier de configuration du service docker impossible")
+    # Redémarrage et vérification du démon docker après migration
+    if plan is not None:
+      erreur = verif_migration(module, nouveau)
+      if erreur is not None:
+        raise ErreurConfig(erreur)
+  return result
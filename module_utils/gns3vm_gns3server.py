@@ -0,0 +1,655 @@
+# -*- coding: UTF-8 -*
+# Génération de la configuration de gns3-server, utilisée par les modules gns3server_daemon_config et gns3vm_node_config
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.module_utils.gns3vm_config import ErreurConfig, lecture_fichier, ecriture_fichier, diff_fichier, lecture_ini, ini_normalisee, modification_ini, masquage_ini, masquage_config, MASQUE, empreintes_config
+from ansible.module_utils.gns3vm_systeme import sonde_numa
+
+# Chargement des modules necessaires
+import os
+import socket
+
+# Définition des options
+ARGUMENTS = {
+  'config-file': { 'type': str, 'default': '/etc/gns3/gns3_server.conf', 'required': False },
+  'force': { 'type': bool, 'default': False, 'required': False },
+  'interface': { 'type': str, 'required': True },
+  'port': { 'type': int, 'required': False },
+  'data-root': { 'type': str, 'required': False },
+  'configs_path': { 'type': str, 'required': False },
+  'images_path': { 'type': str, 'required': False },
+  'projects_path': { 'type': str, 'required': False },
+  'appliances_path': { 'type': str, 'required': False },
+  'symbols_path': { 'type': str, 'required': False },
+  'placement': { 'type': str, 'default': 'ignore', 'choices': [ 'ignore', 'warn', 'fail' ], 'required': False },
+  'placement_min_free': { 'type': int, 'default': 10, 'required': False },
+  'auth': { 'type': bool, 'required': False },
+  'user': { 'type': str, 'required': False },
+  'password': { 'type': str, 'required': False, 'no_log': True },
+  'require_kvm': { 'type': bool, 'required': False },
+  'enable_kvm': { 'type': bool, 'required': False },
+  'enable_hardware_acceleration': { 'type': bool, 'required': False },
+  'require_hardware_acceleration': { 'type': bool, 'required': False },
+  'console_start_port_range': { 'type': int, 'required': False },
+  'console_end_port_range': { 'type': int, 'required': False },
+  'vnc_console_start_port_range': { 'type': int, 'required': False },
+  'vnc_console_end_port_range': { 'type': int, 'required': False },
+  'udp_start_port_range': { 'type': int, 'required': False },
+  'udp_end_port_range': { 'type': int, 'required': False },
+  'mmap_support': { 'type': bool, 'required': False },
+  'sparse_memory_support': { 'type': bool, 'required': False },
+  'ghost_ios_support': { 'type': bool, 'required': False },
+  'capacity_profile': { 'type': dict, 'required': False },
+  'instances': { 'type': str, 'default': '1', 'required': False },
+  'fingerprint': { 'type': bool, 'default': False, 'required': False },
+  'debug': { 'type': bool, 'default': False, 'required': False }
+}
+
+# Emplacements des données de gns3-server
+CHEMINS = ('configs', 'images', 'projects', 'appliances', 'symbols')
+
+# Options propres à chaque cible ou instance (adresse, interfaces, port, projets et plages de ports),
+# exclues des empreintes comparées entre cibles
+OPTIONS_CIBLE = {
+  'Server': ('host', 'port', 'allowed_interfaces', 'default_nat_interface', 'projects_path',
+             'console_start_port_range', 'console_end_port_range', 'vnc_console_start_port_range', 'vnc_console_end_port_range',
+             'udp_start_port_range', 'udp_end_port_range')
+}
+
+# Systèmes de fichiers réseau, considérés comme lents pour les projets
+FS_RESEAU = ('nfs', 'nfs4', 'cifs', 'smb3', '9p', 'ceph', 'glusterfs', 'fuse.sshfs', 'fuse.glusterfs')
+
+# Requête ioctl de clonage de fichier par référence (reflink, linux/fs.h)
+FICLONE = 0x40049409
+
+# Recherche du premier répertoire existant d'un chemin
+def repertoire_existant(repertoire):
+  repertoire = os.path.abspath(repertoire)
+  while not os.path.isdir(repertoire):
+    repertoire = os.path.dirname(repertoire)
+  return repertoire
+
+# Montage d'un répertoire : dernier montage dont le point de montage est le plus long préfixe du chemin
+# Les options retenues sont celles du montage et du superbloc (discard pour ext4 et xfs)
+def lecture_montage(repertoire):
+  import re
+  decodage = lambda texte: re.sub(r'\\([0-7]{3})', lambda code: chr(int(code.group(1), 8)), texte)
+  montage = None
+  with open('/proc/self/mountinfo', 'r') as f:
+    for ligne in f:
+      champs = ligne.split()
+      if '-' not in champs:
+        continue
+      separateur = champs.index('-')
+      point = decodage(champs[4])
+      if repertoire != point and not repertoire.startswith(point.rstrip('/') + '/'):
+        continue
+      if montage is None or len(point) >= len(montage['point_montage']):
+        options = champs[5].split(',') + (champs[separateur + 3].split(',') if len(champs) > separateur + 3 else list())
+        montage = {
+          'point_montage': point, 'peripherique': champs[2], 'source': decodage(champs[separateur + 2]),
+          'systeme_fichiers': champs[separateur + 1], 'options': sorted(set(options))
+        }
+  return montage
+
+# Type de support d'un périphérique (True : disque rotatif), None si indéterminé
+# Une partition hérite du support de son disque, un système de fichiers sans périphérique réel (btrfs) est recherché par sa source
+def lecture_rotatif(peripherique, source):
+  candidats = ['/sys/dev/block/' + peripherique]
+  if source.startswith('/dev/'):
+    try:
+      numero = os.stat(source).st_rdev
+      candidats.append('/sys/dev/block/' + str(os.major(numero)) + ':' + str(os.minor(numero)))
+    except OSError:
+      pass
+  for candidat in candidats:
+    for fichier in (os.path.join(candidat, 'queue', 'rotational'), os.path.join(candidat, '..', 'queue', 'rotational')):
+      try:
+        with open(fichier, 'r') as f:
+          return f.read().strip() == '1'
+      except (IOError, OSError):
+        continue
+  return None
+
+# Test du clonage par référence (reflink) dans un répertoire, None si le test est impossible (droits)
+def test_reflink(repertoire):
+  import errno
+  import fcntl
+  import tempfile
+  try:
+    source = tempfile.TemporaryFile(dir = repertoire, prefix = '.gns3vm-reflink-')
+  except OSError:
+    return None
+  with source, tempfile.TemporaryFile(dir = repertoire, prefix = '.gns3vm-reflink-') as clone:
+    source.write(b'\0' * 4096)
+    source.flush()
+    try:
+      fcntl.ioctl(clone.fileno(), FICLONE, source.fileno())
+    except OSError as erreur:
+      return False if erreur.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV) else None
+  return True
+
+# Rapport de placement des emplacements de données d'une configuration
+# Les caractéristiques d'un système de fichiers sont mesurées une seule fois (dictionnaire mesures indexé par périphérique).
+# L'emplacement des projets (disques des noeuds en copie sur écriture) doit être rapide et disposer d'espace libre.
+def rapport_placement(config, seuil, mesures):
+  rapport = dict()
+  for type in CHEMINS:
+    chemin = config.get('Server', dict()).get(type + '_path')
+    if not chemin:
+      continue
+    if chemin in rapport:
+      rapport[chemin]['usages'].append(type)
+      continue
+    existant = repertoire_existant(chemin)
+    peripherique = os.stat(existant).st_dev
+    if peripherique not in mesures:
+      montage = lecture_montage(os.path.realpath(existant)) or { 'point_montage': None, 'peripherique': None, 'source': '', 'systeme_fichiers': None, 'options': list() }
+      reseau = montage['systeme_fichiers'] in FS_RESEAU
+      mesures[peripherique] = dict(montage,
+        noatime = 'noatime' in montage['options'],
+        discard = 'discard' in montage['options'],
+        reseau = reseau,
+        rotatif = None if reseau or montage['peripherique'] is None else lecture_rotatif(montage['peripherique'], montage['source']),
+        reflink = test_reflink(existant)
+      )
+    infos = os.statvfs(existant)
+    entree = dict(mesures[peripherique], usages = [type], repertoire_existant = existant)
+    entree['total_mo'] = infos.f_blocks * infos.f_frsize // 1048576
+    entree['libre_mo'] = infos.f_bavail * infos.f_frsize // 1048576
+    entree['libre_pct'] = round(100.0 * infos.f_bavail / infos.f_blocks, 1) if infos.f_blocks else 0.0
+    rapport[chemin] = entree
+  for chemin, entree in rapport.items():
+    entree['alertes'] = list()
+    if 'projects' in entree['usages']:
+      if entree['rotatif']:
+        entree['alertes'].append("disque rotatif")
+      if entree['reseau']:
+        entree['alertes'].append("système de fichiers réseau " + entree['systeme_fichiers'])
+      if entree['libre_pct'] < seuil:
+        entree['alertes'].append("espace libre " + str(entree['libre_pct']) + " % (minimum " + str(seuil) + " %)")
+  return rapport
+
+# Vérification du placement des emplacements de données, selon l'option placement :
+# avertissement ou échec si l'emplacement des projets est lent ou presque plein
+def verif_placement(module, parametres, config, result, mesures):
+  if parametres['placement'] == 'ignore':
+    return
+  try:
+    rapport = rapport_placement(config, parametres['placement_min_free'], mesures)
+  except (IOError, OSError) as erreur:
+    module.warn("Analyse du placement des données de gns3-server impossible : " + str(erreur))
+    return
+  result.setdefault('placement', dict()).update(rapport)
+  alertes = [chemin + " : " + alerte for chemin, entree in rapport.items() for alerte in entree['alertes']]
+  if alertes and parametres['placement'] == 'fail':
+    raise ErreurConfig("Emplacement des projets inadapté (" + ", ".join(alertes) + ")")
+  for alerte in alertes:
+    module.warn("Emplacement des projets inadapté : " + alerte)
+
+# Vérification de l'existence d'une interface réseau
+def verif_interface_reseau(interface):
+  val_ret = False
+  try:
+    socket.if_nametoindex(interface)
+    val_ret = True
+  except OSError:
+    val_ret = False
+  return val_ret
+
+# Récupération de l'adresse IP d'une interface
+def get_ip_address(ifname):
+  import fcntl
+  import struct
+  with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+    return socket.inet_ntoa(fcntl.ioctl(
+      s.fileno(),
+      0x8915,  # SIOCGIFADDR
+      struct.pack('256s', bytes(ifname[:15], 'utf-8'))
+    )[20:24])
+
+# Constantes netlink (linux/netlink.h, linux/rtnetlink.h, linux/if_addr.h)
+NETLINK_ROUTE = 0
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+RT_SCOPE = { 0: 'global', 200: 'site', 253: 'lien', 254: 'hote' }
+
+# Préfixes des interfaces virtuelles non éligibles comme interface d'écoute
+INTERFACES_EXCLUES = ('lo', 'virbr', 'docker', 'br-', 'veth', 'vnet', 'tap', 'tun', 'gns3')
+
+# Récupération des adresses IPv4 et IPv6 de toutes les interfaces par une requête netlink
+def lecture_adresses():
+  import struct
+  adresses = dict()
+  with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as s:
+    s.bind((0, 0))
+    # En-tête nlmsghdr suivi d'un ifaddrmsg toutes familles confondues
+    s.send(struct.pack('=IHHII', 24, RTM_GETADDR, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + struct.pack('=BBBBI', socket.AF_UNSPEC, 0, 0, 0, 0))
+    termine = False
+    while not termine:
+      donnees = s.recv(65536)
+      position = 0
+      while position + 16 <= len(donnees):
+        longueur, type_message = struct.unpack_from('=IH', donnees, position)
+        if longueur < 16 or type_message in (NLMSG_DONE, NLMSG_ERROR):
+          termine = True
+          break
+        if type_message == RTM_NEWADDR:
+          famille, prefixe, drapeaux, portee, index = struct.unpack_from('=BBBBI', donnees, position + 16)
+          attributs = dict()
+          attribut = position + 24
+          while attribut + 4 <= position + longueur:
+            taille, type_attribut = struct.unpack_from('=HH', donnees, attribut)
+            if taille < 4:
+              break
+            attributs[type_attribut] = donnees[attribut + 4:attribut + taille]
+            attribut += (taille + 3) & ~3
+          valeur = attributs.get(IFA_LOCAL, attributs.get(IFA_ADDRESS))
+          if valeur is not None and famille in (socket.AF_INET, socket.AF_INET6):
+            try:
+              nom = socket.if_indextoname(index)
+            except OSError:
+              nom = str(index)
+            adresses.setdefault(nom, list()).append({
+              'famille': 4 if famille == socket.AF_INET else 6,
+              'adresse': socket.inet_ntop(famille, valeur),
+              'prefixe': prefixe,
+              'portee': RT_SCOPE.get(portee, str(portee))
+            })
+        position += (longueur + 3) & ~3
+  return adresses
+
+# Lecture d'un attribut d'une interface réseau dans sysfs
+def attribut_interface(interface, attribut, defaut = None):
+  try:
+    with open(os.path.join('/sys/class/net', interface, attribut), 'r') as f:
+      return f.read().strip()
+  except (IOError, OSError):
+    return defaut
+
+# Définition de la fonction de classement des interfaces réseau
+# Les interfaces éligibles (active, non esclave d'un bond ou d'un pont, avec une adresse globale)
+# sont classées par vitesse, présence d'une adresse IPv4 puis MTU
+def classement_interfaces():
+  adresses = lecture_adresses()
+  interfaces = dict()
+  for nom in os.listdir('/sys/class/net'):
+    repertoire = os.path.join('/sys/class/net', nom)
+    try:
+      vitesse = int(attribut_interface(nom, 'speed', '-1'))
+    except ValueError:
+      vitesse = -1
+    maitre = os.path.basename(os.readlink(os.path.join(repertoire, 'master'))) if os.path.islink(os.path.join(repertoire, 'master')) else None
+    inferieures = [entree[6:] for entree in os.listdir(repertoire) if entree.startswith('lower_')]
+    if os.path.isdir(os.path.join(repertoire, 'bonding')):
+      genre = 'bond'
+    elif os.path.isdir(os.path.join(repertoire, 'bridge')):
+      genre = 'pont'
+      inferieures = os.listdir(os.path.join(repertoire, 'brif'))
+    elif inferieures:
+      genre = 'vlan'
+    elif attribut_interface(nom, 'type') == '772':
+      genre = 'loopback'
+    else:
+      genre = 'ethernet'
+    interfaces[nom] = {
+      'nom': nom,
+      'type': genre,
+      'vitesse': vitesse if vitesse > 0 else None,
+      'mtu': int(attribut_interface(nom, 'mtu', '0')),
+      'etat': attribut_interface(nom, 'operstate', 'unknown'),
+      'maitre': maitre,
+      'inferieures': sorted(inferieures),
+      'ipv4': [a['adresse'] for a in adresses.get(nom, list()) if a['famille'] == 4 and a['portee'] == 'global'],
+      'ipv6': [a['adresse'] for a in adresses.get(nom, list()) if a['famille'] == 6 and a['portee'] == 'global']
+    }
+
+  # Vitesse d'un pont ou d'un VLAN sans vitesse propre : meilleure vitesse des interfaces inférieures
+  for interface in interfaces.values():
+    if interface['vitesse'] is None and interface['inferieures']:
+      vitesses = [interfaces[nom]['vitesse'] for nom in interface['inferieures'] if nom in interfaces and interfaces[nom]['vitesse']]
+      interface['vitesse'] = max(vitesses) if vitesses else None
+
+  # Eligibilité des interfaces
+  for interface in interfaces.values():
+    if interface['type'] == 'loopback' or interface['nom'].startswith(INTERFACES_EXCLUES):
+      interface['exclusion'] = 'interface virtuelle'
+    elif interface['maitre'] is not None:
+      interface['exclusion'] = 'esclave de ' + interface['maitre']
+    elif interface['etat'] not in ('up', 'unknown') or attribut_interface(interface['nom'], 'carrier') != '1':
+      interface['exclusion'] = 'interface inactive'
+    elif not interface['ipv4'] and not interface['ipv6']:
+      interface['exclusion'] = 'aucune adresse globale'
+    else:
+      interface['exclusion'] = None
+
+  classement = sorted(interfaces.values(), key = lambda i: (i['exclusion'] is None, i['vitesse'] or 0, len(i['ipv4']) > 0, i['mtu']), reverse = True)
+  for rang, interface in enumerate(classement):
+    interface['rang'] = rang + 1 if interface['exclusion'] is None else None
+  return classement
+
+# Lecture de la mémoire totale de la cible en Mo
+def lecture_memoire():
+  import re
+  try:
+    with open('/proc/meminfo', 'r') as f:
+      resultat = re.search(r'MemTotal:\s+([0-9]+)', f.read())
+  except IOError:
+    return 0
+  return int(resultat.group(1)) // 1024 if resultat else 0
+
+# Définition de la fonction de calcul du profil de capacité
+# Les plages de ports sont contiguës et ne se chevauchent pas : consoles, consoles VNC puis UDP.
+# Chaque plage conserve au minimum la taille de la plage par défaut de gns3server.
+def calcul_profil(profil, memoire, cpus):
+  noeuds = int(profil['noeuds'])
+  memoire_noeud = int(profil.get('memoire_noeud') or 512)
+  # Console et console auxiliaire par noeud, une console VNC par noeud
+  # et 16 ports UDP par noeud (8 liens), avec une marge de 25 %
+  consoles = max(5000, noeuds * 2 * 5 // 4)
+  consoles_vnc = noeuds * 5 // 4
+  udp = max(10000, noeuds * 16 * 5 // 4)
+  resultat = {
+    'noeuds': noeuds,
+    'memoire_noeud': memoire_noeud,
+    'memoire_mo': memoire,
+    'cpus': cpus,
+    'noeuds_max_memoire': max(0, memoire - max(1024, memoire // 10)) // memoire_noeud,
+    'noeuds_par_cpu': round(noeuds / float(cpus), 1),
+    'console_start_port_range': 5000,
+    'console_end_port_range': 5000 + consoles - 1
+  }
+  resultat['vnc_console_start_port_range'] = resultat['console_end_port_range'] + 1
+  resultat['vnc_console_end_port_range'] = resultat['vnc_console_start_port_range'] + max(1, consoles_vnc) - 1
+  resultat['udp_start_port_range'] = resultat['vnc_console_end_port_range'] + 1
+  resultat['udp_end_port_range'] = resultat['udp_start_port_range'] + udp - 1
+  # Options mémoire de Dynamips activées uniquement lorsqu'elles sont utiles
+  if noeuds > 1:
+    resultat['ghost_ios_support'] = True
+  if noeuds > resultat['noeuds_max_memoire']:
+    resultat['mmap_support'] = True
+    resultat['sparse_memory_support'] = True
+  return resultat
+
+# Découpage d'une plage de ports en sous-plages contiguës
+def decoupage_plage(debut, fin, nombre):
+  taille = (fin - debut + 1) // nombre
+  return [(debut + i * taille, debut + (i + 1) * taille - 1) for i in range(nombre)]
+
+# Définition de la fonction de calcul de la répartition des instances
+# Chaque instance dispose de son fichier de configuration, de son port d'écoute,
+# de son répertoire de projets, de ses plages de ports et d'un noeud NUMA
+def calcul_instances(parametres, numa):
+  if parametres['instances'] == 'auto':
+    nombre = max(1, len(numa))
+  else:
+    nombre = int(parametres['instances'])
+    if nombre < 1:
+      raise ValueError
+  port = int(parametres['port'] or 3080)
+
+  # Instance unique : configuration et service inchangés
+  if nombre == 1:
+    return [{
+      'id': 0, 'service': 'gns3', 'config-file': parametres['config-file'], 'port': port, 'projects_path': parametres.get('projects_path'),
+      'numa_node': None, 'cpus': None
+    }]
+
+  # Plages de ports globales découpées entre les instances
+  # Les consoles et les consoles VNC (TCP) ne doivent pas se chevaucher
+  console_debut = parametres['console_start_port_range'] or 5000
+  console_fin = parametres['console_end_port_range'] or 9999
+  vnc_debut = parametres['vnc_console_start_port_range'] or console_fin + 1
+  vnc_fin = parametres['vnc_console_end_port_range'] or vnc_debut + (console_fin - console_debut + 1) // 2 - 1
+  udp_debut = parametres['udp_start_port_range'] or 10000
+  udp_fin = parametres['udp_end_port_range'] or 20000
+  consoles = decoupage_plage(console_debut, console_fin, nombre)
+  consoles_vnc = decoupage_plage(vnc_debut, vnc_fin, nombre)
+  udp = decoupage_plage(udp_debut, udp_fin, nombre)
+
+  base, extension = os.path.splitext(parametres['config-file'])
+  projets = parametres.get('projects_path') or (parametres['data-root'] or '/opt/gns3') + '/projects'
+  instances = list()
+  for i in range(nombre):
+    noeud = numa[i % len(numa)] if numa else None
+    instances.append({
+      'id': i,
+      'service': 'gns3-' + str(i),
+      'config-file': base + '-' + str(i) + extension,
+      'port': port + i,
+      'projects_path': projets + '-' + str(i),
+      'console_start_port_range': consoles[i][0], 'console_end_port_range': consoles[i][1],
+      'vnc_console_start_port_range': consoles_vnc[i][0], 'vnc_console_end_port_range': consoles_vnc[i][1],
+      'udp_start_port_range': udp[i][0], 'udp_end_port_range': udp[i][1],
+      'numa_node': noeud['id'] if noeud else None,
+      'cpus': noeud['cpus'] if noeud else None
+    })
+  return instances
+
+# Définition de la fonction de mise à jour de la configuration
+def maj_config(config, parametres):
+  import copy
+  # Création de la variable de configuration finale
+  configuration = copy.deepcopy(config)
+  # Si aucune section Server alors la configuration actuelle est vide
+  # donc on crée une configuration par défaut
+  if 'Server' not in configuration:
+    if parametres['data-root'] != None:
+      data_root = parametres['data-root']
+    else:
+      data_root = '/opt/gns3'
+    configuration = {
+      'Server': {
+        'host': '0.0.0.0', 'port': '3080',
+        'auth': 'False', 'user': 'gns3', 'password': 'gns3',
+        'ssl': 'False',
+        'configs_path': data_root + '/configs', 'images_path': data_root + '/images', 'projects_path': data_root + '/projects', 'appliances_path': data_root + '/appliances', 'symbols_path': data_root + '/symbols',
+        'allowed_interfaces': 'virbr0,br0', 'default_nat_interface': 'virbr0'
+      },
+      'IOU': { 'iourc_path': data_root + '/iourc.txt', 'license_check': 'True' },
+      'Qemu': {
+        'enable_kvm': 'True', 'require_kvm': 'True',
+        'enable_hardware_acceleration': 'True', 'require_hardware_acceleration': 'False'
+      }
+    }
+
+  # Définition du modèle de la configuration globale
+  modele_config = {
+    'Server': (
+      'host', 'port',
+      'auth', 'user', 'password',
+      'ssl', 'certfile', 'certkey',
+      'configs_path', 'images_path', 'projects_path', 'appliances_path', 'symbols_path',
+      'report_errors',
+      'console_start_port_range', 'console_end_port_range', 'vnc_console_start_port_range', 'vnc_console_end_port_range',
+      'udp_start_port_range', 'udp_end_port_range',
+      'ubridge_path',
+      'allowed_interfaces', 'default_nat_interface'
+    ),
+    'Dynamips': (
+      'dynamips_path', 'allocate_aux_console_ports', 'mmap_support', 'sparse_memory_support', 'ghost_ios_support'
+    ),
+    'IOU': (
+      'iourc_path', 'license_check'
+    ),
+    'Qemu': (
+      'enable_kvm', 'require_kvm', 'enable_hardware_acceleration', 'require_hardware_acceleration'
+    ),
+    'VPCS': (
+      'vpcs_path',
+    )
+  }
+  # On adapte les paramètres
+  for option in parametres:
+    if parametres[option] == None:
+      continue
+    if option == 'interface':
+        configuration['Server']['host'] = get_ip_address(parametres['interface'])
+        #configuration.update({'Server': '{'host': get_ip_address(parametres['interface'])
+        continue
+    # Les emplacements définis individuellement sont prioritaires sur data-root
+    if option == 'data-root':
+      for type in CHEMINS:
+        if parametres.get(type + '_path') is None:
+          configuration['Server'][type + '_path'] = parametres[option] + '/' + type
+      continue
+    for section in modele_config:
+      if modele_config[section].count(option) > 0:
+        if section not in configuration:
+          configuration[section] = dict()
+        configuration[section][option] = str(parametres[option])
+        break
+  return configuration
+
+# Définition de la fonction d'application de la configuration
+# Le dictionnaire result est complété, une erreur ErreurConfig interrompt l'application
+def application(module, parametres, result):
+  parametres = dict(parametres)
+
+  # Ajout des paramètres dans la variable de retour en mode debug
+  if parametres['debug']:
+    result['parametres'] = dict(parametres)
+
+  # Calcul du profil de capacité, les options définies explicitement restent prioritaires
+  if parametres['capacity_profile']:
+    try:
+      if int(parametres['capacity_profile']['noeuds']) < 1 or int(parametres['capacity_profile'].get('memoire_noeud') or 512) < 1:
+        raise ValueError
+    except (KeyError, TypeError, ValueError):
+      raise ErreurConfig("L'option capacity_profile doit définir un nombre de noeuds et une mémoire par noeud supérieurs à 0")
+    profil = calcul_profil(parametres['capacity_profile'], lecture_memoire(), os.cpu_count() or 1)
+    if profil['udp_end_port_range'] > 65535:
+      raise ErreurConfig("Le nombre de noeuds du profil de capacité dépasse les ports disponibles")
+    if profil['noeuds'] > profil['noeuds_max_memoire']:
+      module.warn("La mémoire de la cible permet " + str(profil['noeuds_max_memoire']) + " noeuds de " + str(profil['memoire_noeud']) + " Mo pour " + str(profil['noeuds']) + " noeuds prévus")
+    for option in profil:
+      if option in parametres and parametres[option] is None:
+        parametres[option] = profil[option]
+    result['capacity_profile'] = profil
+
+  # Calcul de la répartition des instances
+  try:
+    # Les noeuds sans processeur (mémoire seule) ne peuvent pas porter d'instance
+    instances = calcul_instances(parametres, [noeud for noeud in sonde_numa() if noeud['nb_cpus']])
+  except ValueError:
+    raise ErreurConfig("L'option instances doit être 'auto' ou un nombre supérieur à 0")
+  result['instances'] = instances
+
+  # Sélection automatique de l'interface d'écoute
+  interface_auto = None
+  if parametres['interface'] == 'auto':
+    try:
+      result['interfaces'] = classement_interfaces()
+    except (IOError, OSError) as erreur:
+      raise ErreurConfig("Lecture des interfaces réseau impossible : " + str(erreur))
+    if not result['interfaces'] or result['interfaces'][0]['rang'] is None:
+      raise ErreurConfig("Aucune interface réseau éligible pour l'écoute du démon gns3server")
+    interface_auto = result['interfaces'][0]
+    parametres['interface'] = None
+    parametres['host'] = (interface_auto['ipv4'] + interface_auto['ipv6'])[0]
+  # Vérification de la présence de l'interface réseau spécifiée
+  elif not verif_interface_reseau(parametres['interface']):
+    raise ErreurConfig("Interface [" + parametres['interface'] + "] introuvable")
+
+  # En mode empreinte, les fichiers sont toujours lus et jamais modifiés,
+  # le placement n'est pas vérifié (le test de reflink écrit un fichier temporaire)
+  if parametres['fingerprint']:
+    parametres['force'] = True
+    parametres['placement'] = 'ignore'
+    result['empreintes'] = dict()
+
+  # Configuration de chaque instance
+  if module._diff:
+    result['diff'] = list()
+  mesures = dict()
+  for instance in instances:
+    # Paramètres propres à l'instance
+    parametres_instance = dict(parametres)
+    for option in instance:
+      if option in parametres_instance:
+        parametres_instance[option] = instance[option]
+    fichier = instance['config-file']
+
+    # Initialisation des variables de configuration
+    config_actuelle = dict()
+    config_daemon = dict()
+
+    texte_actuel = ''
+
+    # Test si le fichier de configuration est présent
+    if os.path.exists(fichier):
+      # Si l'option force est activé alors on lit le fichier de configuration
+      if parametres['force']:
+        texte_actuel = lecture_fichier(fichier)
+        try:
+          config_actuelle = lecture_ini(texte_actuel)
+        except ErreurConfig as erreur:
+          raise ErreurConfig("Lecture du fichier de configuration " + fichier + " impossible : " + str(erreur))
+      # Sinon on passe à l'instance suivante car aucun paramètre ne sera enregistré,
+      # seul le placement des emplacements de la configuration existante est vérifié
+      else:
+        if parametres['placement'] != 'ignore':
+          try:
+            config_actuelle = lecture_ini(lecture_fichier(fichier))
+          except ErreurConfig as erreur:
+            raise ErreurConfig("Lecture du fichier de configuration " + fichier + " impossible : " + str(erreur))
+          verif_placement(module, parametres, config_actuelle, result, mesures)
+        continue
+
+    # Ajout de l'interface sélectionnée aux interfaces autorisées, elle devient l'interface NAT par défaut
+    if interface_auto is not None:
+      parametres_instance['default_nat_interface'] = interface_auto['nom']
+      autorisees = config_actuelle.get('Server', dict()).get('allowed_interfaces', 'virbr0,br0').split(',')
+      if interface_auto['nom'] not in autorisees:
+        autorisees.append(interface_auto['nom'])
+      parametres_instance['allowed_interfaces'] = ','.join(autorisee for autorisee in autorisees if autorisee)
+
+    # Mise à jour des valeurs dans la variable configuration
+    config_daemon = maj_config(config_actuelle, parametres_instance)
+    if instance['projects_path'] is not None:
+      config_daemon['Server']['projects_path'] = instance['projects_path']
+
+    # Placement des emplacements de données, vérifié avant toute écriture
+    verif_placement(module, parametres, config_daemon, result, mesures)
+
+    # Ajout des paramètres dans la variable de retour en mode debug
+    # Les configurations sont indexées par fichier si il y a plusieurs instances
+    if parametres['debug']:
+      if len(instances) > 1:
+        result.setdefault('config_actuelle', dict())[fichier] = masquage_config(config_actuelle)
+        result.setdefault('config_daemon', dict())[fichier] = masquage_config(config_daemon)
+      else:
+        result['config_actuelle'] = masquage_config(config_actuelle)
+        result['config_daemon'] = masquage_config(config_daemon)
+
+    # Empreintes de la configuration effective, conforme si elle ne serait pas modifiée
+    if parametres['fingerprint']:
+      result['empreintes'][fichier] = empreintes_config(ini_normalisee(config_actuelle), os.path.exists(fichier), OPTIONS_CIBLE)
+      result['empreintes'][fichier]['conforme'] = ini_normalisee(config_daemon) == ini_normalisee(config_actuelle)
+      continue
+
+    # Test si la nouvelle configuration normalisée est différente
+    if ini_normalisee(config_daemon) == ini_normalisee(config_actuelle):
+      continue
+    texte_daemon = modification_ini(texte_actuel, config_daemon)
+    if module._diff:
+      result['diff'].append(diff_fichier(fichier, masquage_ini(texte_actuel), masquage_ini(texte_daemon)))
+    # La modification de configuration est effectuée, sauf en mode de vérification
+    result['changed'] = True
+    if not module.check_mode:
+      # Ecriture du fichier de configuration
+      if not ecriture_fichier(fichier, texte_daemon):
+        raise ErreurConfig("Ecriture du fichier de configuration " + fichier + " impossible")
+  return result
@@ -0,0 +1,126 @@
+# -*- coding: UTF-8 -*
+# Application des paramètres noyau (sysctl), utilisée par le module gns3vm_node_config
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.module_utils.gns3vm_config import ErreurConfig, lecture_fichier, ecriture_fichier, diff_fichier, lecture_sysctl, normalisation_sysctl, texte_sysctl
+
+# Chargement des modules necessaires
+import os
+import re
+
+# Définition des options
+ARGUMENTS = {
+  'sysctl': { 'type': dict, 'required': True },
+  'config-file': { 'type': str, 'default': '/etc/sysctl.d/90-gns3vm.conf', 'required': False },
+  'apply': { 'type': bool, 'default': True, 'required': False },
+  'debug': { 'type': bool, 'default': False, 'required': False }
+}
+
+# Expression de validation des noms de paramètres
+RE_CLE = re.compile(r'^[a-z0-9_]+(\.[a-zA-Z0-9_\-]+)+$')
+
+# Chemin d'un paramètre dans /proc/sys
+def chemin_sysctl(cle):
+  return os.path.join('/proc/sys', cle.replace('.', '/'))
+
+# Lecture de la valeur active d'un paramètre
+def lecture_valeur_active(cle):
+  try:
+    with open(chemin_sysctl(cle), 'r') as f:
+      return normalisation_sysctl(f.read())
+  except (IOError, OSError):
+    return None
+
+# Ecriture de la valeur active d'un paramètre
+def ecriture_valeur_active(cle, valeur):
+  try:
+    with open(chemin_sysctl(cle), 'w') as f:
+      f.write(valeur)
+    return True
+  except (IOError, OSError):
+    return False
+
+# Chargement des modules noyau au démarrage (modules-load.d), avant l'application des fichiers sysctl.d
+# par systemd-sysctl, et chargement immédiat des modules absents
+def modules_noyau(module, fichier, modules, charger, result):
+  texte_actuel = lecture_fichier(fichier)
+  texte = '\n'.join(["# Fichier géré par Ansible (gns3vm)"] + list(modules)) + '\n'
+  if texte != texte_actuel:
+    result['changed'] = True
+    if module._diff:
+      result.setdefault('diff', list()).append(diff_fichier(fichier, texte_actuel, texte))
+    if not module.check_mode:
+      if not os.path.isdir(os.path.dirname(fichier)):
+        os.makedirs(os.path.dirname(fichier), 0o755)
+      if not ecriture_fichier(fichier, texte):
+        raise ErreurConfig("Ecriture du fichier de configuration " + fichier + " impossible")
+  if not charger:
+    return
+  for nom in modules:
+    if os.path.isdir(os.path.join('/sys/module', nom)):
+      continue
+    result['changed'] = True
+    if module.check_mode:
+      continue
+    rc, sortie, erreur = module.run_command(['modprobe', nom])
+    if rc != 0:
+      module.warn("Chargement du module noyau " + nom + " impossible : " + erreur.strip())
+
+# Définition de la fonction d'application de la configuration
+# Le fichier de configuration est dédié : il contient exactement les paramètres demandés
+# L'absence d'un paramètre facultatif (module noyau non chargé) n'est pas signalée
+def application(module, parametres, result, facultatifs = ()):
+  fichier = parametres['config-file']
+  souhaitee = dict()
+  for cle, valeur in parametres['sysctl'].items():
+    cle = str(cle).strip().replace('/', '.')
+    if not RE_CLE.match(cle):
+      raise ErreurConfig("Paramètre noyau invalide : " + cle)
+    if isinstance(valeur, bool):
+      valeur = int(valeur)
+    souhaitee[cle] = normalisation_sysctl(valeur)
+
+  # Ajout des paramètres dans la variable de retour en mode debug
+  if parametres['debug']:
+    result['parametres'] = dict(parametres)
+
+  # Comparaison du fichier de configuration persistante
+  texte_actuel = lecture_fichier(fichier)
+  actuelle = dict((cle, normalisation_sysctl(valeur)) for cle, valeur in lecture_sysctl(texte_actuel).items())
+  if actuelle != souhaitee:
+    texte = texte_sysctl(souhaitee, "Fichier géré par Ansible (gns3vm)")
+    result['changed'] = True
+    if module._diff:
+      result.setdefault('diff', list()).append(diff_fichier(fichier, texte_actuel, texte))
+    if not module.check_mode:
+      if not os.path.isdir(os.path.dirname(fichier)):
+        os.makedirs(os.path.dirname(fichier), 0o755)
+      if not ecriture_fichier(fichier, texte):
+        raise ErreurConfig("Ecriture du fichier de configuration " + fichier + " impossible")
+
+  # Application immédiate des valeurs modifiées
+  result['valeurs'] = dict()
+  if parametres['apply']:
+    for cle, valeur in sorted(souhaitee.items()):
+      avant = lecture_valeur_active(cle)
+      result['valeurs'][cle] = { 'avant': avant, 'apres': avant }
+      if avant is None:
+        if cle not in facultatifs:
+          module.warn("Paramètre noyau " + cle + " indisponible sur la cible")
+        continue
+      if avant == valeur:
+        continue
+      result['changed'] = True
+      if module.check_mode:
+        result['valeurs'][cle]['apres'] = valeur
+      elif ecriture_valeur_active(cle, valeur):
+        result['valeurs'][cle]['apres'] = lecture_valeur_active(cle)
+      else:
+        module.warn("Modification du paramètre noyau " + cle + " impossible (conteneur ou espace de noms)")
+  return result
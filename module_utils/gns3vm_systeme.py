@@ -0,0 +1,56 @@
+# -*- coding: UTF-8 -*
+# Lecture de la topologie de la cible (sysfs, procfs), utilisée par les modules verif_sys et gns3server_daemon_config
+
+# Copyright: (c) 2021, Pascal MIRALLES <miralles.p@orange.fr>
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+# Chargement des modules necessaires
+import os
+import re
+
+# Construction d'un chemin relatif à la racine du système analysé
+def chemin(racine, fichier):
+  return os.path.join(racine, fichier.lstrip('/'))
+
+# Lecture du contenu d'un fichier court (sysfs, procfs)
+def lecture_valeur(fichier, defaut = None):
+  try:
+    with open(fichier, 'r') as f:
+      return f.read().strip()
+  except (IOError, OSError):
+    return defaut
+
+# Conversion d'une liste de CPU au format noyau (ex: 0-3,8-11) en nombre de CPU
+def compte_cpulist(cpulist):
+  nombre = 0
+  for plage in cpulist.split(','):
+    if not plage:
+      continue
+    debut, sep, fin = plage.partition('-')
+    nombre += (int(fin) - int(debut) + 1) if sep else 1
+  return nombre
+
+# Lecture des noeuds NUMA triés par identifiant
+# Un noeud sans processeur (mémoire seule) a une liste de CPU vide
+def sonde_numa(racine = '/'):
+  noeuds = list()
+  repertoire = chemin(racine, '/sys/devices/system/node')
+  try:
+    entrees = os.listdir(repertoire)
+  except OSError:
+    return noeuds
+  for entree in entrees:
+    if not re.match(r'^node[0-9]+$', entree):
+      continue
+    cpus = lecture_valeur(os.path.join(repertoire, entree, 'cpulist'), '')
+    memoire = 0
+    meminfo = lecture_valeur(os.path.join(repertoire, entree, 'meminfo'), '')
+    resultat = re.search(r'MemTotal:\s+([0-9]+)', meminfo)
+    if resultat:
+      memoire = int(resultat.group(1))
+    noeuds.append({ 'id': int(entree[4:]), 'cpus': cpus, 'nb_cpus': compte_cpulist(cpus), 'memoire_ko': memoire })
+  return sorted(noeuds, key = lambda noeud: noeud['id'])